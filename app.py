@@ -15,6 +15,7 @@ import tkinter as tk
 from tkinter import messagebox
 from database_config import DatabaseManager
 from login_window import LoginWindow
+from ui_watchdog import install_if_enabled
 
 def check_dependencies():
     """检查必要的依赖包"""
@@ -156,8 +157,11 @@ def main():
     try:
         # 启动GUI应用程序
         root = tk.Tk()
+        watchdog = install_if_enabled(root)
         app = LoginWindow(root)
         root.mainloop()
+        if watchdog:
+            watchdog.stop()
         
     except Exception as e:
         print(f"应用程序启动失败: {e}")
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+已删除卷宗归档
+
+CaseManager.delete_case 只做软删除，已删除的卷宗和目录项会一直留在 cases、
+case_directories 中，查询和索引都要跳过它们。CaseArchiver 把删除超过
+retention_days 天的卷宗连同其目录项、以及创建超过 session_retention_days 天的
+用户会话，分批移到结构相同的归档表中，使在用表只保留有效数据。
+
+每批在一个短事务中完成（FOR UPDATE SKIP LOCKED 跳过正被其他事务使用的行），
+批次之间暂停，批次耗时超过 max_batch_seconds 时自动减小批量，避免长时间持有锁。
+卷宗归档时释放其目录项对存储内容的引用；归档的卷宗可通过 CaseManager.restore_case
+恢复，前提是所引用的文件尚未被 ContentStore.gc 回收。传入 content_store 时每轮归档之后
+顺带执行一次 gc，回收已无引用的存储对象。
+
+示例：
+    python archiver.py --days 30
+    python archiver.py --restore 42
+    python archiver.py --days 30 --store-root content_store
+"""
+
+import argparse
+import datetime
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from content_store import ContentStore
+from database_config import DatabaseManager, CaseManager, ContentManager
+
+ARCHIVE_TABLES = CaseManager.ARCHIVE_TABLES
+
+
+class CaseArchiver:
+    """软删除卷宗和过期会话的归档任务"""
+
+    def __init__(self, db_manager: DatabaseManager = None, retention_days: int = 30,
+                 session_retention_days: Optional[int] = 90, batch_size: int = 200,
+                 pause: float = 0.5, max_batch_seconds: float = 1.0, lock_wait_timeout: int = 5,
+                 content_store: ContentStore = None):
+        self.db_manager = db_manager or DatabaseManager()
+        self.content_store = content_store
+        self.retention_days = retention_days
+        self.session_retention_days = session_retention_days  # None 表示不归档会话
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_batch_seconds = max_batch_seconds
+        self.lock_wait_timeout = lock_wait_timeout
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _move_batch(self, select_query: str, cutoff: datetime.datetime, limit: int,
+                    moves, before_move: Callable[[Any, List[int]], None] = None) -> Optional[int]:
+        """在一个事务中选出一批行并移入归档表，返回移动的行数，出错时返回 None
+
+        moves 为 [(原表, 关联列)]，按顺序对选出的ID执行 INSERT ... SELECT 和 DELETE；
+        before_move(cursor, ids) 在移动前于同一事务中执行。
+        """
+        def work(cursor):
+            cursor.execute("SET SESSION innodb_lock_wait_timeout = %s", (self.lock_wait_timeout,))
+            cursor.execute(select_query, (cutoff, limit))
+            ids = [row['id'] for row in cursor.fetchall()]
+            if not ids:
+                return 0
+            if before_move:
+                before_move(cursor, ids)
+            placeholders = ', '.join(['%s'] * len(ids))
+            for table, column in moves:
+                cursor.execute(f"INSERT INTO {ARCHIVE_TABLES[table]} SELECT * FROM {table} "
+                               f"WHERE {column} IN ({placeholders})", ids)
+                cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", ids)
+            return len(ids)
+
+        return self.db_manager.run_in_transaction(work)
+
+    def archive_cases_batch(self, limit: int) -> Optional[int]:
+        """归档一批删除超过保留期的卷宗及其目录项"""
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=self.retention_days)
+        query = """
+        SELECT id FROM cases WHERE is_deleted = 1 AND updated_at < %s
+        ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+        """
+        return self._move_batch(query, cutoff, limit, [('case_directories', 'case_id'), ('cases', 'id')],
+                                before_move=self._release_content)
+
+    def _release_content(self, cursor, case_ids: List[int]):
+        """释放待归档卷宗的目录项对存储内容的引用，此后这些文件可被 ContentStore.gc 回收"""
+        cursor.execute(f"""
+        SELECT content_hash, COUNT(*) AS refs FROM case_directories
+        WHERE case_id IN ({', '.join(['%s'] * len(case_ids))}) AND content_hash IS NOT NULL
+        GROUP BY content_hash
+        """, case_ids)
+        now = datetime.datetime.now()
+        refs = [(row['refs'], now, row['content_hash']) for row in cursor.fetchall()]
+        if refs:
+            cursor.executemany("""
+            UPDATE content_objects SET ref_count = GREATEST(ref_count - %s, 0), released_at = %s
+            WHERE content_hash = %s
+            """, refs)
+
+    def archive_sessions_batch(self, limit: int) -> Optional[int]:
+        """归档一批超过保留期的用户会话"""
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=self.session_retention_days)
+        query = """
+        SELECT id FROM user_sessions WHERE created_at < %s
+        ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+        """
+        return self._move_batch(query, cutoff, limit, [('user_sessions', 'id')])
+
+    def _drain(self, archive_batch: Callable[[int], Optional[int]]) -> int:
+        """分批执行直到没有可归档的行"""
+        moved = 0
+        batch_size = self.batch_size
+        while not self._stop.is_set():
+            started = time.monotonic()
+            count = archive_batch(batch_size)
+            elapsed = time.monotonic() - started
+            if count is None:
+                break  # 错误已打印，下一轮再试
+            moved += count
+            if count < batch_size:
+                break
+
+            # 批次太慢说明锁竞争或数据量大，减小批量；否则逐步恢复
+            if elapsed > self.max_batch_seconds:
+                batch_size = max(1, batch_size // 2)
+            elif batch_size < self.batch_size:
+                batch_size = min(self.batch_size, batch_size * 2)
+            self._stop.wait(self.pause + elapsed)
+        return moved
+
+    def run_once(self) -> Dict[str, int]:
+        """执行一轮归档（配置了内容存储时随后回收无引用的对象），返回各类归档和回收的数量"""
+        result = {'cases': self._drain(self.archive_cases_batch), 'sessions': 0, 'objects': 0}
+        if self.session_retention_days is not None:
+            result['sessions'] = self._drain(self.archive_sessions_batch)
+        if result['cases'] or result['sessions']:
+            print(f"已归档卷宗 {result['cases']} 个，会话 {result['sessions']} 个")
+        if self.content_store and not self._stop.is_set():
+            result['objects'] = self.content_store.gc()['removed_objects']
+            if result['objects']:
+                print(f"已回收存储对象 {result['objects']} 个")
+        return result
+
+    def start(self, interval: float = 3600.0):
+        """在后台线程中每隔 interval 秒执行一轮"""
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    # 连接池耗尽、数据库不可用等错误不能让后台线程退出，下一轮再试
+                    print(f"归档错误: {e}")
+                self._stop.wait(interval)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name='case-archiver', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台归档（当前批次完成后退出）"""
+        self._stop.set()
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="归档已删除的卷宗")
+    parser.add_argument('--days', type=int, default=30, help="删除超过多少天的卷宗被归档")
+    parser.add_argument('--session-days', type=int, default=90, help="创建超过多少天的会话被归档，0 表示不归档")
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--pause', type=float, default=0.5, help="批次之间的暂停秒数")
+    parser.add_argument('--restore', type=int, default=None, metavar='CASE_ID', help="恢复指定卷宗")
+    parser.add_argument('--store-root', default=None, help="内容存储目录，归档后回收其中无引用的对象")
+    args = parser.parse_args()
+
+    if args.restore is not None:
+        restored = CaseManager().restore_case(args.restore)
+        print(f"卷宗 {args.restore} 已恢复" if restored else f"卷宗 {args.restore} 恢复失败")
+        return
+
+    db_manager = DatabaseManager()
+    content_store = ContentStore(args.store_root, ContentManager(db_manager)) if args.store_root else None
+    archiver = CaseArchiver(db_manager, retention_days=args.days,
+                            session_retention_days=args.session_days or None,
+                            batch_size=args.batch_size, pause=args.pause, content_store=content_store)
+    archiver.run_once()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+卷宗对话记录
+
+每个卷宗的对话保存为只追加的分段日志，目录结构：
+    chat_history/<卷宗ID>/000000000001-0000.log   消息记录，每行一条 JSON
+    chat_history/<卷宗ID>/000000000001-0000.idx   定长索引：(消息ID, 时间戳, 偏移, 长度)
+    chat_history/<卷宗ID>/deleted.ids             已删除的消息ID
+
+- 追加消息只写当前分段的末尾，耗时与历史长短无关
+- 读取时按索引定位，只读取需要的一页消息；按消息ID或时间查找用二分查找
+- 已封存的分段由后台压缩：去掉已删除的消息并合并过小的分段
+- 分段文件名为 <首条消息ID>-<代数>，压缩生成的新分段代数加一；打开时丢弃被覆盖的旧分段和写了一半的记录
+
+ChatPanel 是卷宗阅读页中的对话面板，打开时只加载最后一页，向上滚动到顶部时再加载更早的消息。
+"""
+
+import bisect
+import json
+import os
+import struct
+import threading
+import time
+import tkinter as tk
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+INDEX_ENTRY = struct.Struct('<QdQI')  # 消息ID、时间戳、记录在日志中的偏移、记录长度
+DELETED_ENTRY = struct.Struct('<Q')
+SEGMENT_BYTES = 1024 * 1024
+
+
+class _Segment:
+    """一个日志分段的元数据"""
+
+    def __init__(self, directory: str, first_id: int, generation: int):
+        self.first_id = first_id
+        self.generation = generation
+        base = os.path.join(directory, f"{first_id:012d}-{generation:04d}")
+        self.log_path = base + '.log'
+        self.index_path = base + '.idx'
+        self.count = 0
+        self.log_size = 0
+        self.last_id = first_id - 1
+        self.first_time = None
+        self.last_time = None
+
+    def read_entries(self, start: int, stop: int) -> List[Tuple[int, float, int, int]]:
+        """读取索引中 [start, stop) 范围的条目"""
+        if start >= stop:
+            return []
+        with open(self.index_path, 'rb') as f:
+            f.seek(start * INDEX_ENTRY.size)
+            return list(INDEX_ENTRY.iter_unpack(f.read((stop - start) * INDEX_ENTRY.size)))
+
+    def read_records(self, entries) -> List[Dict[str, Any]]:
+        """一次读取连续的一段日志，解析出条目对应的消息"""
+        if not entries:
+            return []
+        begin = entries[0][2]
+        end = entries[-1][2] + entries[-1][3]
+        with open(self.log_path, 'rb') as f:
+            f.seek(begin)
+            data = f.read(end - begin)
+        return [json.loads(data[offset - begin:offset - begin + length])
+                for _, _, offset, length in entries]
+
+    def lower_bound(self, key: float, field: int = 0) -> int:
+        """第一个 field 列不小于 key 的条目位置（0 为消息ID，1 为时间戳）"""
+        low, high = 0, self.count
+        with open(self.index_path, 'rb') as f:
+            while low < high:
+                middle = (low + high) // 2
+                f.seek(middle * INDEX_ENTRY.size)
+                if INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))[field] < key:
+                    low = middle + 1
+                else:
+                    high = middle
+        return low
+
+    def remove_files(self):
+        for path in (self.log_path, self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class CaseChatLog:
+    """单个卷宗的分段对话日志"""
+
+    def __init__(self, directory: str, segment_bytes: int = SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.deleted_path = os.path.join(directory, 'deleted.ids')
+        self.lock = threading.RLock()
+        self.compact_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.segments: List[_Segment] = []
+        self.deleted = set()
+        self.last_time = 0.0
+        self._open()
+
+    def _open(self):
+        """加载分段元数据，清理中断的压缩和写了一半的记录"""
+        names = os.listdir(self.directory)
+        for name in names:
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(self.directory, name))
+
+        found = []
+        for name in names:
+            stem, ext = os.path.splitext(name)
+            if ext != '.idx' or '-' not in stem:
+                continue
+            first_id, generation = stem.split('-', 1)
+            segment = _Segment(self.directory, int(first_id), int(generation))
+            if not os.path.exists(segment.log_path):
+                os.remove(segment.index_path)
+                continue
+            self._load_segment(segment)
+            found.append(segment)
+        indexed = {os.path.basename(s.log_path) for s in found}
+        for name in names:
+            if name.endswith('.log') and name not in indexed:
+                os.remove(os.path.join(self.directory, name))  # 压缩中断时只改名了日志
+
+        # 同一范围有新旧两代分段时保留新的（压缩完成但旧分段未删除）
+        found.sort(key=lambda s: (s.first_id, -s.generation))
+        for segment in found:
+            if self.segments and segment.first_id <= self.segments[-1].last_id:
+                segment.remove_files()
+            elif self.segments and not self.segments[-1].count:
+                self.segments[-1].remove_files()
+                self.segments[-1] = segment
+            else:
+                self.segments.append(segment)
+        self.last_time = max([s.last_time for s in self.segments if s.last_time is not None], default=0.0)
+
+        if os.path.exists(self.deleted_path):
+            with open(self.deleted_path, 'rb') as f:
+                data = f.read()
+            data = data[:len(data) - len(data) % DELETED_ENTRY.size]
+            self.deleted = {value for (value,) in DELETED_ENTRY.iter_unpack(data)}
+
+    def _load_segment(self, segment: _Segment):
+        """读取分段的条目数、最后一条消息ID，并截掉未写完的尾部"""
+        index_size = os.path.getsize(segment.index_path)
+        log_size = os.path.getsize(segment.log_path)
+        count = index_size // INDEX_ENTRY.size
+        entry = None
+        while count:
+            entry = segment.read_entries(count - 1, count)[0]
+            if entry[2] + entry[3] <= log_size:
+                break
+            count -= 1
+            entry = None
+        segment.count = count
+        segment.log_size = entry[2] + entry[3] if entry else 0
+        segment.last_id = entry[0] if entry else segment.first_id - 1
+        if count:
+            segment.first_time = segment.read_entries(0, 1)[0][1]
+            segment.last_time = entry[1]
+        if index_size != count * INDEX_ENTRY.size:
+            os.truncate(segment.index_path, count * INDEX_ENTRY.size)
+        if log_size != segment.log_size:
+            os.truncate(segment.log_path, segment.log_size)
+
+    @property
+    def next_id(self) -> int:
+        return self.segments[-1].last_id + 1 if self.segments else 1
+
+    def append(self, role: str, content: str, timestamp: float = None) -> Dict[str, Any]:
+        """追加一条消息，返回消息字典"""
+        with self.lock:
+            message_id = self.next_id
+            timestamp = max(timestamp or time.time(), self.last_time)  # 保证时间索引有序
+            message = {'id': message_id, 'time': timestamp, 'role': role, 'content': content}
+            record = json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n'
+
+            segment = self.segments[-1] if self.segments else None
+            if segment is None or (segment.count and segment.log_size + len(record) > self.segment_bytes):
+                segment = _Segment(self.directory, message_id, 0)
+                open(segment.log_path, 'ab').close()
+                open(segment.index_path, 'ab').close()
+                self.segments.append(segment)
+
+            # 先写日志再写索引，中断时未写入索引的记录在下次打开时被截掉
+            with open(segment.log_path, 'ab') as f:
+                f.write(record)
+            with open(segment.index_path, 'ab') as f:
+                f.write(INDEX_ENTRY.pack(message_id, timestamp, segment.log_size, len(record)))
+            segment.log_size += len(record)
+            segment.count += 1
+            segment.last_id = message_id
+            segment.last_time = timestamp
+            if segment.first_time is None:
+                segment.first_time = timestamp
+            self.last_time = timestamp
+            return message
+
+    def delete(self, message_id: int) -> bool:
+        """删除消息（记录到 deleted.ids，由压缩真正移除）"""
+        with self.lock:
+            if message_id in self.deleted or not 0 < message_id < self.next_id:
+                return False
+            with open(self.deleted_path, 'ab') as f:
+                f.write(DELETED_ENTRY.pack(message_id))
+            self.deleted.add(message_id)
+            return True
+
+    def load_before(self, before_id: int = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """读取 before_id 之前（不含）的最多 limit 条消息，按时间先后返回；before_id 为空时读取最新一页"""
+        with self.lock:
+            if before_id is None:
+                before_id = self.next_id
+            first_ids = [s.first_id for s in self.segments]
+            position = bisect.bisect_right(first_ids, before_id) - 1
+            if position < 0:
+                return []
+            stop = self.segments[position].lower_bound(before_id)
+
+            pages = []
+            found = 0
+            while position >= 0 and found < limit:
+                segment = self.segments[position]
+                # 只读还差的条数；其中有已删除的消息时跳过，下一轮从更早处补齐
+                start = max(0, stop - (limit - found))
+                entries = [e for e in segment.read_entries(start, stop) if e[0] not in self.deleted]
+                if entries:
+                    pages.append(segment.read_records(entries))
+                    found += len(entries)
+                if start == 0:
+                    position -= 1
+                    stop = self.segments[position].count if position >= 0 else 0
+                else:
+                    stop = start
+            return [message for page in reversed(pages) for message in page]
+
+    def find_by_time(self, timestamp: float) -> Optional[int]:
+        """不早于 timestamp 的第一条消息ID，没有时返回 None"""
+        with self.lock:
+            segments = [s for s in self.segments if s.count]
+            position = max(bisect.bisect_right([s.first_time for s in segments], timestamp) - 1, 0)
+            for segment in segments[position:]:
+                index = segment.lower_bound(timestamp, field=1)
+                if index < segment.count:
+                    return segment.read_entries(index, index + 1)[0][0]
+            return None
+
+    def compact(self) -> int:
+        """压缩已封存的分段：去掉已删除的消息、合并过小的分段，返回重写的分段数"""
+        with self.compact_lock:
+            with self.lock:
+                sealed = self.segments[:-1]
+                deleted = set(self.deleted)
+
+            groups, group, group_bytes = [], [], 0
+            for segment in sealed:
+                if group and group_bytes + segment.log_size > self.segment_bytes:
+                    groups.append(group)
+                    group, group_bytes = [], 0
+                group.append(segment)
+                group_bytes += segment.log_size
+            if group:
+                groups.append(group)
+
+            rewritten = 0
+            for group in groups:
+                has_deleted = any(segment.first_id <= message_id <= segment.last_id
+                                  for segment in group for message_id in deleted)
+                if len(group) > 1 or has_deleted:
+                    self._rewrite(group, deleted)
+                    rewritten += len(group)
+            return rewritten
+
+    def _rewrite(self, group: List[_Segment], deleted: set):
+        """把一组相邻分段重写为一个新分段，再在锁内替换"""
+        merged = _Segment(self.directory, group[0].first_id, max(s.generation for s in group) + 1)
+        removed = set()
+        with open(merged.log_path + '.tmp', 'wb') as log, open(merged.index_path + '.tmp', 'wb') as index:
+            for segment in group:
+                entries = segment.read_entries(0, segment.count)
+                removed.update(e[0] for e in entries if e[0] in deleted)
+                entries = [e for e in entries if e[0] not in deleted]
+                for entry, message in zip(entries, segment.read_records(entries)):
+                    record = json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n'
+                    index.write(INDEX_ENTRY.pack(entry[0], entry[1], log.tell(), len(record)))
+                    log.write(record)
+                    merged.count += 1
+                    merged.last_id = entry[0]
+                    merged.last_time = entry[1]
+                    if merged.first_time is None:
+                        merged.first_time = entry[1]
+            merged.log_size = log.tell()
+            for f in (log, index):
+                f.flush()
+                os.fsync(f.fileno())
+
+        with self.lock:
+            # 先改名日志、后改名索引：索引出现时分段才算完整
+            if merged.count:
+                os.replace(merged.log_path + '.tmp', merged.log_path)
+                os.replace(merged.index_path + '.tmp', merged.index_path)
+            else:
+                os.remove(merged.log_path + '.tmp')
+                os.remove(merged.index_path + '.tmp')
+            merged.last_id = group[-1].last_id  # 末尾消息被删除时仍占住整个ID范围
+            position = self.segments.index(group[0])
+            self.segments[position:position + len(group)] = [merged] if merged.count else []
+            for segment in group:
+                segment.remove_files()
+            if removed:
+                self.deleted -= removed
+                self._write_deleted()
+
+    def _write_deleted(self):
+        with open(self.deleted_path + '.tmp', 'wb') as f:
+            f.write(b''.join(DELETED_ENTRY.pack(message_id) for message_id in sorted(self.deleted)))
+        os.replace(self.deleted_path + '.tmp', self.deleted_path)
+
+
+class ChatHistoryStore:
+    """按卷宗保存对话记录，并在后台压缩旧分段"""
+
+    def __init__(self, root: str = 'chat_history', segment_bytes: int = SEGMENT_BYTES):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self._logs: Dict[int, CaseChatLog] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(root, exist_ok=True)
+
+    def log(self, case_id: int) -> CaseChatLog:
+        """卷宗的对话日志（首次访问时打开）"""
+        with self._lock:
+            chat_log = self._logs.get(case_id)
+            if chat_log is None:
+                chat_log = CaseChatLog(os.path.join(self.root, str(case_id)), self.segment_bytes)
+                self._logs[case_id] = chat_log
+            return chat_log
+
+    def append(self, case_id: int, role: str, content: str) -> Dict[str, Any]:
+        """追加一条消息"""
+        return self.log(case_id).append(role, content)
+
+    def load_latest(self, case_id: int, limit: int = 50) -> List[Dict[str, Any]]:
+        """读取最新的一页消息"""
+        return self.log(case_id).load_before(None, limit)
+
+    def load_before(self, case_id: int, before_id: int, limit: int = 50) -> List[Dict[str, Any]]:
+        """读取 before_id 之前的一页消息"""
+        return self.log(case_id).load_before(before_id, limit)
+
+    def delete_message(self, case_id: int, message_id: int) -> bool:
+        """删除消息"""
+        return self.log(case_id).delete(message_id)
+
+    def compact_all(self) -> int:
+        """压缩所有卷宗的对话日志，返回重写的分段数"""
+        rewritten = 0
+        for name in os.listdir(self.root):
+            if not name.isdigit() or self._stop.is_set():
+                continue
+            try:
+                rewritten += self.log(int(name)).compact()
+            except OSError as e:
+                print(f"压缩卷宗 {name} 对话记录错误: {e}")
+        return rewritten
+
+    def start(self, interval: float = 600.0):
+        """在后台线程中每隔 interval 秒压缩一次"""
+        def loop():
+            while not self._stop.wait(interval):
+                self.compact_all()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name='chat-compaction', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台压缩"""
+        self._stop.set()
+
+
+class ChatPanel(tk.Frame):
+    """卷宗对话面板
+
+    打开时只加载最新一页消息，滚动到顶部时加载更早的一页。右键消息可删除。
+    """
+
+    PAGE_SIZE = 50
+    ROLE_LABELS = {'user': '我', 'assistant': '助手'}
+
+    def __init__(self, parent, store: ChatHistoryStore, case_id: int, **kwargs):
+        kwargs.setdefault('bg', 'white')
+        super().__init__(parent, **kwargs)
+        self.store = store
+        self.case_id = case_id
+        self.oldest_id = None
+        self.has_more = True
+        self._loading = False
+
+        tk.Label(self, text="💬 卷宗对话", font=('Microsoft YaHei', 12, 'bold'),
+                 fg='#2c3e50', bg=kwargs['bg'], anchor='w').pack(fill=tk.X)
+
+        input_frame = tk.Frame(self, bg=kwargs['bg'])
+        input_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(5, 0))
+        self.input_var = tk.StringVar()
+        entry = tk.Entry(input_frame, textvariable=self.input_var, font=('Microsoft YaHei', 10),
+                         relief=tk.SOLID, bd=1)
+        entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        entry.bind('<Return>', lambda e: self.send())
+        tk.Button(input_frame, text="发送", font=('Microsoft YaHei', 10), bg='#3498db', fg='white',
+                  relief=tk.FLAT, cursor='hand2', command=self.send).pack(side=tk.RIGHT, padx=(5, 0))
+
+        self.text = tk.Text(self, width=40, wrap=tk.WORD, font=('Microsoft YaHei', 10), relief=tk.SOLID, bd=1,
+                            yscrollcommand=self._on_scroll, state=tk.DISABLED)
+        self.scrollbar = tk.Scrollbar(self, orient='vertical', command=self.text.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.text.tag_configure('meta', foreground='#95a5a6', font=('Microsoft YaHei', 8))
+        self.text.tag_configure('user', foreground='#2c3e50')
+        self.text.tag_configure('assistant', foreground='#16a085')
+
+        self.menu = tk.Menu(self, tearoff=0)
+        self.menu.add_command(label="删除消息", command=self._delete_selected)
+        self.text.bind('<Button-3>', self._on_right_click)
+        self._menu_message_id = None
+
+        self._load_page()
+        self.text.see(tk.END)
+
+    def _on_scroll(self, first, last):
+        """滚动条回调：到达顶部时加载更早的消息"""
+        self.scrollbar.set(first, last)
+        if float(first) <= 0.0 and self.has_more and not self._loading and self.oldest_id is not None:
+            self.after_idle(self._load_page)
+
+    def _render(self, message: Dict[str, Any]) -> List[Tuple[str, Tuple[str, ...]]]:
+        tag = f"msg-{message['id']}"
+        stamp = datetime.fromtimestamp(message['time']).strftime('%Y-%m-%d %H:%M')
+        role = self.ROLE_LABELS.get(message['role'], message['role'])
+        return [(f"{role}  {stamp}\n", ('meta', tag)),
+                (f"{message['content']}\n\n", (message['role'], tag))]
+
+    def _load_page(self):
+        """加载更早的一页，插入顶部并保持当前可见位置"""
+        if self._loading or not self.has_more:
+            return
+        self._loading = True
+        try:
+            messages = self.store.load_before(self.case_id, self.oldest_id, self.PAGE_SIZE) \
+                if self.oldest_id is not None else self.store.load_latest(self.case_id, self.PAGE_SIZE)
+            self.has_more = len(messages) == self.PAGE_SIZE
+            if not messages:
+                return
+            self.oldest_id = messages[0]['id']
+
+            top_line = int(self.text.index('@0,0').split('.')[0])
+            lines_before = int(self.text.index('end-1c').split('.')[0])
+            self.text.configure(state=tk.NORMAL)
+            for message in reversed(messages):
+                for text, tags in reversed(self._render(message)):
+                    self.text.insert('1.0', text, tags)
+            self.text.configure(state=tk.DISABLED)
+            added = int(self.text.index('end-1c').split('.')[0]) - lines_before
+            self.text.yview(f"{top_line + added}.0")
+        except OSError as e:
+            print(f"加载对话记录错误: {e}")
+        finally:
+            self._loading = False
+
+    def send(self):
+        """保存输入的消息并显示在末尾"""
+        content = self.input_var.get().strip()
+        if not content:
+            return
+        try:
+            message = self.store.append(self.case_id, 'user', content)
+        except OSError as e:
+            print(f"保存对话记录错误: {e}")
+            return
+        self.input_var.set('')
+        if self.oldest_id is None:
+            self.oldest_id = message['id']
+        self.text.configure(state=tk.NORMAL)
+        for text, tags in self._render(message):
+            self.text.insert(tk.END, text, tags)
+        self.text.configure(state=tk.DISABLED)
+        self.text.see(tk.END)
+
+    def _on_right_click(self, event):
+        index = self.text.index(f"@{event.x},{event.y}")
+        tags = [tag for tag in self.text.tag_names(index) if tag.startswith('msg-')]
+        if tags:
+            self._menu_message_id = int(tags[0][4:])
+            self.menu.tk_popup(event.x_root, event.y_root)
+
+    def _delete_selected(self):
+        message_id = self._menu_message_id
+        if message_id is None or not self.store.delete_message(self.case_id, message_id):
+            return
+        ranges = self.text.tag_ranges(f"msg-{message_id}")
+        if ranges:
+            self.text.configure(state=tk.NORMAL)
+            self.text.delete(ranges[0], ranges[-1])
+            self.text.configure(state=tk.DISABLED)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内容寻址的PDF存储
+
+同一份证据PDF经常被附加到多个关联卷宗，或修改后再次上传。这里按文件内容的
+SHA-256 保存文件，相同内容只存一份；文本、缩略图等派生数据也按哈希存放，
+引用同一内容的卷宗共享这些数据。引用计数记录在 content_objects 表中，
+由目录项和卷宗的删除操作维护，GC 回收无引用的对象。
+"""
+
+import datetime
+import hashlib
+import os
+import shutil
+import stat
+import threading
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+from database_config import ContentManager, PageContentManager
+from pdf_handle import DocumentHandle
+
+CHUNK_SIZE = 1024 * 1024
+FICLONE = 0x40049409  # Linux ioctl：在支持的文件系统上创建写时复制副本
+
+
+def hash_file(file_path: str) -> Tuple[str, int]:
+    """在 mmap 映射上计算文件的 SHA-256，返回 (哈希, 字节数)"""
+    with DocumentHandle(file_path) as handle:
+        return handle.sha256(), handle.size
+
+
+def _reflink(source: str, target: str) -> bool:
+    """尝试以写时复制方式克隆文件，不支持时返回 False"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+
+    try:
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        if os.path.exists(target):
+            os.remove(target)
+        return False
+
+
+class ContentStore:
+    """内容寻址存储
+
+    目录结构：
+        objects/ab/abcdef....pdf   原始文件，只读
+        artifacts/abcdef.../       派生数据（缩略图等）
+        tmp/                       上传中的临时文件
+        trash/                     GC 回收过程中暂存的对象
+    """
+
+    def __init__(self, root: str = 'content_store', content_manager: ContentManager = None,
+                 page_manager: PageContentManager = None):
+        self.root = root
+        self.content_manager = content_manager or ContentManager()
+        self.page_manager = page_manager or PageContentManager(self.content_manager.db_manager)
+        self.objects_dir = os.path.join(root, 'objects')
+        self.artifacts_dir = os.path.join(root, 'artifacts')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.trash_dir = os.path.join(root, 'trash')
+        for path in (self.objects_dir, self.artifacts_dir, self.tmp_dir, self.trash_dir):
+            os.makedirs(path, exist_ok=True)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def object_path(self, content_hash: str) -> str:
+        """存储对象的文件路径"""
+        return os.path.join(self.objects_dir, content_hash[:2], f"{content_hash}.pdf")
+
+    def artifact_dir(self, content_hash: str) -> str:
+        """存储对象派生数据的目录"""
+        return os.path.join(self.artifacts_dir, content_hash)
+
+    def contains(self, content_hash: str) -> bool:
+        """对象是否已存储"""
+        return os.path.exists(self.object_path(content_hash))
+
+    def put_file(self, source_path: str,
+                 progress: Callable[[int, int], None] = None) -> Tuple[str, str]:
+        """导入文件，返回 (内容哈希, 存储路径)
+
+        同一文件系统上优先使用 reflink 克隆（不复制数据，且与用户原文件互不影响），
+        否则边复制边计算哈希，只读一遍源文件。内容已存在时丢弃临时文件。
+
+        先登记对象再检查文件是否存在：登记会刷新 released_at，使并发的 gc 放弃删除该对象；
+        若 gc 已先一步移走文件，这里会重新放入。
+        """
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        try:
+            if _reflink(source_path, tmp_path):
+                content_hash, size = hash_file(tmp_path)
+            else:
+                content_hash, size = self._copy_and_hash(source_path, tmp_path, progress)
+
+            self.content_manager.register_object(content_hash, size)
+            target = self.object_path(content_hash)
+            if os.path.exists(target):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                os.replace(tmp_path, target)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return content_hash, target
+
+    def _copy_and_hash(self, source_path: str, target_path: str,
+                       progress: Callable[[int, int], None] = None) -> Tuple[str, int]:
+        """边复制边计算哈希"""
+        digest = hashlib.sha256()
+        total = os.path.getsize(source_path)
+        size = 0
+        with open(source_path, 'rb') as src, open(target_path, 'wb') as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                dst.write(chunk)
+                size += len(chunk)
+                if progress:
+                    progress(size, total)
+        return digest.hexdigest(), size
+
+    def link_to(self, content_hash: str, target_path: str) -> bool:
+        """在存储所在文件系统上为对象创建硬链接（如导出到卷宗工作目录）
+
+        对象文件是只读的，硬链接与存储共享同一份数据；跨文件系统时退化为复制。
+        """
+        source = self.object_path(content_hash)
+        if not os.path.exists(source):
+            return False
+        os.makedirs(os.path.dirname(os.path.abspath(target_path)), exist_ok=True)
+        try:
+            os.link(source, target_path)
+        except OSError:
+            shutil.copyfile(source, target_path)
+        return True
+
+    def gc(self, grace_period: datetime.timedelta = datetime.timedelta(hours=1),
+           batch_size: int = 100) -> Dict[str, int]:
+        """回收无引用的对象及其派生数据（文件、缩略图和逐页内容）
+
+        只回收引用数归零超过宽限期的对象，避免刚上传、尚未登记目录项的文件被删除。
+        对象文件先移入 trash/，再有条件地删除记录：期间被 put_file 重新登记或被引用的
+        对象删除失败，文件移回原处。
+        """
+        released_before = datetime.datetime.now() - grace_period
+        removed = freed = 0
+        while True:
+            content_hashes = self.content_manager.get_unreferenced(released_before, batch_size)
+            if not content_hashes:
+                break
+            batch_removed = 0
+            for content_hash in content_hashes:
+                size = self._remove_object(content_hash, released_before)
+                if size is None:
+                    continue  # 删除前又被登记或引用
+                freed += size
+                batch_removed += 1
+            removed += batch_removed
+            if len(content_hashes) < batch_size or not batch_removed:
+                break
+
+        self._clean_tmp(released_before)
+        return {'removed_objects': removed, 'freed_bytes': freed}
+
+    def start(self, interval: float = 3600.0):
+        """在后台线程中每隔 interval 秒执行一次 gc"""
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    result = self.gc()
+                except Exception as e:
+                    print(f"内容存储回收错误: {e}")
+                    continue
+                if result['removed_objects']:
+                    print(f"已回收存储对象 {result['removed_objects']} 个，释放 {result['freed_bytes']} 字节")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name='content-gc', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台回收"""
+        self._stop.set()
+
+    def _remove_object(self, content_hash: str, released_before: datetime.datetime) -> Optional[int]:
+        """删除一个无引用对象，返回释放的字节数；对象仍被需要时返回 None"""
+        path = self.object_path(content_hash)
+        trash_path = os.path.join(self.trash_dir, f"{content_hash}.{uuid.uuid4().hex}")
+        try:
+            os.replace(path, trash_path)
+        except FileNotFoundError:
+            trash_path = None
+
+        if not self.content_manager.delete_object(content_hash, released_before):
+            if trash_path:
+                os.replace(trash_path, path)
+            return None
+
+        size = 0
+        if trash_path:
+            size = os.path.getsize(trash_path)
+            os.chmod(trash_path, stat.S_IWUSR | stat.S_IRUSR)
+            os.remove(trash_path)
+        shutil.rmtree(self.artifact_dir(content_hash), ignore_errors=True)
+        self.page_manager.delete_document(content_hash)
+        return size
+
+    def _clean_tmp(self, older_than: datetime.datetime):
+        """清理中断上传遗留的临时文件"""
+        cutoff = older_than.timestamp()
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
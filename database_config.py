@@ -1,12 +1,71 @@
 import mysql.connector
+import mysql.connector.pooling
 import hashlib
 import datetime
-from typing import Optional, List, Dict, Any, Tuple
+import os
+import threading
+import time
+from typing import Optional, List, Dict, Any, Tuple, Callable
+
+class ReplicaRouter:
+    """只读副本路由：在健康的副本之间轮询
+    
+    连接失败（无法连接或连接断开）的副本在 failure_cooldown 秒内不再被选中，之后自动重新尝试；
+    连接池耗尽等其他错误只跳过该副本，不标记为不可用。
+    """
+    
+    def __init__(self, replica_count: int, connect, failure_cooldown: float = 30.0):
+        self.replica_count = replica_count
+        self.connect = connect
+        self.failure_cooldown = failure_cooldown
+        self._next = 0
+        self._down_until = [0.0] * replica_count
+        self._lock = threading.Lock()
+    
+    def get_connection(self) -> Tuple[Any, Optional[int]]:
+        """返回 (连接, 副本序号)，所有副本都不可用时返回 (None, None)"""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % self.replica_count
+        
+        now = time.monotonic()
+        for offset in range(self.replica_count):
+            index = (start + offset) % self.replica_count
+            if self._down_until[index] > now:
+                continue
+            try:
+                return self.connect(index), index
+            except (mysql.connector.errors.InterfaceError, mysql.connector.errors.OperationalError) as e:
+                print(f"只读副本 {index} 连接错误: {e}")
+                self.mark_down(index)
+            except mysql.connector.Error as e:
+                print(f"只读副本 {index} 暂不可用: {e}")
+        return None, None
+    
+    def mark_down(self, index: int):
+        """标记副本不可用"""
+        self._down_until[index] = time.monotonic() + self.failure_cooldown
+    
+    def healthy_count(self) -> int:
+        """当前可用的副本数"""
+        now = time.monotonic()
+        return sum(1 for until in self._down_until if until <= now)
 
 class DatabaseConfig:
-    """数据库连接配置类"""
+    """数据库连接配置类
     
-    def __init__(self):
+    pool_size 为 0 时每次调用新建连接；大于 0 时使用连接池，close_connection 把连接归还连接池。
+    
+    配置了只读副本（参数 replicas 或环境变量 LEGAL_ASSISTANT_DB_REPLICAS，如
+    "10.0.0.2:3306,10.0.0.3"）时，查询走副本，写操作走主库；同一会话写入后
+    read_after_write_window 秒内的查询仍走主库，保证能读到自己的写入。
+    connector 可替换为测试用的假驱动。
+    """
+    
+    REPLICAS_ENV = 'LEGAL_ASSISTANT_DB_REPLICAS'
+    
+    def __init__(self, pool_size: int = 0, replicas: List[Dict[str, Any]] = None,
+                 connector=None, read_after_write_window: float = 5.0):
         self.config = {
             'host': 'localhost',
             'user': 'root',
@@ -15,16 +74,100 @@ class DatabaseConfig:
             'charset': 'utf8mb4',
             'autocommit': True
         }
+        self.pool_size = pool_size
+        self.connector = connector
+        self._pools = {}
+        self._pool_lock = threading.Lock()
+        
+        if replicas is None:
+            replicas = self._replicas_from_env()
+        self.replica_configs = [dict(self.config, **replica) for replica in replicas]
+        self.replica_router = ReplicaRouter(
+            len(self.replica_configs), lambda index: self._open(f"replica{index}", self.replica_configs[index])
+        ) if self.replica_configs else None
+        self.read_after_write_window = read_after_write_window
+        self._session = threading.local()
+        self._last_write: Dict[Any, float] = {}
+        self._write_lock = threading.Lock()
+    
+    def _replicas_from_env(self) -> List[Dict[str, Any]]:
+        """解析环境变量中的副本地址"""
+        replicas = []
+        for address in os.environ.get(self.REPLICAS_ENV, '').split(','):
+            address = address.strip()
+            if not address:
+                continue
+            host, _, port = address.partition(':')
+            replicas.append({'host': host, 'port': int(port)} if port else {'host': host})
+        return replicas
+    
+    def _open(self, name: str, config: Dict[str, Any]):
+        """建立连接或从对应的连接池取出连接"""
+        if self.connector:
+            return self.connector(**config)
+        if self.pool_size:
+            with self._pool_lock:
+                if name not in self._pools:
+                    self._pools[name] = mysql.connector.pooling.MySQLConnectionPool(
+                        pool_name=f"legal_assistant_{id(self)}_{name}", pool_size=self.pool_size, **config
+                    )
+            return self._pools[name].get_connection()
+        return mysql.connector.connect(**config)
     
     def get_connection(self):
-        """获取数据库连接"""
+        """获取主库连接（用于写操作）
+        
+        连接池耗尽时抛出 PoolError 而不是返回 None：这不是数据库故障，调用方（服务）
+        应返回繁忙状态，而不是把它当作空结果。写入提交成功后由调用方调用 mark_write()。
+        """
         try:
-            connection = mysql.connector.connect(**self.config)
-            return connection
+            return self._open('primary', self.config)
+        except mysql.connector.errors.PoolError:
+            raise
         except mysql.connector.Error as e:
             print(f"数据库连接错误: {e}")
             return None
     
+    def get_read_connection(self) -> Tuple[Any, Optional[int]]:
+        """获取查询连接，返回 (连接, 副本序号)；走主库时副本序号为 None，连接池耗尽时抛出 PoolError"""
+        if self.replica_router and not self.recently_wrote():
+            connection, index = self.replica_router.get_connection()
+            if connection:
+                return connection, index
+        try:
+            return self._open('primary', self.config), None
+        except mysql.connector.errors.PoolError:
+            raise
+        except mysql.connector.Error as e:
+            print(f"数据库连接错误: {e}")
+            return None, None
+    
+    def set_session(self, session_key: Any):
+        """设置当前线程所代表的会话（服务模式下每个请求设置一次）"""
+        self._session.key = session_key
+    
+    def mark_write(self):
+        """记录当前会话的写入时间（在写事务提交成功后调用）"""
+        if not self.replica_router:
+            return
+        now = time.monotonic()
+        with self._write_lock:
+            if len(self._last_write) > 10000:
+                expired = now - self.read_after_write_window
+                self._last_write = {k: t for k, t in self._last_write.items() if t > expired}
+            self._last_write[getattr(self._session, 'key', None)] = now
+    
+    def recently_wrote(self) -> bool:
+        """当前会话是否在读写一致窗口内写入过"""
+        return self.session_recently_wrote(getattr(self._session, 'key', None))
+    
+    def session_recently_wrote(self, session_key: Any) -> bool:
+        """指定会话是否在读写一致窗口内写入过（未配置只读副本时总是 False）"""
+        if not self.replica_router:
+            return False
+        last_write = self._last_write.get(session_key)
+        return last_write is not None and time.monotonic() - last_write < self.read_after_write_window
+    
     def close_connection(self, connection):
         """关闭数据库连接"""
         if connection and connection.is_connected():
@@ -33,11 +176,40 @@ class DatabaseConfig:
 class DatabaseManager:
     """数据库管理类"""
     
-    def __init__(self):
-        self.db_config = DatabaseConfig()
+    def __init__(self, db_config: DatabaseConfig = None):
+        self.db_config = db_config or DatabaseConfig()
+    
+    def execute_query(self, query: str, params: tuple = None, primary: bool = False) -> List[Dict[str, Any]]:
+        """执行查询并返回结果（配置了只读副本时走副本，副本出错时改走主库重试一次）
+        
+        primary 为 True 时直接查询主库，用于随后要据此写入的查询，避免读到副本上的旧数据。
+        """
+        if primary:
+            return self._execute_query_on_primary(query, params)
+        connection, replica = self.db_config.get_read_connection()
+        if not connection:
+            return []
+        
+        try:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(query, params or ())
+            result = cursor.fetchall()
+            cursor.close()
+            return result
+        except mysql.connector.Error as e:
+            if replica is None:
+                print(f"查询执行错误: {e}")
+                return []
+            print(f"只读副本 {replica} 查询错误，改用主库: {e}")
+            if not connection.is_connected():
+                self.db_config.replica_router.mark_down(replica)
+        finally:
+            self.db_config.close_connection(connection)
+        
+        return self._execute_query_on_primary(query, params)
     
-    def execute_query(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
-        """执行查询并返回结果"""
+    def _execute_query_on_primary(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
+        """在主库上执行查询"""
         connection = self.db_config.get_connection()
         if not connection:
             return []
@@ -64,6 +236,7 @@ class DatabaseManager:
             cursor = connection.cursor()
             cursor.execute(query, params or ())
             connection.commit()
+            self.db_config.mark_write()
             cursor.close()
             return True
         except mysql.connector.Error as e:
@@ -83,6 +256,7 @@ class DatabaseManager:
             cursor = connection.cursor()
             cursor.execute(query, params or ())
             connection.commit()
+            self.db_config.mark_write()
             insert_id = cursor.lastrowid
             cursor.close()
             return insert_id
@@ -92,12 +266,33 @@ class DatabaseManager:
             return None
         finally:
             self.db_config.close_connection(connection)
+    
+    def run_in_transaction(self, work: Callable[[Any], Any]) -> Any:
+        """在一个事务中执行 work(cursor)，成功则提交并返回其结果，出错则回滚并返回 None"""
+        connection = self.db_config.get_connection()
+        if not connection:
+            return None
+    
+        try:
+            connection.start_transaction()
+            cursor = connection.cursor(dictionary=True)
+            result = work(cursor)
+            connection.commit()
+            self.db_config.mark_write()
+            cursor.close()
+            return result
+        except mysql.connector.Error as e:
+            print(f"事务执行错误: {e}")
+            connection.rollback()
+            return None
+        finally:
+            self.db_config.close_connection(connection)
 
 class UserManager:
     """用户管理类"""
     
-    def __init__(self):
-        self.db_manager = DatabaseManager()
+    def __init__(self, db_manager: DatabaseManager = None):
+        self.db_manager = db_manager or DatabaseManager()
     
     def hash_password(self, password: str) -> str:
         """密码哈希"""
@@ -137,10 +332,38 @@ class UserManager:
         return users[0] if users else None
 
 class CaseManager:
-    """卷宗管理类"""
+    """卷宗管理类
+    
+    case_stats 表按 (用户, 案件类型, 状态) 保存未删除卷宗的数量，由 create_case、update_case、
+    delete_case 在同一事务中增量维护，统计面板和筛选条件无需对 cases 做 GROUP BY。
+    """
     
-    def __init__(self):
-        self.db_manager = DatabaseManager()
+    FILTER_FIELDS = ('case_type', 'status')
+    
+    # 归档表与原表结构相同（见 archiver.py）
+    ARCHIVE_TABLES = {
+        'cases': 'cases_archive',
+        'case_directories': 'case_directories_archive',
+        'user_sessions': 'user_sessions_archive',
+    }
+    
+    STATS_UPSERT = """
+    INSERT INTO case_stats (user_id, case_type, status, case_count) VALUES (%s, %s, %s, GREATEST(%s, 0))
+    ON DUPLICATE KEY UPDATE case_count = GREATEST(case_count + %s, 0)
+    """
+    
+    def __init__(self, db_manager: DatabaseManager = None):
+        self.db_manager = db_manager or DatabaseManager()
+    
+    @staticmethod
+    def _facet_key(row: Dict[str, Any]) -> Tuple[str, str]:
+        """统计表的键，空值统一为空字符串"""
+        return row['case_type'] or '', row['status'] or ''
+    
+    def _adjust_stats(self, cursor, user_id: int, facet_key: Tuple[str, str], delta: int):
+        """在当前事务中调整一个统计格的数量"""
+        case_type, status = facet_key
+        cursor.execute(self.STATS_UPSERT, (user_id, case_type, status, delta, delta))
     
     def create_case(self, case_name: str, case_number: str, client_name: str, 
                    case_type: str, description: str, user_id: int) -> Optional[int]:
@@ -151,9 +374,16 @@ class CaseManager:
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         """
         now = datetime.datetime.now()
-        return self.db_manager.execute_insert(
-            query, (case_name, case_number, client_name, case_type, description, user_id, now, now)
-        )
+        
+        def work(cursor):
+            cursor.execute(query, (case_name, case_number, client_name, case_type, description, user_id, now, now))
+            case_id = cursor.lastrowid
+            # 状态取数据库默认值，插入后读回
+            cursor.execute("SELECT case_type, status FROM cases WHERE id = %s", (case_id,))
+            self._adjust_stats(cursor, user_id, self._facet_key(cursor.fetchall()[0]), 1)
+            return case_id
+        
+        return self.db_manager.run_in_transaction(work)
     
     def get_cases_by_user(self, user_id: int) -> List[Dict[str, Any]]:
         """获取用户的所有卷宗"""
@@ -166,8 +396,43 @@ class CaseManager:
         cases = self.db_manager.execute_query(query, (case_id,))
         return cases[0] if cases else None
     
+    def get_case_facets(self, user_id: int) -> Dict[str, Any]:
+        """获取用户卷宗的统计：总数及按案件类型、状态的数量（读 case_stats，不扫描 cases）"""
+        rows = self.db_manager.execute_query(
+            "SELECT case_type, status, case_count FROM case_stats WHERE user_id = %s AND case_count > 0",
+            (user_id,)
+        )
+        facets = {'total': 0, 'case_type': {}, 'status': {}}
+        for row in rows:
+            count = int(row['case_count'])
+            facets['total'] += count
+            facets['case_type'][row['case_type']] = facets['case_type'].get(row['case_type'], 0) + count
+            facets['status'][row['status']] = facets['status'].get(row['status'], 0) + count
+        return facets
+    
+    def find_cases(self, user_id: int, case_type: str = None, status: str = None,
+                   limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """按案件类型、状态筛选用户的卷宗（走 idx_cases_user_type / idx_cases_user_status 索引）
+        
+        参数为 None 表示不限；空字符串匹配未填写的值，与 get_case_facets 的键一致。
+        """
+        where = ["user_id = %s", "is_deleted = 0"]
+        params: List[Any] = [user_id]
+        for field, value in (('case_type', case_type), ('status', status)):
+            if value is None:
+                continue
+            if value == '':
+                where.append(f"({field} = '' OR {field} IS NULL)")
+            else:
+                where.append(f"{field} = %s")
+                params.append(value)
+        
+        query = f"SELECT * FROM cases WHERE {' AND '.join(where)} ORDER BY updated_at DESC LIMIT %s OFFSET %s"
+        params.extend([limit, offset])
+        return self.db_manager.execute_query(query, tuple(params))
+    
     def update_case(self, case_id: int, **kwargs) -> bool:
-        """更新卷宗信息"""
+        """更新卷宗信息（修改案件类型或状态时同步调整统计）"""
         if not kwargs:
             return False
         
@@ -189,36 +454,184 @@ class CaseManager:
         params.append(case_id)
         
         query = f"UPDATE cases SET {', '.join(set_clauses)} WHERE id = %s"
-        return self.db_manager.execute_update(query, tuple(params))
+        if not any(field in kwargs for field in self.FILTER_FIELDS):
+            return self.db_manager.execute_update(query, tuple(params))
+        
+        def work(cursor):
+            cursor.execute(
+                "SELECT user_id, case_type, status, is_deleted FROM cases WHERE id = %s FOR UPDATE", (case_id,)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return False
+            before = rows[0]
+            cursor.execute(query, tuple(params))
+            if not before['is_deleted']:
+                after = dict(before, **{field: kwargs[field] for field in self.FILTER_FIELDS if field in kwargs})
+                if self._facet_key(after) != self._facet_key(before):
+                    self._adjust_stats(cursor, before['user_id'], self._facet_key(before), -1)
+                    self._adjust_stats(cursor, before['user_id'], self._facet_key(after), 1)
+            return True
+        
+        return bool(self.db_manager.run_in_transaction(work))
     
     def delete_case(self, case_id: int) -> bool:
-        """软删除卷宗"""
-        query = "UPDATE cases SET is_deleted = 1, updated_at = %s WHERE id = %s"
-        return self.db_manager.execute_update(query, (datetime.datetime.now(), case_id))
+        """软删除卷宗
+        
+        目录项对存储内容的引用保留到卷宗被归档时才释放，软删除期间文件不会被 GC 回收，恢复后仍可使用。
+        """
+        def work(cursor):
+            cursor.execute(
+                "SELECT user_id, case_type, status FROM cases WHERE id = %s AND is_deleted = 0 FOR UPDATE",
+                (case_id,)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return False
+            cursor.execute("UPDATE cases SET is_deleted = 1, updated_at = %s WHERE id = %s",
+                           (datetime.datetime.now(), case_id))
+            self._adjust_stats(cursor, rows[0]['user_id'], self._facet_key(rows[0]), -1)
+            return True
+        
+        return bool(self.db_manager.run_in_transaction(work))
+    
+    def restore_case(self, case_id: int) -> bool:
+        """恢复已删除的卷宗
+        
+        软删除的卷宗仍持有存储内容的引用，直接恢复；已归档的卷宗从归档表移回并重新引用
+        其目录项的存储内容，其中有文件已被 ContentStore.gc 回收时不予恢复。
+        """
+        def work(cursor):
+            cursor.execute(
+                "SELECT user_id, case_type, status, is_deleted FROM cases WHERE id = %s FOR UPDATE", (case_id,)
+            )
+            rows = cursor.fetchall()
+            if rows and not rows[0]['is_deleted']:
+                return False
+            if not rows:
+                cursor.execute(f"SELECT id FROM {self.ARCHIVE_TABLES['cases']} WHERE id = %s FOR UPDATE",
+                               (case_id,))
+                if not cursor.fetchall():
+                    return False
+                
+                # 先锁定并核对存储对象，再移回数据，避免与 GC 删除对象交错
+                cursor.execute(f"""
+                SELECT content_hash, COUNT(*) AS refs FROM {self.ARCHIVE_TABLES['case_directories']} 
+                WHERE case_id = %s AND content_hash IS NOT NULL GROUP BY content_hash
+                """, (case_id,))
+                refs = [(row['refs'], row['content_hash']) for row in cursor.fetchall()]
+                if refs:
+                    cursor.execute(f"""
+                    SELECT content_hash FROM content_objects 
+                    WHERE content_hash IN ({', '.join(['%s'] * len(refs))}) FOR UPDATE
+                    """, tuple(content_hash for _, content_hash in refs))
+                    missing = len(refs) - len(cursor.fetchall())
+                    if missing:
+                        print(f"卷宗 {case_id} 有 {missing} 个文件已被回收，无法恢复")
+                        return False
+                    cursor.executemany(
+                        "UPDATE content_objects SET ref_count = ref_count + %s WHERE content_hash = %s", refs
+                    )
+                
+                for table, case_column in (('cases', 'id'), ('case_directories', 'case_id')):
+                    archive = self.ARCHIVE_TABLES[table]
+                    cursor.execute(f"INSERT INTO {table} SELECT * FROM {archive} WHERE {case_column} = %s",
+                                   (case_id,))
+                    cursor.execute(f"DELETE FROM {archive} WHERE {case_column} = %s", (case_id,))
+                cursor.execute("SELECT user_id, case_type, status FROM cases WHERE id = %s", (case_id,))
+                rows = cursor.fetchall()
+            
+            cursor.execute("UPDATE cases SET is_deleted = 0, updated_at = %s WHERE id = %s",
+                           (datetime.datetime.now(), case_id))
+            self._adjust_stats(cursor, rows[0]['user_id'], self._facet_key(rows[0]), 1)
+            return True
+        
+        return bool(self.db_manager.run_in_transaction(work))
+    
+    def rebuild_case_stats(self, user_id: int = None) -> bool:
+        """从 cases 表重新计算统计（首次建表或数据修复时使用）"""
+        user_clause = "" if user_id is None else " AND user_id = %s"
+        params = () if user_id is None else (user_id,)
+        
+        def work(cursor):
+            cursor.execute(f"DELETE FROM case_stats WHERE 1 = 1{user_clause}", params)
+            cursor.execute(f"""
+            INSERT INTO case_stats (user_id, case_type, status, case_count)
+            SELECT user_id, COALESCE(case_type, ''), COALESCE(status, ''), COUNT(*)
+            FROM cases WHERE is_deleted = 0{user_clause}
+            GROUP BY user_id, COALESCE(case_type, ''), COALESCE(status, '')
+            """, params)
+            return True
+        
+        return bool(self.db_manager.run_in_transaction(work))
 
 class DirectoryManager:
     """目录管理类"""
     
-    def __init__(self):
-        self.db_manager = DatabaseManager()
+    def __init__(self, db_manager: DatabaseManager = None):
+        self.db_manager = db_manager or DatabaseManager()
+        self.content_manager = ContentManager(self.db_manager)
     
     def add_directory_item(self, case_id: int, file_path: str, file_name: str, 
-                          file_type: str, page_number: int = None) -> Optional[int]:
-        """添加目录项"""
+                          file_type: str, page_number: int = None,
+                          parent_id: int = None, sort_order: int = 0,
+                          content_hash: str = None) -> Optional[int]:
+        """添加目录项（parent_id 为空表示顶层目录，content_hash 为内容存储中的文件哈希）"""
+        depth = 0
+        if parent_id is not None:
+            parents = self.db_manager.execute_query(
+                "SELECT depth FROM case_directories WHERE id = %s", (parent_id,), primary=True
+            )
+            if not parents:
+                return None
+            depth = (parents[0]['depth'] or 0) + 1
+        
         query = """
-        INSERT INTO case_directories (case_id, file_path, file_name, file_type, 
-                                    page_number, created_at) 
-        VALUES (%s, %s, %s, %s, %s, %s)
+        INSERT INTO case_directories (case_id, parent_id, depth, sort_order, file_path, 
+                                    content_hash, file_name, file_type, page_number, created_at) 
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """
-        return self.db_manager.execute_insert(
-            query, (case_id, file_path, file_name, file_type, page_number, datetime.datetime.now())
+        item_id = self.db_manager.execute_insert(
+            query, (case_id, parent_id, depth, sort_order, file_path, content_hash, file_name,
+                    file_type, page_number, datetime.datetime.now())
         )
+        if item_id is not None and content_hash:
+            self.content_manager.acquire(content_hash)
+        return item_id
     
     def get_directory_by_case(self, case_id: int) -> List[Dict[str, Any]]:
         """获取卷宗的目录"""
         query = "SELECT * FROM case_directories WHERE case_id = %s ORDER BY created_at ASC"
         return self.db_manager.execute_query(query, (case_id,))
     
+    def get_directory_index(self, case_id: int) -> List[Dict[str, Any]]:
+        """获取卷宗目录项的 id、文件名和页码（快速跳转索引只需要这三列）"""
+        query = "SELECT id, file_name, page_number FROM case_directories WHERE case_id = %s"
+        return self.db_manager.execute_query(query, (case_id,))
+    
+    def get_directory_item(self, item_id: int) -> Optional[Dict[str, Any]]:
+        """获取单个目录项"""
+        rows = self.db_manager.execute_query("SELECT * FROM case_directories WHERE id = %s", (item_id,))
+        return rows[0] if rows else None
+    
+    def get_child_directories(self, case_id: int, parent_id: int = None) -> List[Dict[str, Any]]:
+        """获取某一节点的直接子目录（parent_id 为空时返回顶层目录）
+        
+        每行附带 child_count，便于界面判断节点是否可展开，而无需加载下一层。
+        """
+        parent_clause = "d.parent_id IS NULL" if parent_id is None else "d.parent_id = %s"
+        query = f"""
+        SELECT d.id, d.parent_id, d.depth, d.sort_order, d.file_name, d.file_type, d.page_number,
+               d.file_path, d.content_hash,
+               (SELECT COUNT(*) FROM case_directories c 
+                WHERE c.case_id = d.case_id AND c.parent_id = d.id) AS child_count
+        FROM case_directories d
+        WHERE d.case_id = %s AND {parent_clause}
+        ORDER BY d.sort_order ASC, d.id ASC
+        """
+        params = (case_id,) if parent_id is None else (case_id, parent_id)
+        return self.db_manager.execute_query(query, params)
+    
     def update_directory_item(self, item_id: int, **kwargs) -> bool:
         """更新目录项"""
         if not kwargs:
@@ -228,7 +641,7 @@ class DirectoryManager:
         params = []
         
         for key, value in kwargs.items():
-            if key in ['file_path', 'file_name', 'file_type', 'page_number']:
+            if key in ['file_path', 'file_name', 'file_type', 'page_number', 'sort_order']:
                 set_clauses.append(f"{key} = %s")
                 params.append(value)
         
@@ -240,14 +653,88 @@ class DirectoryManager:
         return self.db_manager.execute_update(query, tuple(params))
     
     def delete_directory_item(self, item_id: int) -> bool:
-        """删除目录项"""
-        query = "DELETE FROM case_directories WHERE id = %s"
-        return self.db_manager.execute_update(query, (item_id,))
+        """删除目录项及其全部子目录（子目录查询带 case_id，走 idx_case_directories_parent 索引）"""
+        items = self.db_manager.execute_query(
+            "SELECT case_id FROM case_directories WHERE id = %s", (item_id,), primary=True
+        )
+        if not items:
+            return False
+        case_id = items[0]['case_id']
+        
+        item_ids = [item_id]
+        frontier = [item_id]
+        while frontier:
+            placeholders = ', '.join(['%s'] * len(frontier))
+            rows = self.db_manager.execute_query(
+                f"SELECT id FROM case_directories WHERE case_id = %s AND parent_id IN ({placeholders})",
+                (case_id,) + tuple(frontier), primary=True
+            )
+            frontier = [row['id'] for row in rows]
+            item_ids.extend(frontier)
+        
+        placeholders = ', '.join(['%s'] * len(item_ids))
+        rows = self.db_manager.execute_query(
+            f"SELECT content_hash FROM case_directories WHERE id IN ({placeholders}) "
+            f"AND content_hash IS NOT NULL", tuple(item_ids), primary=True
+        )
+        query = f"DELETE FROM case_directories WHERE id IN ({placeholders})"
+        if not self.db_manager.execute_update(query, tuple(item_ids)):
+            return False
+        self.content_manager.release_many([row['content_hash'] for row in rows])
+        return True
     
     def clear_case_directory(self, case_id: int) -> bool:
         """清空卷宗目录"""
+        rows = self.db_manager.execute_query(
+            "SELECT content_hash FROM case_directories WHERE case_id = %s AND content_hash IS NOT NULL",
+            (case_id,), primary=True
+        )
         query = "DELETE FROM case_directories WHERE case_id = %s"
-        return self.db_manager.execute_update(query, (case_id,))
+        if not self.db_manager.execute_update(query, (case_id,)):
+            return False
+        self.content_manager.release_many([row['content_hash'] for row in rows])
+        return True
+    
+    def remap_page_numbers(self, case_id: int, old_file_path: str, new_file_path: str,
+                           page_map: Dict[int, int], new_content_hash: str = None) -> bool:
+        """文件更新版本后，把目录项指向新文件并按 page_map（旧页序 -> 新页序，从0开始）重排页码"""
+        rows = self.db_manager.execute_query(
+            "SELECT id, page_number, content_hash FROM case_directories WHERE case_id = %s AND file_path = %s",
+            (case_id, old_file_path), primary=True
+        )
+        if not rows:
+            return True
+        
+        updates = []
+        for row in rows:
+            page_number = row['page_number']
+            if page_number is not None and (page_number - 1) in page_map:
+                page_number = page_map[page_number - 1] + 1
+            updates.append((new_file_path, new_content_hash or row['content_hash'], page_number, row['id']))
+        
+        connection = self.db_manager.db_config.get_connection()
+        if not connection:
+            return False
+        
+        try:
+            cursor = connection.cursor()
+            query = "UPDATE case_directories SET file_path = %s, content_hash = %s, page_number = %s WHERE id = %s"
+            cursor.executemany(query, updates)
+            connection.commit()
+            self.db_manager.db_config.mark_write()
+            cursor.close()
+        except mysql.connector.Error as e:
+            print(f"页码重排错误: {e}")
+            connection.rollback()
+            return False
+        finally:
+            self.db_manager.db_config.close_connection(connection)
+        
+        if new_content_hash:
+            for _ in rows:
+                self.content_manager.acquire(new_content_hash)
+            self.content_manager.release_many([row['content_hash'] for row in rows if row['content_hash']])
+        return True
     
     def batch_add_directory_items(self, items: List[Tuple]) -> bool:
         """批量添加目录项"""
@@ -267,6 +754,7 @@ class DirectoryManager:
             """
             cursor.executemany(query, items)
             connection.commit()
+            self.db_manager.db_config.mark_write()
             cursor.close()
             return True
         except mysql.connector.Error as e:
@@ -274,4 +762,245 @@ class DirectoryManager:
             connection.rollback()
             return False
         finally:
-            self.db_manager.db_config.close_connection(connection)
\ No newline at end of file
+            self.db_manager.db_config.close_connection(connection)
+
+
+class PageContentManager:
+    """PDF逐页内容管理类
+    
+    以 doc_key 标识一份文档版本，保存每页的内容指纹、文本和目录候选行，
+    以便修订版只需重新处理发生变化的页面。
+    """
+    
+    def __init__(self, db_manager: DatabaseManager = None):
+        self.db_manager = db_manager or DatabaseManager()
+    
+    def get_fingerprints(self, doc_key: str) -> List[str]:
+        """按页序返回文档的页面指纹"""
+        query = "SELECT fingerprint FROM page_contents WHERE doc_key = %s ORDER BY page_index ASC"
+        rows = self.db_manager.execute_query(query, (doc_key,))
+        return [row['fingerprint'] for row in rows]
+    
+    def get_page(self, doc_key: str, page_index: int) -> Optional[Dict[str, Any]]:
+        """获取单页内容"""
+        query = "SELECT * FROM page_contents WHERE doc_key = %s AND page_index = %s"
+        rows = self.db_manager.execute_query(query, (doc_key, page_index))
+        return rows[0] if rows else None
+    
+    def get_pages_by_ref(self, refs: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+        """按 (doc_key, page_index) 列表一次查询多页内容，返回顺序不定"""
+        if not refs:
+            return []
+        query = f"""
+        SELECT * FROM page_contents WHERE (doc_key, page_index) IN ({', '.join(['(%s, %s)'] * len(refs))})
+        """
+        return self.db_manager.execute_query(query, tuple(value for ref in refs for value in ref))
+    
+    def get_pages(self, doc_key: str, start: int, count: int) -> List[Dict[str, Any]]:
+        """获取从 start 开始的连续 count 页内容（一次查询）"""
+        query = """
+        SELECT * FROM page_contents WHERE doc_key = %s AND page_index >= %s AND page_index < %s 
+        ORDER BY page_index ASC
+        """
+        return self.db_manager.execute_query(query, (doc_key, start, start + count))
+    
+    def save_pages(self, doc_key: str, pages: List[Tuple]) -> bool:
+        """批量保存页面，pages 为 (page_index, fingerprint, text, toc_json, minhash) 元组列表"""
+        if not pages:
+            return True
+        
+        connection = self.db_manager.db_config.get_connection()
+        if not connection:
+            return False
+        
+        try:
+            cursor = connection.cursor()
+            query = """
+            REPLACE INTO page_contents (doc_key, page_index, fingerprint, text, toc_json, minhash, created_at) 
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """
+            now = datetime.datetime.now()
+            cursor.executemany(query, [(doc_key, *page, now) for page in pages])
+            connection.commit()
+            self.db_manager.db_config.mark_write()
+            cursor.close()
+            return True
+        except mysql.connector.Error as e:
+            print(f"保存页面内容错误: {e}")
+            connection.rollback()
+            return False
+        finally:
+            self.db_manager.db_config.close_connection(connection)
+    
+    def copy_pages(self, old_key: str, new_key: str, page_map: Dict[int, int]) -> bool:
+        """把旧版本中未变化的页面复制到新版本，page_map 为 旧页序 -> 新页序"""
+        if not page_map:
+            return True
+        
+        connection = self.db_manager.db_config.get_connection()
+        if not connection:
+            return False
+        
+        try:
+            cursor = connection.cursor()
+            query = """
+            REPLACE INTO page_contents (doc_key, page_index, fingerprint, text, toc_json, minhash, created_at) 
+            SELECT %s, %s, fingerprint, text, toc_json, minhash, %s FROM page_contents 
+            WHERE doc_key = %s AND page_index = %s
+            """
+            now = datetime.datetime.now()
+            cursor.executemany(query, [(new_key, new_index, now, old_key, old_index)
+                                       for old_index, new_index in page_map.items()])
+            connection.commit()
+            self.db_manager.db_config.mark_write()
+            cursor.close()
+            return True
+        except mysql.connector.Error as e:
+            print(f"复制页面内容错误: {e}")
+            connection.rollback()
+            return False
+        finally:
+            self.db_manager.db_config.close_connection(connection)
+    
+    def save_minhashes(self, doc_key: str, pages: List[Tuple[int, bytes]]) -> bool:
+        """批量写入页面的 MinHash 签名，pages 为 (page_index, minhash) 元组列表"""
+        if not pages:
+            return True
+        
+        connection = self.db_manager.db_config.get_connection()
+        if not connection:
+            return False
+        
+        try:
+            cursor = connection.cursor()
+            query = "UPDATE page_contents SET minhash = %s WHERE doc_key = %s AND page_index = %s"
+            cursor.executemany(query, [(minhash, doc_key, page_index) for page_index, minhash in pages])
+            connection.commit()
+            self.db_manager.db_config.mark_write()
+            cursor.close()
+            return True
+        except mysql.connector.Error as e:
+            print(f"保存页面签名错误: {e}")
+            connection.rollback()
+            return False
+        finally:
+            self.db_manager.db_config.close_connection(connection)
+    
+    def get_pages_without_minhash(self, doc_keys: List[str] = None, limit: int = 500) -> List[Dict[str, Any]]:
+        """获取尚未计算签名的页面（doc_keys 为空时不限文档；文字太少的页面保存为空字节，不在其列）"""
+        if doc_keys is not None:
+            doc_keys = list(doc_keys)
+            if not doc_keys:
+                return []
+            doc_clause = f" AND doc_key IN ({', '.join(['%s'] * len(doc_keys))})"
+        else:
+            doc_clause, doc_keys = "", []
+        query = f"""
+        SELECT doc_key, page_index, text FROM page_contents 
+        WHERE minhash IS NULL{doc_clause} LIMIT %s
+        """
+        return self.db_manager.execute_query(query, tuple(doc_keys) + (limit,))
+    
+    def get_user_doc_keys(self, user_id: int) -> List[str]:
+        """用户未删除卷宗中目录项引用的文档"""
+        query = """
+        SELECT DISTINCT COALESCE(d.content_hash, d.file_path) AS doc_key 
+        FROM case_directories d JOIN cases c ON c.id = d.case_id 
+        WHERE c.user_id = %s AND c.is_deleted = 0 
+          AND COALESCE(d.content_hash, d.file_path) IS NOT NULL
+        """
+        return [row['doc_key'] for row in self.db_manager.execute_query(query, (user_id,))]
+    
+    def get_user_minhashes(self, user_id: int) -> List[Dict[str, Any]]:
+        """用户未删除卷宗中所有页面的签名"""
+        query = """
+        SELECT p.doc_key, p.page_index, p.minhash FROM page_contents p 
+        WHERE p.minhash IS NOT NULL AND LENGTH(p.minhash) > 0 AND p.doc_key IN (
+            SELECT COALESCE(d.content_hash, d.file_path) 
+            FROM case_directories d JOIN cases c ON c.id = d.case_id 
+            WHERE c.user_id = %s AND c.is_deleted = 0
+        )
+        ORDER BY p.doc_key, p.page_index
+        """
+        return self.db_manager.execute_query(query, (user_id,))
+    
+    def delete_document(self, doc_key: str) -> bool:
+        """删除文档的全部页面内容"""
+        query = "DELETE FROM page_contents WHERE doc_key = %s"
+        return self.db_manager.execute_update(query, (doc_key,))
+
+class ContentManager:
+    """内容存储引用计数管理类
+    
+    content_objects 记录内容存储中每个对象（以 SHA-256 标识）被多少目录项引用，
+    引用数归零的对象由 ContentStore.gc 回收。
+    """
+    
+    def __init__(self, db_manager: DatabaseManager = None):
+        self.db_manager = db_manager or DatabaseManager()
+    
+    def register_object(self, content_hash: str, size: int) -> bool:
+        """登记存储对象（已存在时不改变引用数）
+        
+        released_at 设为当前时间，使刚上传、尚未被目录项引用的对象在 GC 宽限期内不被回收。
+        """
+        query = """
+        INSERT INTO content_objects (content_hash, size, ref_count, created_at, released_at) 
+        VALUES (%s, %s, 0, %s, %s) 
+        ON DUPLICATE KEY UPDATE released_at = VALUES(released_at)
+        """
+        now = datetime.datetime.now()
+        return self.db_manager.execute_update(query, (content_hash, size, now, now))
+    
+    def acquire(self, content_hash: str) -> bool:
+        """增加一次引用"""
+        query = "UPDATE content_objects SET ref_count = ref_count + 1 WHERE content_hash = %s"
+        return self.db_manager.execute_update(query, (content_hash,))
+    
+    def release(self, content_hash: str, count: int = 1) -> bool:
+        """释放引用"""
+        query = """
+        UPDATE content_objects SET ref_count = GREATEST(ref_count - %s, 0), released_at = %s 
+        WHERE content_hash = %s
+        """
+        return self.db_manager.execute_update(query, (count, datetime.datetime.now(), content_hash))
+    
+    def release_many(self, content_hashes: List[str]) -> bool:
+        """批量释放引用，同一哈希出现几次就释放几次"""
+        counts: Dict[str, int] = {}
+        for content_hash in content_hashes:
+            counts[content_hash] = counts.get(content_hash, 0) + 1
+        return all(self.release(content_hash, count) for content_hash, count in counts.items())
+    
+    def get_object(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """获取存储对象信息"""
+        query = "SELECT * FROM content_objects WHERE content_hash = %s"
+        rows = self.db_manager.execute_query(query, (content_hash,))
+        return rows[0] if rows else None
+    
+    def get_unreferenced(self, released_before: datetime.datetime, limit: int = 100) -> List[str]:
+        """获取在指定时间之前已无引用的对象"""
+        query = """
+        SELECT content_hash FROM content_objects 
+        WHERE ref_count = 0 AND (released_at IS NULL OR released_at < %s) 
+        LIMIT %s
+        """
+        rows = self.db_manager.execute_query(query, (released_before, limit))
+        return [row['content_hash'] for row in rows]
+    
+    def delete_object(self, content_hash: str, released_before: datetime.datetime = None) -> bool:
+        """删除无引用的对象记录，返回是否确实删除了
+        
+        指定 released_before 时，期间被重新登记或引用过的对象不会被删除。
+        """
+        query = "DELETE FROM content_objects WHERE content_hash = %s AND ref_count = 0"
+        params = (content_hash,)
+        if released_before is not None:
+            query += " AND (released_at IS NULL OR released_at < %s)"
+            params += (released_before,)
+        
+        def work(cursor):
+            cursor.execute(query, params)
+            return cursor.rowcount > 0
+        
+        return bool(self.db_manager.run_in_transaction(work))
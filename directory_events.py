@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录修改通知
+
+界面上有几处各自缓存了卷宗目录（预取器缓存顶层目录、快速跳转框建立了文件名索引）。
+ObservedDirectoryManager 包装本地的 DirectoryManager 或服务模式的 RemoteManager，
+转发所有调用，并在目录写操作成功后通知监听者，使这些缓存随之更新。
+"""
+
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+# listener(case_id, rows, removed_ids)：rows 为新增或修改后的目录项，None 表示整个卷宗的目录
+# 都可能已变化（需重新加载）；removed_ids 为删除的目录项ID，含其全部子目录
+DirectoryListener = Callable[[int, Optional[List[Dict[str, Any]]], List[int]], None]
+
+
+class ObservedDirectoryManager:
+    """目录管理器包装：写操作成功后在执行写操作的线程中通知监听者"""
+
+    CASE_WIDE_WRITES = {'remap_page_numbers', 'clear_case_directory'}
+
+    def __init__(self, directory_manager):
+        self.directory_manager = directory_manager
+        self._listeners: List[DirectoryListener] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: DirectoryListener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: DirectoryListener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _notify(self, case_id: int, rows: Optional[List[Dict[str, Any]]], removed_ids: List[int] = ()):
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(case_id, rows, list(removed_ids))
+            except Exception as e:
+                print(f"目录修改通知错误: {e}")
+
+    def __getattr__(self, method: str):
+        attribute = getattr(self.directory_manager, method)
+        if method not in self.CASE_WIDE_WRITES:
+            return attribute
+
+        def case_wide_write(case_id, *args, **kwargs):
+            result = attribute(case_id, *args, **kwargs)
+            if result:
+                self._notify(case_id, None)
+            return result
+
+        return case_wide_write
+
+    def add_directory_item(self, case_id: int, *args, **kwargs) -> Optional[int]:
+        item_id = self.directory_manager.add_directory_item(case_id, *args, **kwargs)
+        if item_id is not None:
+            row = self.directory_manager.get_directory_item(item_id)
+            self._notify(case_id, [row] if row else None)
+        return item_id
+
+    def update_directory_item(self, item_id: int, **kwargs) -> bool:
+        updated = self.directory_manager.update_directory_item(item_id, **kwargs)
+        row = self.directory_manager.get_directory_item(item_id) if updated else None
+        if row:
+            self._notify(row['case_id'], [row])
+        return updated
+
+    def delete_directory_item(self, item_id: int) -> bool:
+        item = self.directory_manager.get_directory_item(item_id)
+        if not item:
+            return self.directory_manager.delete_directory_item(item_id)
+
+        # 删除前取得整棵子树的ID（一次查询卷宗全部目录项，删除操作不常见）
+        children: Dict[Any, List[int]] = {}
+        for row in self.directory_manager.get_directory_by_case(item['case_id']):
+            children.setdefault(row.get('parent_id'), []).append(row['id'])
+        removed_ids, frontier = [], [item_id]
+        while frontier:
+            removed_ids.extend(frontier)
+            frontier = [child for parent in frontier for child in children.get(parent, [])]
+
+        deleted = self.directory_manager.delete_directory_item(item_id)
+        if deleted:
+            self._notify(item['case_id'], [], removed_ids)
+        return deleted
+
+    def batch_add_directory_items(self, items: List[tuple]) -> bool:
+        added = self.directory_manager.batch_add_directory_items(items)
+        if added:
+            for case_id in dict.fromkeys(item[0] for item in items):
+                self._notify(case_id, None)
+        return added
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+卷宗目录树
+
+大型卷宗的目录可能有数万条，且分布在多卷中。这里提供：
+1. DirectoryTree: 以数组存储的紧凑目录节点表，只保存已展开部分
+2. DirectoryTreePanel: 基于 ttk.Treeview 的目录面板，展开节点时才从数据库加载子目录
+"""
+
+import queue
+import threading
+import tkinter as tk
+from array import array
+from tkinter import ttk
+from typing import Any, Callable, Dict, List, Optional
+
+
+class DirectoryTree:
+    """目录节点的紧凑内存表示
+
+    每个节点占用若干并行数组中的一个槽位，而不是一个字典对象；
+    节点折叠时其子孙槽位被回收，因此内存只随已展开的节点数增长。
+    """
+
+    NO_PARENT = -1
+    NO_CHILD = -1
+    NO_PAGE = -1
+
+    def __init__(self):
+        self.ids = array('q')            # 数据库中的目录项ID，0 表示空闲槽位
+        self.parents = array('l')        # 父节点槽位，顶层为 -1
+        self.depths = array('h')
+        self.pages = array('l')          # 页码，无页码为 -1
+        self.child_counts = array('l')
+        self.first_children = array('l')  # 第一个已加载子节点的槽位，无则为 -1
+        self.next_siblings = array('l')   # 下一个已加载兄弟节点的槽位，无则为 -1
+        self.loaded = bytearray()        # 子目录是否已加载
+        self.names: List[Optional[str]] = []
+        self._slots: Dict[int, int] = {}  # 目录项ID -> 槽位
+        self._free: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._slots
+
+    def _alloc(self) -> int:
+        """分配一个槽位，优先复用已回收的槽位"""
+        if self._free:
+            return self._free.pop()
+        self.ids.append(0)
+        self.parents.append(self.NO_PARENT)
+        self.depths.append(0)
+        self.pages.append(self.NO_PAGE)
+        self.child_counts.append(0)
+        self.first_children.append(self.NO_CHILD)
+        self.next_siblings.append(self.NO_CHILD)
+        self.loaded.append(0)
+        self.names.append(None)
+        return len(self.ids) - 1
+
+    def add_nodes(self, rows: List[Dict[str, Any]], parent_id: int = None) -> List[int]:
+        """添加一批同级节点，返回其目录项ID列表"""
+        parent_slot = self._slots[parent_id] if parent_id is not None else self.NO_PARENT
+        added = []
+        for row in rows:
+            item_id = row['id']
+            if item_id in self._slots:
+                continue
+            slot = self._alloc()
+            self.ids[slot] = item_id
+            self.parents[slot] = parent_slot
+            self.depths[slot] = row.get('depth') or 0
+            page_number = row.get('page_number')
+            self.pages[slot] = page_number if page_number is not None else self.NO_PAGE
+            self.child_counts[slot] = row.get('child_count') or 0
+            self.loaded[slot] = 0
+            self.names[slot] = row.get('file_name') or ''
+            self.first_children[slot] = self.NO_CHILD
+            self.next_siblings[slot] = self.NO_CHILD
+            if parent_slot != self.NO_PARENT:
+                self.next_siblings[slot] = self.first_children[parent_slot]
+                self.first_children[parent_slot] = slot
+            self._slots[item_id] = slot
+            added.append(item_id)
+        if parent_slot != self.NO_PARENT:
+            self.loaded[parent_slot] = 1
+        return added
+
+    def is_loaded(self, item_id: int) -> bool:
+        """子目录是否已加载"""
+        slot = self._slots.get(item_id)
+        return slot is not None and bool(self.loaded[slot])
+
+    def has_children(self, item_id: int) -> bool:
+        """节点是否有子目录（不要求已加载）"""
+        slot = self._slots.get(item_id)
+        return slot is not None and self.child_counts[slot] > 0
+
+    def get_node(self, item_id: int) -> Optional[Dict[str, Any]]:
+        """以字典形式返回节点信息"""
+        slot = self._slots.get(item_id)
+        if slot is None:
+            return None
+        parent_slot = self.parents[slot]
+        page_number = self.pages[slot]
+        return {
+            'id': item_id,
+            'parent_id': self.ids[parent_slot] if parent_slot != self.NO_PARENT else None,
+            'depth': self.depths[slot],
+            'file_name': self.names[slot],
+            'page_number': page_number if page_number != self.NO_PAGE else None,
+            'child_count': self.child_counts[slot],
+        }
+
+    def unload_children(self, item_id: int) -> List[int]:
+        """回收节点的全部子孙槽位，返回被移除的目录项ID"""
+        slot = self._slots.get(item_id)
+        if slot is None or not self.loaded[slot]:
+            return []
+
+        # 沿子节点链表只遍历该节点的子树
+        removed = []
+        stack = [self.first_children[slot]]
+        while stack:
+            s = stack.pop()
+            while s != self.NO_CHILD:
+                stack.append(self.first_children[s])
+                next_slot = self.next_siblings[s]
+                removed.append(self.ids[s])
+                del self._slots[self.ids[s]]
+                self.ids[s] = 0
+                self.parents[s] = self.NO_PARENT
+                self.first_children[s] = self.NO_CHILD
+                self.next_siblings[s] = self.NO_CHILD
+                self.names[s] = None
+                self.loaded[s] = 0
+                self._free.append(s)
+                s = next_slot
+        self.first_children[slot] = self.NO_CHILD
+        self.loaded[slot] = 0
+        return removed
+
+    def clear(self):
+        """清空目录树"""
+        self.__init__()
+
+
+class DirectoryTreePanel(tk.Frame):
+    """按需加载的卷宗目录面板
+
+    打开卷宗时只查询顶层目录；节点展开时在后台线程查询下一层，
+    折叠时释放其子孙节点。
+    """
+
+    PLACEHOLDER_SUFFIX = '__placeholder'
+    POLL_INTERVAL_MS = 50
+
+    def __init__(self, parent, directory_manager, case_id: int,
+                 on_select: Callable[[Dict[str, Any]], None] = None,
+                 duplicate_count: Callable[[Dict[str, Any]], int] = None, **kwargs):
+        kwargs.setdefault('bg', 'white')
+        super().__init__(parent, **kwargs)
+        self.directory_manager = directory_manager
+        self.case_id = case_id
+        self.on_select = on_select
+        self.duplicate_count = duplicate_count  # 目录项内容在其他位置重复出现的次数
+        self.tree_data = DirectoryTree()
+        self._results = queue.Queue()
+        self._pending = set()
+
+        self.tree = ttk.Treeview(self, columns=('page',), selectmode='browse')
+        self.tree.heading('#0', text='目录')
+        self.tree.heading('page', text='页码')
+        self.tree.column('#0', width=260, stretch=True)
+        self.tree.column('page', width=60, anchor='center', stretch=False)
+        self.tree.tag_configure('duplicate', foreground='#e67e22')
+
+        scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind('<<TreeviewOpen>>', self._on_open)
+        self.tree.bind('<<TreeviewClose>>', self._on_close)
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+
+        self.reload()
+
+    def reload(self):
+        """重新加载顶层目录"""
+        self.tree.delete(*self.tree.get_children())
+        self.tree_data.clear()
+        self._pending.clear()
+        self._load_children(None)
+
+    def _load_children(self, parent_id: Optional[int]):
+        """在后台线程查询子目录"""
+        if parent_id in self._pending:
+            return
+        self._pending.add(parent_id)
+
+        def worker():
+            try:
+                rows = self.directory_manager.get_child_directories(self.case_id, parent_id)
+            except Exception as e:
+                print(f"加载目录错误: {e}")
+                rows = []
+            self._results.put((parent_id, rows))
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.after(self.POLL_INTERVAL_MS, self._poll_results)
+
+    def _poll_results(self):
+        """在主线程中把查询结果插入目录树"""
+        while True:
+            try:
+                parent_id, rows = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending.discard(parent_id)
+            self._insert_children(parent_id, rows)
+        if self._pending:
+            self.after(self.POLL_INTERVAL_MS, self._poll_results)
+
+    def _insert_children(self, parent_id: Optional[int], rows: List[Dict[str, Any]]):
+        """插入一层子目录"""
+        parent_iid = '' if parent_id is None else str(parent_id)
+        if parent_id is not None:
+            if parent_id not in self.tree_data or not self.tree.exists(parent_iid):
+                return  # 结果返回前节点已被折叠或重新加载
+            placeholder = parent_iid + self.PLACEHOLDER_SUFFIX
+            if self.tree.exists(placeholder):
+                self.tree.delete(placeholder)
+
+        rows_by_id = {row['id']: row for row in rows}
+        for item_id in self.tree_data.add_nodes(rows, parent_id):
+            node = self.tree_data.get_node(item_id)
+            iid = str(item_id)
+            page = node['page_number'] if node['page_number'] is not None else ''
+            text, tags = node['file_name'], ()
+            duplicates = self.duplicate_count(rows_by_id[item_id]) if self.duplicate_count else 0
+            if duplicates:
+                text, tags = f"{text}  [重复 {duplicates}]", ('duplicate',)
+            self.tree.insert(parent_iid, tk.END, iid=iid, text=text, values=(page,), tags=tags)
+            if node['child_count'] > 0:
+                self.tree.insert(iid, tk.END, iid=iid + self.PLACEHOLDER_SUFFIX, text='加载中...')
+
+    def _on_open(self, event):
+        """展开节点时加载子目录"""
+        iid = self.tree.focus()
+        if not iid or iid.endswith(self.PLACEHOLDER_SUFFIX):
+            return
+        item_id = int(iid)
+        if not self.tree_data.is_loaded(item_id) and self.tree_data.has_children(item_id):
+            self._load_children(item_id)
+
+    def _on_close(self, event):
+        """折叠节点时释放子目录"""
+        iid = self.tree.focus()
+        if not iid or iid.endswith(self.PLACEHOLDER_SUFFIX):
+            return
+        item_id = int(iid)
+        if not self.tree_data.is_loaded(item_id):
+            return
+        self.tree_data.unload_children(item_id)
+        self.tree.delete(*self.tree.get_children(iid))
+        self.tree.insert(iid, tk.END, iid=iid + self.PLACEHOLDER_SUFFIX, text='加载中...')
+
+    def _on_select(self, event):
+        """选中目录项时回调"""
+        selection = self.tree.selection()
+        if not selection or selection[0].endswith(self.PLACEHOLDER_SUFFIX):
+            return
+        node = self.tree_data.get_node(int(selection[0]))
+        if node and self.on_select:
+            self.on_select(node)
@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多用户并发压测工具
+
+模拟全所同时登录、浏览卷宗和目录的负载，用 N 个并发线程驱动
+UserManager / CaseManager / DirectoryManager，逐级提高并发数，报告吞吐量、
+p50/p95/p99 延迟、错误率，以及获取数据库连接所占的时间比例，
+用于评估 MySQL 配置和 DatabaseConfig.get_connection 每次新建连接的开销。
+
+示例：
+    # 本地 SQLite 替身，对比每次新建连接与连接池
+    python load_test.py --backend sqlite --connect-latency-ms 3 --compare-pool
+
+    # 真实 MySQL（使用 database_config.py 中的配置，需已建表）
+    python load_test.py --backend mysql --levels 1,4,16,32 --duration 20 --compare-pool
+
+mysql.connector 的连接池最多 32 个连接，对 MySQL 使用连接池时并发数不能超过 32。
+写入的压测数据（用户、会话、卷宗、目录项和统计）在结束时删除，--keep-data 保留。
+"""
+
+import argparse
+import json
+import os
+import queue
+import random
+import re
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List
+
+import mysql.connector
+from mysql.connector.pooling import CNX_POOL_MAXSIZE
+
+from database_config import DatabaseConfig, DatabaseManager, UserManager, CaseManager, DirectoryManager
+
+# 操作权重：登录高峰时以会话校验和列表浏览为主
+WORKLOAD_MIX = [
+    ('authenticate_user', 10),
+    ('validate_session', 25),
+    ('get_cases_by_user', 20),
+    ('get_case_facets', 5),
+    ('update_case', 10),
+    ('get_child_directories', 15),
+    ('get_directory_by_case', 5),
+    ('add_directory_item', 5),
+    ('update_directory_item', 5),
+]
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL,
+    email TEXT, full_name TEXT, is_active INTEGER DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, last_login TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS user_sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, session_token TEXT, created_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_user_sessions_token ON user_sessions (session_token);
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, case_name TEXT NOT NULL, case_number TEXT UNIQUE,
+    client_name TEXT, case_type TEXT, description TEXT, status TEXT DEFAULT 'active',
+    user_id INTEGER, is_deleted INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_cases_user ON cases (user_id, is_deleted, updated_at);
+CREATE INDEX IF NOT EXISTS idx_cases_user_type ON cases (user_id, is_deleted, case_type, updated_at);
+CREATE INDEX IF NOT EXISTS idx_cases_user_status ON cases (user_id, is_deleted, status, updated_at);
+CREATE TABLE IF NOT EXISTS case_stats (
+    user_id INTEGER NOT NULL, case_type TEXT NOT NULL DEFAULT '', status TEXT NOT NULL DEFAULT '',
+    case_count INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (user_id, case_type, status)
+);
+CREATE TABLE IF NOT EXISTS case_directories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, case_id INTEGER, parent_id INTEGER,
+    depth INTEGER DEFAULT 0, sort_order INTEGER DEFAULT 0, file_path TEXT, content_hash TEXT,
+    file_name TEXT, file_type TEXT, page_number INTEGER, created_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_case_directories_parent ON case_directories (case_id, parent_id, sort_order);
+"""
+
+
+class _SQLiteCursor:
+    """把 sqlite3 游标包装成 mysql.connector 游标的接口"""
+
+    def __init__(self, cursor: sqlite3.Cursor, dictionary: bool):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    # MySQL 专有语法到 SQLite 的替换
+    REPLACEMENTS = [
+        ('%s', '?'),
+        ('ON DUPLICATE KEY UPDATE', 'ON CONFLICT DO UPDATE SET'),
+        ('GREATEST(', 'MAX('),
+        (' FOR UPDATE', ''),
+    ]
+
+    VALUES_FUNCTION = re.compile(r'VALUES\((\w+)\)')
+
+    @classmethod
+    def _translate(cls, query: str) -> str:
+        for old, new in cls.REPLACEMENTS:
+            query = query.replace(old, new)
+        return cls.VALUES_FUNCTION.sub(r'excluded.\1', query)
+
+    def execute(self, query: str, params=()):
+        try:
+            self._cursor.execute(self._translate(query), tuple(params))
+        except sqlite3.Error as e:
+            raise mysql.connector.Error(str(e))
+
+    def executemany(self, query: str, seq_params):
+        try:
+            self._cursor.executemany(self._translate(query), [tuple(p) for p in seq_params])
+        except sqlite3.Error as e:
+            raise mysql.connector.Error(str(e))
+
+    def fetchall(self) -> List[Any]:
+        rows = self._cursor.fetchall()
+        if not self._dictionary:
+            return rows
+        columns = [d[0] for d in self._cursor.description or ()]
+        return [dict(zip(columns, row)) for row in rows]
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class _SQLiteConnection:
+    """把 sqlite3 连接包装成 mysql.connector 连接的接口"""
+
+    def __init__(self, path: str, on_close=None):
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._on_close = on_close
+        self._open = True
+
+    def cursor(self, dictionary: bool = False) -> _SQLiteCursor:
+        return _SQLiteCursor(self._conn.cursor(), dictionary)
+
+    def start_transaction(self):
+        self._conn.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        # 默认 autocommit，与 DatabaseConfig 的 'autocommit': True 一致；只提交显式开启的事务
+        if self._conn.in_transaction:
+            self._conn.execute('COMMIT')
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute('ROLLBACK')
+
+    def is_connected(self) -> bool:
+        return self._open
+
+    def close(self):
+        if self._on_close:
+            self._on_close(self)
+        else:
+            self._open = False
+            self._conn.close()
+
+
+class SQLiteDatabaseConfig(DatabaseConfig):
+    """SQLite 替身配置
+
+    connect_latency 模拟建立 MySQL 连接（TCP 握手 + 认证）的耗时；
+    pool_size 大于 0 时复用连接，用于对比每次新建连接的开销。
+    """
+
+    def __init__(self, path: str, connect_latency: float = 0.0, pool_size: int = 0):
+        super().__init__(pool_size=pool_size)
+        self.path = path
+        self.connect_latency = connect_latency
+        self._idle: "queue.Queue[_SQLiteConnection]" = queue.Queue()
+        self._created = 0
+        self._created_lock = threading.Lock()
+
+    def get_connection(self):
+        if self.pool_size:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                with self._created_lock:
+                    can_create = self._created < self.pool_size
+                    if can_create:
+                        self._created += 1
+                if not can_create:
+                    return self._idle.get()
+        if self.connect_latency:
+            time.sleep(self.connect_latency)
+        return _SQLiteConnection(self.path, on_close=self._idle.put if self.pool_size else None)
+
+    def get_read_connection(self):
+        return self.get_connection(), None
+
+
+class _TrackedCursor:
+    """记录语句执行出错的游标包装"""
+
+    def __init__(self, cursor, state: threading.local):
+        self._cursor = cursor
+        self._state = state
+
+    def execute(self, *args, **kwargs):
+        try:
+            return self._cursor.execute(*args, **kwargs)
+        except Exception:
+            self._state.failed = True
+            raise
+
+    def executemany(self, *args, **kwargs):
+        try:
+            return self._cursor.executemany(*args, **kwargs)
+        except Exception:
+            self._state.failed = True
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _TrackedConnection:
+    """游标经过 _TrackedCursor 包装的连接"""
+
+    def __init__(self, connection, state: threading.local):
+        self._connection = connection
+        self._state = state
+
+    def cursor(self, *args, **kwargs):
+        return _TrackedCursor(self._connection.cursor(*args, **kwargs), self._state)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class TimedConfig:
+    """统计 get_connection 耗时的包装
+
+    同时记录当前线程的操作是否遇到取不到连接或语句出错：管理器出错时返回空结果，
+    读操作只靠返回值无法判断成败。
+    """
+
+    def __init__(self, config: DatabaseConfig):
+        self._config = config
+        self._local = threading.local()
+
+    @property
+    def connect_seconds(self) -> float:
+        return getattr(self._local, 'seconds', 0.0)
+
+    @property
+    def failed(self) -> bool:
+        """自上次 begin_operation() 以来是否出错"""
+        return getattr(self._local, 'failed', False)
+
+    def reset(self):
+        self._local.seconds = 0.0
+
+    def begin_operation(self):
+        self._local.failed = False
+
+    def _track(self, connection):
+        if connection is None:
+            self._local.failed = True
+            return None
+        return _TrackedConnection(connection, self._local)
+
+    def get_connection(self):
+        start = time.perf_counter()
+        try:
+            return self._track(self._config.get_connection())
+        except Exception:
+            self._local.failed = True
+            raise
+        finally:
+            self._local.seconds = self.connect_seconds + time.perf_counter() - start
+
+    def get_read_connection(self):
+        start = time.perf_counter()
+        try:
+            connection, replica = self._config.get_read_connection()
+            return self._track(connection), replica
+        except Exception:
+            self._local.failed = True
+            raise
+        finally:
+            self._local.seconds = self.connect_seconds + time.perf_counter() - start
+
+    def close_connection(self, connection):
+        self._config.close_connection(connection)
+
+    def __getattr__(self, name):
+        return getattr(self._config, name)
+
+
+def seed(db_manager: DatabaseManager, users: int, cases_per_user: int, dirs_per_case: int) -> Dict[str, Any]:
+    """写入压测数据，返回可供操作使用的ID"""
+    run_id = uuid.uuid4().hex[:8]
+    user_manager = UserManager(db_manager)
+    password = 'loadtest123'
+    data = {'users': [], 'cases': [], 'directories': [], 'password': password}
+
+    for u in range(users):
+        username = f"loadtest_{run_id}_{u}"
+        user_id = db_manager.execute_insert(
+            "INSERT INTO users (username, password, full_name, is_active) VALUES (%s, %s, %s, 1)",
+            (username, user_manager.hash_password(password), f"压测用户{u}")
+        )
+        if user_id is None:
+            raise RuntimeError("写入压测用户失败，请检查数据库和表结构")
+        token = uuid.uuid4().hex
+        user_manager.create_session(user_id, token)
+        data['users'].append({'id': user_id, 'username': username, 'token': token})
+
+        case_manager = CaseManager(db_manager)
+        directory_manager = DirectoryManager(db_manager)
+        for c in range(cases_per_user):
+            case_id = case_manager.create_case(f"压测卷宗{u}-{c}", f"LT{run_id}{u:04d}{c:04d}",
+                                               f"当事人{c}", '合同纠纷', '', user_id)
+            data['cases'].append({'id': case_id, 'user_id': user_id})
+            for d in range(dirs_per_case):
+                item_id = directory_manager.add_directory_item(case_id, '', f"目录项{d}", 'pdf', d + 1)
+                data['directories'].append({'id': item_id, 'case_id': case_id})
+    return data
+
+
+def cleanup(db_manager: DatabaseManager, data: Dict[str, Any]) -> bool:
+    """删除 seed 写入的压测数据，包括压测期间新增的目录项和会话"""
+    user_ids = [user['id'] for user in data['users']]
+    if not user_ids:
+        return True
+    placeholders = ', '.join(['%s'] * len(user_ids))
+
+    def work(cursor):
+        cursor.execute(f"DELETE FROM case_directories WHERE case_id IN "
+                       f"(SELECT id FROM cases WHERE user_id IN ({placeholders}))", user_ids)
+        for table, column in (('cases', 'user_id'), ('case_stats', 'user_id'),
+                              ('user_sessions', 'user_id'), ('users', 'id')):
+            cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", user_ids)
+        return True
+
+    return bool(db_manager.run_in_transaction(work))
+
+
+class LoadTester:
+    """按工作负载比例并发执行管理器操作"""
+
+    def __init__(self, db_manager: DatabaseManager, timed_config: TimedConfig, data: Dict[str, Any]):
+        self.user_manager = UserManager(db_manager)
+        self.case_manager = CaseManager(db_manager)
+        self.directory_manager = DirectoryManager(db_manager)
+        self.timed_config = timed_config
+        self.data = data
+        self.operations = [name for name, _ in WORKLOAD_MIX]
+        self.weights = [weight for _, weight in WORKLOAD_MIX]
+
+    def run_operation(self, name: str, rng: random.Random) -> bool:
+        """执行一次操作，返回是否成功（返回值表示成功且期间没有连接或语句错误）"""
+        self.timed_config.begin_operation()
+        ok = self._perform(name, rng)
+        return bool(ok) and not self.timed_config.failed
+
+    def _perform(self, name: str, rng: random.Random) -> bool:
+        """执行操作，返回管理器给出的结果是否表示成功；读操作的成败由 timed_config.failed 判断"""
+        user = rng.choice(self.data['users'])
+        case = rng.choice(self.data['cases'])
+        if name == 'authenticate_user':
+            return self.user_manager.authenticate_user(user['username'], self.data['password']) is not None
+        if name == 'validate_session':
+            return self.user_manager.validate_session(user['token']) is not None
+        if name == 'get_cases_by_user':
+            self.case_manager.get_cases_by_user(user['id'])
+            return True
+        if name == 'get_case_facets':
+            self.case_manager.get_case_facets(user['id'])
+            return True
+        if name == 'update_case':
+            return self.case_manager.update_case(case['id'], description=f"压测更新 {time.time()}")
+        if name == 'get_child_directories':
+            self.directory_manager.get_child_directories(case['id'])
+            return True
+        if name == 'get_directory_by_case':
+            self.directory_manager.get_directory_by_case(case['id'])
+            return True
+        if name == 'add_directory_item':
+            return self.directory_manager.add_directory_item(case['id'], '', '压测新增', 'pdf', 1) is not None
+        if name == 'update_directory_item':
+            item = rng.choice(self.data['directories'])
+            return self.directory_manager.update_directory_item(item['id'], page_number=rng.randint(1, 500))
+        raise ValueError(name)
+
+    def run_level(self, concurrency: int, duration: float) -> Dict[str, Any]:
+        """以给定并发数运行 duration 秒"""
+        deadline = time.perf_counter() + duration
+        results = []
+        lock = threading.Lock()
+
+        def worker(seed_value: int):
+            rng = random.Random(seed_value)
+            local = []
+            self.timed_config.reset()
+            while time.perf_counter() < deadline:
+                name = rng.choices(self.operations, self.weights)[0]
+                start = time.perf_counter()
+                connect_before = self.timed_config.connect_seconds
+                try:
+                    ok = self.run_operation(name, rng)
+                except Exception as e:
+                    print(f"压测操作异常 {name}: {e}")
+                    ok = False
+                elapsed = time.perf_counter() - start
+                local.append((name, elapsed, ok, self.timed_config.connect_seconds - connect_before))
+            with lock:
+                results.extend(local)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        return summarize(concurrency, wall, results)
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(concurrency: int, wall: float, results: List[tuple]) -> Dict[str, Any]:
+    """汇总一个并发级别的结果"""
+    latencies = sorted(r[1] for r in results)
+    errors = sum(1 for r in results if not r[2])
+    total_time = sum(r[1] for r in results)
+    connect_time = sum(r[3] for r in results)
+
+    per_operation = defaultdict(list)
+    for name, elapsed, ok, _ in results:
+        per_operation[name].append(elapsed)
+
+    return {
+        'concurrency': concurrency,
+        'operations': len(results),
+        'throughput': len(results) / wall if wall else 0.0,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p95_ms': _percentile(latencies, 95) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+        'error_rate': errors / len(results) if results else 0.0,
+        'connect_share': connect_time / total_time if total_time else 0.0,
+        'per_operation': {
+            name: {
+                'count': len(values),
+                'p50_ms': statistics.median(values) * 1000,
+                'p95_ms': _percentile(sorted(values), 95) * 1000,
+            }
+            for name, values in per_operation.items()
+        },
+    }
+
+
+def print_report(title: str, rows: List[Dict[str, Any]]):
+    print(f"\n== {title} ==")
+    print(f"{'并发':>6} {'吞吐(次/秒)':>12} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} "
+          f"{'错误率':>8} {'连接耗时占比':>12}")
+    for row in rows:
+        print(f"{row['concurrency']:>6} {row['throughput']:>12.1f} {row['p50_ms']:>9.2f} "
+              f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['error_rate']:>8.2%} "
+              f"{row['connect_share']:>12.1%}")
+
+
+def build_config(args, pool_size: int) -> DatabaseConfig:
+    if args.backend == 'sqlite':
+        return SQLiteDatabaseConfig(args.sqlite_path, args.connect_latency_ms / 1000, pool_size)
+    return DatabaseConfig(pool_size=pool_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多用户并发压测")
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--sqlite-path', default=None, help="SQLite 替身数据库文件（默认临时文件）")
+    parser.add_argument('--connect-latency-ms', type=float, default=3.0,
+                        help="SQLite 替身模拟的建立连接耗时")
+    parser.add_argument('--levels', default='1,2,4,8,16,32', help="逐级测试的并发数")
+    parser.add_argument('--duration', type=float, default=10.0, help="每个并发级别的持续秒数")
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--cases-per-user', type=int, default=20)
+    parser.add_argument('--dirs-per-case', type=int, default=30)
+    parser.add_argument('--pool-size', type=int, default=0, help="连接池大小，0 表示每次新建连接")
+    parser.add_argument('--compare-pool', action='store_true', help="依次测试每次新建连接和连接池")
+    parser.add_argument('--output', default=None, help="把结果写入 JSON 文件")
+    parser.add_argument('--keep-data', action='store_true', help="结束后保留写入的压测数据")
+    args = parser.parse_args()
+
+    if args.backend == 'sqlite' and not args.sqlite_path:
+        args.sqlite_path = os.path.join(tempfile.mkdtemp(prefix='legal_loadtest_'), 'loadtest.db')
+    if args.backend == 'sqlite':
+        conn = sqlite3.connect(args.sqlite_path)
+        conn.executescript(SQLITE_SCHEMA)
+        conn.close()
+
+    levels = [int(level) for level in args.levels.split(',') if level.strip()]
+    pool_sizes = [0, max(levels)] if args.compare_pool else [args.pool_size]
+    if args.backend == 'mysql':
+        # mysql.connector 的连接池取不到连接时立即报错而不是等待，且最多 32 个连接
+        for pool_size in pool_sizes:
+            if pool_size > CNX_POOL_MAXSIZE:
+                parser.error(f"mysql.connector 连接池最多 {CNX_POOL_MAXSIZE} 个连接，"
+                             f"请把并发数限制在 {CNX_POOL_MAXSIZE} 以内")
+            if pool_size and pool_size < max(levels):
+                parser.error(f"连接池大小 {pool_size} 小于最大并发数 {max(levels)}，"
+                             f"多出的线程会因取不到连接而失败")
+
+    print("正在写入压测数据...")
+    seed_manager = DatabaseManager(build_config(args, 0))
+    data = seed(seed_manager, args.users, args.cases_per_user, args.dirs_per_case)
+
+    report = {}
+    try:
+        for pool_size in pool_sizes:
+            timed_config = TimedConfig(build_config(args, pool_size))
+            tester = LoadTester(DatabaseManager(timed_config), timed_config, data)
+            title = f"连接池 {pool_size}" if pool_size else "每次新建连接"
+            rows = []
+            for level in levels:
+                print(f"{title}: 并发 {level} ...")
+                rows.append(tester.run_level(level, args.duration))
+            report[title] = rows
+            print_report(title, rows)
+    finally:
+        if not args.keep_data:
+            print("已删除压测数据" if cleanup(seed_manager, data) else "删除压测数据失败")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
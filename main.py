@@ -3,7 +3,20 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
 import threading
 import time
-from database_config import UserManager, CaseManager, DirectoryManager
+from database_config import UserManager, CaseManager, DirectoryManager, PageContentManager
+from directory_events import ObservedDirectoryManager
+from directory_tree import DirectoryTreePanel
+from directory_search import QuickJumpBox
+from chat_history import ChatHistoryStore, ChatPanel
+from content_store import ContentStore
+from pdf_handle import DocumentHandleCache
+from pdf_export import DossierExporter
+from pdf_processor import PDFProcessor
+from prefetcher import CasePrefetcher, PRIORITY_BACKGROUND
+from near_duplicates import LSHIndex, build_user_index
+from service_client import create_remote_managers
+from ui_watchdog import install_if_enabled
+import queue
 import PyPDF2
 import requests
 import json
@@ -12,25 +25,74 @@ import sqlite3
 from datetime import datetime
 
 class PDFChatApp:
-    def __init__(self, root):
+    STATUS_LABELS = {'active': '进行中', 'closed': '已结案', '': '未设置'}
+    RECENT_CASES_TO_WARM = 5        # 登录后预取最近更新的卷宗数
+    HOVER_PREFETCH_DELAY_MS = 300   # 鼠标在卷宗行上停留多久后预取
+    READER_ZOOM = 1.5               # 阅读区页面渲染倍率
+    READER_TEXT_LIMIT = 3000        # 无法渲染时阅读区显示的页面文本字数
+    
+    def __init__(self, root, service_url=None):
         self.root = root
         self.root.title("律师办案智能助手")
         self.root.geometry("1400x900")
         self.root.configure(bg='#f0f0f0')
         
-        # 数据库管理器
-        self.user_manager = UserManager()
-        self.case_manager = CaseManager()
-        self.directory_manager = DirectoryManager()
+        # 数据库管理器；配置了服务地址时作为瘦客户端使用共享服务
+        remote_managers = create_remote_managers(service_url)
+        if remote_managers:
+            self.user_manager = remote_managers['user']
+            self.case_manager = remote_managers['case']
+            directory_manager = remote_managers['directory']
+            # 文件上传到服务端的内容存储，由服务端的提取进程池处理
+            page_manager = remote_managers['pages']
+            content_store = remote_managers['store']
+            pdf_processor = remote_managers['processor']
+            local_store = None
+            print("已连接共享服务")
+        else:
+            self.user_manager = UserManager()
+            self.case_manager = CaseManager()
+            directory_manager = DirectoryManager()
+            page_manager = PageContentManager()
+            # 上传的文件按内容哈希保存，目录项引用存储对象；后台每小时回收无引用的对象
+            content_store = local_store = ContentStore(page_manager=page_manager)
+            content_store.start()
+            pdf_processor = None
+        
+        # 目录写操作经由包装器执行，成功后通知各处的目录缓存
+        self.directory_manager = ObservedDirectoryManager(directory_manager)
+        
+        # 打开的PDF句柄，阅读区、导出、预取和页面处理共用
+        self.document_cache = DocumentHandleCache(max_handles=4)
+        
+        # 后台预取卷宗顶层目录、页面文本和首页渲染结果，目录面板和阅读区经由预取器读取
+        # （服务模式的逐页内容只提供重复页面签名，不预取文本）
+        self.prefetcher = CasePrefetcher(self.directory_manager, content_store=local_store, 
+                                         handle_cache=self.document_cache, 
+                                         page_manager=page_manager if local_store else None, 
+                                         reader_zoom=self.READER_ZOOM)
+        self.directory_manager.add_listener(self.prefetcher.on_directory_change)
+        self._hover_prefetch = None
+        self.page_manager = page_manager
+        self.content_store = content_store
+        self.pdf_processor = pdf_processor or PDFProcessor(page_manager, content_store=content_store, 
+                                                           handle_cache=self.document_cache)
+        self.duplicate_index = None  # 当前用户的重复页面索引，后台建立
+        
+        # 卷宗对话记录保存在本机，后台定期压缩旧分段
+        self.chat_store = ChatHistoryStore()
+        self.chat_store.start()
         
         # 当前用户和卷宗
         self.current_user = None
         self.current_case = None
+        self.case_filters = {'case_type': None, 'status': None}  # 卷宗列表筛选条件，None 表示不限
         self.current_page = "阅卷"  # 当前页面
         
         # PDF相关
         self.pdf_files = []
         self.current_pdf_content = ""
+        self._render_token = None  # 阅读区最近一次渲染请求，用于丢弃过时的结果
         
         # 创建主界面
         self.create_main_interface()
@@ -40,6 +102,14 @@ class PDFChatApp:
         
         # 加载测试数据
         self.load_test_data()
+        
+        # 数据库和当前用户就绪后重新加载卷宗列表（界面创建时尚未登录）
+        self.render_case_filters()
+        self.load_case_list()
+        
+        # 预取最近处理的卷宗，建立重复页面索引
+        self.warm_recent_cases()
+        self.build_duplicate_index()
     
     def init_database(self):
         """初始化SQLite数据库"""
@@ -84,14 +154,89 @@ class PDFChatApp:
                 CREATE TABLE IF NOT EXISTS case_directories (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     case_id INTEGER,
+                    parent_id INTEGER,
+                    depth INTEGER DEFAULT 0,
+                    sort_order INTEGER DEFAULT 0,
                     file_path TEXT,
+                    content_hash TEXT,
                     file_name TEXT,
                     file_type TEXT,
                     page_number INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (case_id) REFERENCES cases (id)
+                    FOREIGN KEY (case_id) REFERENCES cases (id),
+                    FOREIGN KEY (parent_id) REFERENCES case_directories (id)
+                )
+            ''')
+            
+            # 旧版本数据库补充目录层级和内容哈希字段
+            cursor.execute("PRAGMA table_info(case_directories)")
+            existing_columns = {row[1] for row in cursor.fetchall()}
+            for column, definition in [('parent_id', 'INTEGER'),
+                                       ('depth', 'INTEGER DEFAULT 0'),
+                                       ('sort_order', 'INTEGER DEFAULT 0'),
+                                       ('content_hash', 'TEXT')]:
+                if column not in existing_columns:
+                    cursor.execute(f"ALTER TABLE case_directories ADD COLUMN {column} {definition}")
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_case_directories_parent
+                ON case_directories (case_id, parent_id, sort_order)
+            ''')
+            
+            # 卷宗统计表：按 (用户, 案件类型, 状态) 计数，由触发器随 cases 的增删改增量维护
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'case_stats'")
+            stats_exists = cursor.fetchone() is not None
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS case_stats (
+                    user_id INTEGER NOT NULL,
+                    case_type TEXT NOT NULL DEFAULT '',
+                    status TEXT NOT NULL DEFAULT '',
+                    case_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, case_type, status)
                 )
             ''')
+            for name, event, condition, delta, row in [
+                ('trg_case_stats_insert', 'INSERT', 'NEW.is_deleted = 0', 1, 'NEW'),
+                ('trg_case_stats_delete', 'DELETE', 'OLD.is_deleted = 0', -1, 'OLD'),
+                ('trg_case_stats_update_old', 'UPDATE OF user_id, case_type, status, is_deleted',
+                 'OLD.is_deleted = 0', -1, 'OLD'),
+                ('trg_case_stats_update_new', 'UPDATE OF user_id, case_type, status, is_deleted',
+                 'NEW.is_deleted = 0', 1, 'NEW'),
+            ]:
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON cases
+                    WHEN {condition}
+                    BEGIN
+                        INSERT INTO case_stats (user_id, case_type, status, case_count)
+                        VALUES (COALESCE({row}.user_id, 0), COALESCE({row}.case_type, ''),
+                                COALESCE({row}.status, ''), MAX({delta}, 0))
+                        ON CONFLICT (user_id, case_type, status)
+                        DO UPDATE SET case_count = MAX(case_count + ({delta}), 0);
+                    END
+                ''')
+            if not stats_exists:
+                cursor.execute('''
+                    INSERT INTO case_stats (user_id, case_type, status, case_count)
+                    SELECT COALESCE(user_id, 0), COALESCE(case_type, ''), COALESCE(status, ''), COUNT(*)
+                    FROM cases WHERE is_deleted = 0
+                    GROUP BY COALESCE(user_id, 0), COALESCE(case_type, ''), COALESCE(status, '')
+                ''')
+            
+            # 卷宗列表总是按当前用户查询，用户列放在索引最前
+            cursor.execute("DROP INDEX IF EXISTS idx_cases_type")
+            cursor.execute("DROP INDEX IF EXISTS idx_cases_status")
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_cases_user
+                ON cases (user_id, is_deleted, updated_at)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_cases_user_type
+                ON cases (user_id, is_deleted, case_type, updated_at)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_cases_user_status
+                ON cases (user_id, is_deleted, status, updated_at)
+            ''')
             
             conn.commit()
             conn.close()
@@ -153,6 +298,72 @@ class PDFChatApp:
         except Exception as e:
             print(f"测试数据加载错误: {e}")
     
+    def warm_recent_cases(self):
+        """登录后在后台预取当前用户最近更新的卷宗"""
+        if not self.current_user:
+            return
+        try:
+            conn = sqlite3.connect('legal_assistant.db')
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id FROM cases 
+                WHERE user_id = ? AND is_deleted = 0 
+                ORDER BY updated_at DESC LIMIT ?
+            """, (self.current_user['id'], self.RECENT_CASES_TO_WARM))
+            case_ids = [row[0] for row in cursor.fetchall()]
+            conn.close()
+        except Exception as e:
+            print(f"查询最近卷宗错误: {e}")
+            return
+        self.prefetcher.prefetch(case_ids, priority=PRIORITY_BACKGROUND)
+    
+    def build_duplicate_index(self):
+        """在后台为当前用户的卷宗页面建立近似重复索引"""
+        if not self.current_user or not self.page_manager:
+            return
+        user_id = self.current_user['id']
+        # 先把空索引交给处理器：建立期间和之后新处理的页面直接加入这个索引
+        index = LSHIndex()
+        self.duplicate_index = None
+        self.pdf_processor.duplicate_index = index
+        
+        def worker():
+            try:
+                build_user_index(self.page_manager, user_id, index=index)
+                if self.pdf_processor.duplicate_index is index:
+                    self.duplicate_index = index
+            except Exception as e:
+                print(f"建立重复页面索引错误: {e}")
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def directory_duplicate_count(self, row):
+        """目录项首页在当前用户其他位置重复出现的次数（索引未建立时为 0）"""
+        doc_key = row.get('content_hash') or row.get('file_path')
+        if self.duplicate_index is None or not doc_key:
+            return 0
+        page_index = max((row.get('page_number') or 1) - 1, 0)
+        return len(self.duplicate_index.duplicates_of((doc_key, page_index)))
+    
+    def schedule_case_prefetch(self, case_id):
+        """鼠标停留在卷宗行上一段时间后预取该卷宗；移到其他行时改为预取新行"""
+        if self._hover_prefetch:
+            self.root.after_cancel(self._hover_prefetch)
+        self._hover_prefetch = self.root.after(self.HOVER_PREFETCH_DELAY_MS, 
+                                               lambda: self.prefetch_case(case_id))
+    
+    def prefetch_case(self, case_id):
+        """立即预取卷宗"""
+        self._hover_prefetch = None
+        self.prefetcher.prefetch([case_id])
+    
+    def cancel_prefetch(self):
+        """离开卷宗列表时取消尚未完成的预取"""
+        if self._hover_prefetch:
+            self.root.after_cancel(self._hover_prefetch)
+            self._hover_prefetch = None
+        self.prefetcher.cancel_pending()
+    
     def create_main_interface(self):
         """创建主界面"""
         # 创建主框架
@@ -253,6 +464,7 @@ class PDFChatApp:
     def show_add_case(self):
         """显示添加卷宗页面"""
         self.current_page = "添加案件"
+        self.cancel_prefetch()
         self.update_nav_buttons_style()
         
         # 清空内容区域
@@ -291,6 +503,10 @@ class PDFChatApp:
                               relief=tk.FLAT, cursor='hand2')
         search_btn.pack(side=tk.LEFT)
         
+        # 筛选标签
+        self.filter_frame = tk.Frame(self.content_frame, bg='white')
+        self.filter_frame.pack(fill=tk.X, padx=20, pady=(0, 10))
+        
         # 卷宗列表
         list_frame = tk.Frame(self.content_frame, bg='white')
         list_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=(0, 20))
@@ -312,6 +528,60 @@ class PDFChatApp:
         scrollbar.pack(side="right", fill="y")
         
         # 加载卷宗数据
+        self.render_case_filters()
+        self.load_case_list()
+    
+    def render_case_filters(self):
+        """根据 case_stats 统计表绘制当前用户的案件类型和状态筛选标签"""
+        for widget in self.filter_frame.winfo_children():
+            widget.destroy()
+        if not self.current_user:
+            return
+        
+        try:
+            conn = sqlite3.connect('legal_assistant.db')
+            cursor = conn.cursor()
+            # 统计表每个用户只有几十行，按主键前缀读取，汇总代价与卷宗数量无关
+            cursor.execute("""
+                SELECT case_type, status, case_count FROM case_stats 
+                WHERE user_id = ? AND case_count > 0
+            """, (self.current_user['id'],))
+            rows = cursor.fetchall()
+            conn.close()
+        except Exception as e:
+            print(f"加载卷宗统计错误: {e}")
+            return
+        
+        facets = {'case_type': {}, 'status': {}}
+        for case_type, status, count in rows:
+            facets['case_type'][case_type] = facets['case_type'].get(case_type, 0) + count
+            facets['status'][status] = facets['status'].get(status, 0) + count
+        total = sum(count for _, _, count in rows)
+        
+        for row_index, (field, title, labels) in enumerate([
+            ('case_type', "类型:", {'': '未分类'}),
+            ('status', "状态:", self.STATUS_LABELS),
+        ]):
+            row = tk.Frame(self.filter_frame, bg='white')
+            row.pack(fill=tk.X, pady=2)
+            tk.Label(row, text=title, font=('Microsoft YaHei', 10), 
+                    bg='white', fg='#7f8c8d').pack(side=tk.LEFT, padx=(0, 5))
+            
+            chips = [(None, f"全部 ({total})")]
+            chips += [(value, f"{labels.get(value, value)} ({count})")
+                      for value, count in sorted(facets[field].items(), key=lambda item: -item[1])]
+            for value, text in chips:
+                selected = self.case_filters[field] == value
+                tk.Button(row, text=text, font=('Microsoft YaHei', 9), 
+                         bg='#3498db' if selected else '#ecf0f1', 
+                         fg='white' if selected else '#2c3e50', 
+                         relief=tk.FLAT, cursor='hand2', padx=8,
+                         command=lambda f=field, v=value: self.set_case_filter(f, v)).pack(side=tk.LEFT, padx=2)
+    
+    def set_case_filter(self, field, value):
+        """切换筛选条件并刷新列表"""
+        self.case_filters[field] = value
+        self.render_case_filters()
         self.load_case_list()
     
     def create_add_case_content(self):
@@ -385,18 +655,33 @@ class PDFChatApp:
         cancel_btn.pack(side=tk.LEFT)
     
     def load_case_list(self):
-        """加载卷宗列表"""
+        """加载当前用户的卷宗列表"""
+        if not self.current_user:
+            return
         try:
             conn = sqlite3.connect('legal_assistant.db')
             cursor = conn.cursor()
             
-            cursor.execute("""
+            # 筛选条件走 idx_cases_user_type / idx_cases_user_status 索引；
+            # 未分类写成 (= '' OR IS NULL)，不对列套函数，以免用不上索引
+            where = ["user_id = ?", "is_deleted = 0"]
+            params = [self.current_user['id']]
+            for field, value in self.case_filters.items():
+                if value is None:
+                    continue
+                if value == '':
+                    where.append(f"({field} = '' OR {field} IS NULL)")
+                else:
+                    where.append(f"{field} = ?")
+                    params.append(value)
+            
+            cursor.execute(f"""
                 SELECT id, case_name, case_number, client_name, case_type, 
                        created_at, updated_at 
                 FROM cases 
-                WHERE is_deleted = 0 
+                WHERE {' AND '.join(where)} 
                 ORDER BY updated_at DESC
-            """)
+            """, params)
             
             cases = cursor.fetchall()
             conn.close()
@@ -475,6 +760,11 @@ class PDFChatApp:
                             command=lambda: self.edit_case(case_id))
         edit_btn.pack(side=tk.TOP)
         
+        # 鼠标停留或点击卷宗行时预取
+        for widget in [row_frame, info_frame, name_label, details_frame, time_label] + details_frame.winfo_children():
+            widget.bind('<Enter>', lambda e: self.schedule_case_prefetch(case_id))
+            widget.bind('<Button-1>', lambda e: self.prefetch_case(case_id))
+        
         print(f"创建卷宗行: {case_name}")
     
     def save_new_case(self):
@@ -496,7 +786,8 @@ class PDFChatApp:
             cursor.execute("""
                 INSERT INTO cases (case_name, case_number, client_name, case_type, description, user_id) 
                 VALUES (?, ?, ?, ?, ?, ?)
-            """, (case_name, case_number, client_name, case_type, description, 1))  # 假设用户ID为1
+            """, (case_name, case_number, client_name, case_type, description, 
+                  self.current_user['id'] if self.current_user else 1))
             
             conn.commit()
             conn.close()
@@ -510,7 +801,342 @@ class PDFChatApp:
     
     def open_case(self, case_id):
         """打开卷宗"""
-        messagebox.showinfo("提示", f"打开卷宗 ID: {case_id}")
+        try:
+            conn = sqlite3.connect('legal_assistant.db')
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, case_name FROM cases WHERE id = ? AND is_deleted = 0", (case_id,))
+            case = cursor.fetchone()
+            conn.close()
+        except Exception as e:
+            print(f"打开卷宗错误: {e}")
+            messagebox.showerror("错误", f"打开卷宗失败: {e}")
+            return
+        
+        if not case:
+            messagebox.showerror("错误", "卷宗不存在或已删除")
+            return
+        
+        # 句柄缓存按 LRU 限制数量，不在切换卷宗时清空，以保留为该卷宗预先打开的文件
+        self.cancel_prefetch()
+        self.current_case = {'id': case[0], 'case_name': case[1]}
+        
+        # 清空内容区域
+        for widget in self.content_frame.winfo_children():
+            widget.destroy()
+        
+        self.create_case_view_content()
+    
+    def create_case_view_content(self):
+        """创建卷宗阅读内容"""
+        # 标题
+        title_frame = tk.Frame(self.content_frame, bg='white')
+        title_frame.pack(fill=tk.X, padx=20, pady=20)
+        
+        back_btn = tk.Button(title_frame, text="⬅ 返回", 
+                            font=('Microsoft YaHei', 10), 
+                            bg='#95a5a6', fg='white', 
+                            relief=tk.FLAT, cursor='hand2',
+                            command=self.show_case_list)
+        back_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        title_label = tk.Label(title_frame, text=f"📖 {self.current_case['case_name']}", 
+                              font=('Microsoft YaHei', 18, 'bold'), 
+                              fg='#2c3e50', bg='white')
+        title_label.pack(side=tk.LEFT)
+        
+        export_btn = tk.Button(title_frame, text="📤 拆分导出", 
+                              font=('Microsoft YaHei', 10), 
+                              bg='#27ae60', fg='white', 
+                              relief=tk.FLAT, cursor='hand2',
+                              command=self.export_case_documents)
+        export_btn.pack(side=tk.RIGHT)
+        
+        if self.pdf_processor:
+            revision_btn = tk.Button(title_frame, text="🔄 更新版本", 
+                                    font=('Microsoft YaHei', 10), 
+                                    bg='#2980b9', fg='white', 
+                                    relief=tk.FLAT, cursor='hand2',
+                                    command=self.attach_new_version)
+            revision_btn.pack(side=tk.RIGHT, padx=(0, 10))
+        
+        if self.content_store:
+            attach_btn = tk.Button(title_frame, text="📎 添加文件", 
+                                  font=('Microsoft YaHei', 10), 
+                                  bg='#8e44ad', fg='white', 
+                                  relief=tk.FLAT, cursor='hand2',
+                                  command=self.attach_files)
+            attach_btn.pack(side=tk.RIGHT, padx=(0, 10))
+        
+        self.export_status_label = tk.Label(title_frame, text="", 
+                                           font=('Microsoft YaHei', 10), 
+                                           fg='#7f8c8d', bg='white')
+        self.export_status_label.pack(side=tk.RIGHT, padx=10)
+        
+        # 左侧目录，右侧阅读区
+        body_frame = tk.Frame(self.content_frame, bg='white')
+        body_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=(0, 20))
+        
+        directory_frame = tk.Frame(body_frame, bg='white')
+        directory_frame.pack(side=tk.LEFT, fill=tk.Y)
+        
+        self.quick_jump = QuickJumpBox(directory_frame, self.directory_manager, 
+                                       self.current_case['id'], 
+                                       on_jump=self.jump_to_directory_item)
+        self.quick_jump.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        
+        self.directory_panel = DirectoryTreePanel(directory_frame, self.prefetcher, 
+                                                  self.current_case['id'], 
+                                                  on_select=self.on_directory_select, 
+                                                  duplicate_count=self.directory_duplicate_count, 
+                                                  width=320)
+        self.directory_panel.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        
+        self.chat_panel = ChatPanel(body_frame, self.chat_store, self.current_case['id'], width=360)
+        self.chat_panel.pack(side=tk.RIGHT, fill=tk.Y, padx=(10, 0))
+        
+        self.reader_frame = tk.Frame(body_frame, bg='#f8f9fa', relief=tk.SUNKEN, bd=1)
+        self.reader_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=(10, 0))
+        
+        self.page_label = tk.Label(self.reader_frame, text="请在左侧目录中选择文件", 
+                                  font=('Microsoft YaHei', 12), 
+                                  fg='#7f8c8d', bg='#f8f9fa')
+        self.page_label.pack(pady=50)
+        self.selected_directory_node = None
+    
+    def attach_files(self):
+        """把选择的PDF放入内容存储并添加为目录项（选中文件夹时添加到该文件夹下），随后在后台处理页面"""
+        file_paths = filedialog.askopenfilenames(title="选择要添加的文件", 
+                                                 filetypes=[("PDF文件", "*.pdf")])
+        if not file_paths:
+            return
+        
+        node = self.selected_directory_node
+        case_id = self.current_case['id']
+        result_queue = queue.Queue()
+        
+        def worker():
+            parent = self.directory_manager.get_directory_item(node['id']) if node else None
+            parent_id = parent['id'] if parent and parent.get('file_type') == 'folder' else None
+            added = 0
+            for done, file_path in enumerate(file_paths, 1):
+                result_queue.put(('progress', done, len(file_paths)))
+                try:
+                    content_hash, stored_path = self.content_store.put_file(file_path)
+                    item_id = self.directory_manager.add_directory_item(
+                        case_id, stored_path, os.path.basename(file_path), 'pdf', 
+                        page_number=1, parent_id=parent_id, content_hash=content_hash
+                    )
+                    if item_id is None:
+                        continue
+                    added += 1
+                    self.pdf_processor.process_stored(content_hash)
+                except Exception as e:
+                    print(f"添加文件错误: {e}")
+            result_queue.put(('done', added))
+        
+        def poll():
+            while True:
+                try:
+                    message = result_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if not self.export_status_label.winfo_exists():
+                    return
+                if message[0] == 'progress':
+                    self.export_status_label.configure(text=f"添加文件 {message[1]}/{message[2]}")
+                    continue
+                self.export_status_label.configure(text="")
+                self.directory_panel.reload()
+                if message[1] < len(file_paths):
+                    messagebox.showwarning("提示", f"已添加 {message[1]} 个文件，{len(file_paths) - message[1]} 个失败")
+                return
+            self.root.after(100, poll)
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, poll)
+    
+    def attach_new_version(self):
+        """为选中目录项所在的文件附加新版本，只重新处理变化的页面"""
+        node = self.selected_directory_node
+        item = self.directory_manager.get_directory_item(node['id']) if node else None
+        if not item or not item.get('file_path'):
+            messagebox.showinfo("提示", "请先在左侧目录中选择要更新的文件")
+            return
+        new_file_path = filedialog.askopenfilename(title="选择新版本文件", 
+                                                   filetypes=[("PDF文件", "*.pdf")])
+        if not new_file_path:
+            return
+        
+        case_id = self.current_case['id']
+        result_queue = queue.Queue()
+        
+        def worker():
+            try:
+                # 新版本先放入内容存储，目录项改为引用存储对象
+                new_key, stored_path = (self.content_store.put_file(new_file_path) 
+                                        if self.content_store else (None, new_file_path))
+                result = self.pdf_processor.process_revision(
+                    case_id, item['file_path'], stored_path, self.directory_manager,
+                    progress=lambda done, total: result_queue.put(('progress', done, total)),
+                    old_key=item.get('content_hash'), new_key=new_key
+                )
+                result_queue.put(('done', result))
+            except Exception as e:
+                print(f"更新版本错误: {e}")
+                result_queue.put(('error', e))
+        
+        def poll():
+            while True:
+                try:
+                    message = result_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if not self.export_status_label.winfo_exists():
+                    return
+                if message[0] == 'progress':
+                    self.export_status_label.configure(text=f"处理新版本 {message[1]}/{message[2]}")
+                elif message[0] == 'done':
+                    result = message[1]
+                    self.export_status_label.configure(text="")
+                    self.directory_panel.reload()
+                    messagebox.showinfo("更新完成", 
+                                        f"新版本共 {result['page_count']} 页，重新处理 {result['processed_pages']} 页")
+                    return
+                else:
+                    self.export_status_label.configure(text="")
+                    messagebox.showerror("错误", f"更新版本失败: {message[1]}")
+                    return
+            self.root.after(100, poll)
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, poll)
+    
+    def export_case_documents(self):
+        """按目录把卷宗拆分导出为独立PDF"""
+        output_dir = filedialog.askdirectory(title="选择导出目录")
+        if not output_dir:
+            return
+        bundle_zip = messagebox.askyesno("导出", "是否同时打包为ZIP文件？")
+        
+        case_id = self.current_case['id']
+        progress_queue = queue.Queue()
+        cancel_event = threading.Event()
+        
+        cancel_btn = tk.Button(self.export_status_label.master, text="取消导出", 
+                              font=('Microsoft YaHei', 9), 
+                              bg='#e74c3c', fg='white', 
+                              relief=tk.FLAT, cursor='hand2',
+                              command=cancel_event.set)
+        cancel_btn.pack(side=tk.RIGHT, padx=(0, 5))
+        
+        def worker():
+            try:
+                result = DossierExporter(self.directory_manager, handle_cache=self.document_cache).export_case(
+                    case_id, output_dir, bundle_zip=bundle_zip,
+                    progress=lambda done, total, name: progress_queue.put(('progress', done, total)),
+                    cancel_event=cancel_event
+                )
+                progress_queue.put(('done', result))
+            except Exception as e:
+                print(f"导出卷宗错误: {e}")
+                progress_queue.put(('error', e))
+        
+        def poll():
+            while True:
+                try:
+                    message = progress_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if not self.export_status_label.winfo_exists():
+                    cancel_event.set()  # 已离开卷宗页面
+                    return
+                if message[0] == 'progress':
+                    self.export_status_label.configure(text=f"导出中 {message[1]}/{message[2]}")
+                    continue
+                self.export_status_label.configure(text="")
+                cancel_btn.destroy()
+                if message[0] == 'error':
+                    messagebox.showerror("错误", f"导出失败: {message[1]}")
+                    return
+                result = message[1]
+                title = "导出已取消" if result['cancelled'] else "导出完成"
+                messagebox.showinfo(title, 
+                                    f"共 {result['total']} 个文件，新导出 {result['exported']} 个，"
+                                    f"未变化跳过 {result['skipped']} 个")
+                return
+            if not self.export_status_label.winfo_exists():
+                cancel_event.set()
+                return
+            if cancel_event.is_set():
+                self.export_status_label.configure(text="正在取消...")
+            self.root.after(100, poll)
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, poll)
+    
+    def jump_to_directory_item(self, item):
+        """快速跳转：目录项已在目录树中显示时选中它，否则直接跳转到页码"""
+        iid = str(item['id'])
+        tree = self.directory_panel.tree
+        if tree.exists(iid):
+            tree.see(iid)
+            tree.selection_set(iid)  # 触发 on_directory_select
+        else:
+            self.on_directory_select(item)
+    
+    def on_directory_select(self, node):
+        """目录项选中后跳转到对应页码"""
+        self.selected_directory_node = node
+        self._render_token = None
+        if node['page_number'] is None:
+            self.page_label.configure(text=node['file_name'], image='')
+        else:
+            self.page_label.configure(text=f"{node['file_name']}  第 {node['page_number']} 页", image='')
+            self.render_page(node['id'], node['page_number'])
+    
+    def render_page(self, item_id, page_number):
+        """在后台渲染目录项所在文件的指定页，完成后显示在阅读区
+        
+        经由预取器读取：预取过的页面直接使用渲染结果；文件在本机不可用时显示已提取的页面文本。
+        """
+        token = object()
+        self._render_token = token
+        result_queue = queue.Queue()
+        
+        def worker():
+            image = text = None
+            try:
+                item = self.directory_manager.get_directory_item(item_id)
+                file_path = item.get('file_path') if item else None
+                if file_path and os.path.exists(file_path):
+                    rendered = self.prefetcher.get_page_image(item['case_id'], file_path, page_number)
+                    if rendered:
+                        image = Image.frombytes('RGB', rendered[:2], rendered[2])
+                if image is None and item and (item.get('content_hash') or file_path):
+                    text = self.prefetcher.get_page_text(item['case_id'], 
+                                                         item.get('content_hash') or file_path, 
+                                                         page_number - 1)
+            except Exception as e:
+                print(f"渲染页面错误: {e}")
+            result_queue.put((image, text))
+        
+        def poll():
+            if token is not self._render_token or not self.page_label.winfo_exists():
+                return
+            try:
+                image, text = result_queue.get_nowait()
+            except queue.Empty:
+                self.root.after(50, poll)
+                return
+            if image is not None:
+                self.page_photo = ImageTk.PhotoImage(image)
+                self.page_label.configure(image=self.page_photo, compound=tk.TOP)
+            elif text:
+                title = self.page_label.cget('text')
+                self.page_label.configure(text=f"{title}\n\n{text[:self.READER_TEXT_LIMIT]}")
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(50, poll)
     
     def edit_case(self, case_id):
         """编辑卷宗"""
@@ -518,9 +1144,12 @@ class PDFChatApp:
 
 def main():
     root = tk.Tk()
+    watchdog = install_if_enabled(root)
     app = PDFChatApp(root)
     print("主应用程序启动成功")
     root.mainloop()
+    if watchdog:
+        watchdog.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
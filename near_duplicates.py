@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+近似重复页面检测
+
+卷宗中同一份材料经常出现多次：身份证复印件、作为证据附在多卷中的合同等。
+这里为每页文本计算 MinHash 签名（字符 5-gram，64 个哈希函数，用 NumPy 批量计算），
+再用分段 LSH 把相似页面分到同一组：
+
+- 签名保存在 page_contents.minhash 中，随页面内容一起复制和删除
+- 每个用户的卷宗页面建一个 LSHIndex，目录界面据此标记重复文件
+- PDFProcessor 遇到与已处理页面完全相同的页面时复用其结果（见 pdf_processor.py）
+"""
+
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database_config import PageContentManager
+
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+BANDS = 8
+ROWS_PER_BAND = NUM_PERM // BANDS
+MIN_SHINGLES = 8            # 文字太少的页面（空白页、仅有页码）不参与检测
+MAX_BATCH_SHINGLES = 32768  # 每批计算的 shingle 数，临时矩阵约 16 MB（批次过大反而变慢）
+SEED = 20240607             # 固定种子，保证保存的签名在不同进程间可比较
+
+TOO_SHORT = b''              # 文字太少、没有签名的页面在 minhash 列中保存的值
+
+_WHITESPACE = re.compile(r'\s+')
+
+_rng = np.random.default_rng(SEED)
+_SHINGLE_POWERS = _rng.integers(1, 2 ** 63, size=SHINGLE_SIZE, dtype=np.uint64) | np.uint64(1)
+_PERM_A = _rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+_BAND_MULTIPLIERS = _rng.integers(1, 2 ** 63, size=ROWS_PER_BAND, dtype=np.uint64) | np.uint64(1)
+_EMPTY_SIGNATURE = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+
+PageRef = Tuple[str, int]  # (doc_key, page_index)
+
+
+def normalize_text(text: str) -> str:
+    """去掉空白并转为小写，消除排版差异"""
+    return _WHITESPACE.sub('', text or '').lower()
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """把文本切成字符 5-gram 并哈希为 32 位整数（以 uint64 存放）"""
+    codes = np.frombuffer(normalize_text(text).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < SHINGLE_SIZE:
+        return np.empty(0, dtype=np.uint64)
+    windows = np.lib.stride_tricks.sliding_window_view(codes, SHINGLE_SIZE)
+    with np.errstate(over='ignore'):
+        hashes = (windows * _SHINGLE_POWERS).sum(axis=1, dtype=np.uint64)
+        hashes ^= hashes >> np.uint64(29)
+        hashes *= np.uint64(0xBF58476D1CE4E5B9)
+        hashes ^= hashes >> np.uint64(32)
+    return hashes & np.uint64(0xFFFFFFFF)
+
+
+def minhash_signatures(texts: Sequence[str]) -> np.ndarray:
+    """批量计算 MinHash 签名，返回 (页数, 64) 的 uint32 矩阵
+
+    文字太少的页面返回全 0xFFFFFFFF 的空签名，is_empty_signature 可识别。
+    多页的 shingle 拼接后分批计算 (a·x + b) >> 32，再按页分段取最小值。
+    """
+    signatures = np.tile(_EMPTY_SIGNATURE, (len(texts), 1))
+    batch, batch_pages, batch_size = [], [], 0
+
+    def flush():
+        if not batch:
+            return
+        shingles = np.concatenate(batch)
+        offsets = np.cumsum([0] + [len(s) for s in batch[:-1]])
+        with np.errstate(over='ignore'):
+            values = (_PERM_A[:, None] * shingles[None, :] + _PERM_B[:, None]) >> np.uint64(32)
+        signatures[batch_pages] = np.minimum.reduceat(values, offsets, axis=1).T.astype(np.uint32)
+        batch.clear()
+        batch_pages.clear()
+
+    for index, text in enumerate(texts):
+        shingles = shingle_hashes(text)
+        if len(shingles) < MIN_SHINGLES:
+            continue
+        if batch and batch_size + len(shingles) > MAX_BATCH_SHINGLES:
+            flush()
+            batch_size = 0
+        batch.append(shingles)
+        batch_pages.append(index)
+        batch_size += len(shingles)
+    flush()
+    return signatures
+
+
+def is_empty_signature(signature: np.ndarray) -> bool:
+    return bool((signature == _EMPTY_SIGNATURE).all())
+
+
+def signature_to_bytes(signature: np.ndarray) -> bytes:
+    """签名序列化为 256 字节；空签名返回空字节 TOO_SHORT，与尚未计算签名的 NULL 区分"""
+    if is_empty_signature(signature):
+        return TOO_SHORT
+    return signature.astype('<u4').tobytes()
+
+
+def signature_from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype='<u4').astype(np.uint32)
+
+
+def estimate_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """用签名中相同位置相等的比例估计 Jaccard 相似度"""
+    return float(np.mean(a == b))
+
+
+def _band_keys(signatures: np.ndarray) -> np.ndarray:
+    """每个签名每段的哈希键，返回 (n, BANDS) 的 uint64 矩阵"""
+    bands = signatures.reshape(len(signatures), BANDS, ROWS_PER_BAND).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        return (bands * _BAND_MULTIPLIERS).sum(axis=2, dtype=np.uint64)
+
+
+class LSHIndex:
+    """MinHash 分段 LSH 索引
+
+    8 段 × 8 行时，Jaccard 相似度约 0.77 以上的页面大概率落入同一桶；
+    候选再用签名估计的相似度按 threshold 过滤。
+    处理线程加入页面的同时界面线程会查询分组，所有读写都在 _lock 下进行。
+    """
+
+    def __init__(self, threshold: float = 0.8):
+        self.threshold = threshold
+        self.refs: List[PageRef] = []
+        self._positions: Dict[PageRef, int] = {}
+        self._signatures = np.empty((0, NUM_PERM), dtype=np.uint32)
+        self._buckets: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        self._groups: Optional[Dict[int, int]] = None   # 位置 -> 组代表位置
+        self._members: Dict[int, List[int]] = {}        # 组代表位置 -> 组内位置
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.refs)
+
+    def __contains__(self, ref: PageRef) -> bool:
+        with self._lock:
+            return ref in self._positions
+
+    def add(self, refs: Sequence[PageRef], signatures: np.ndarray):
+        """加入一批页面，空签名和已存在的页面被跳过"""
+        with self._lock:
+            self._add(refs, signatures)
+
+    def _add(self, refs: Sequence[PageRef], signatures: np.ndarray):
+        keep = [i for i, ref in enumerate(refs)
+                if ref not in self._positions and not is_empty_signature(signatures[i])]
+        if not keep:
+            return
+        signatures = signatures[keep]
+        start = len(self.refs)
+        for offset, i in enumerate(keep):
+            self._positions[refs[i]] = start + offset
+            self.refs.append(refs[i])
+        self._signatures = np.vstack([self._signatures, signatures])
+        for offset, keys in enumerate(_band_keys(signatures)):
+            for band, key in enumerate(keys.tolist()):
+                self._buckets[(band, key)].append(start + offset)
+        self._groups = None
+
+    def query(self, signature: np.ndarray, exclude: PageRef = None) -> List[Tuple[PageRef, float]]:
+        """查找相似页面，按相似度从高到低返回 [(页面, 相似度)]"""
+        if is_empty_signature(signature):
+            return []
+        band_keys = _band_keys(signature[None, :])[0].tolist()
+        with self._lock:
+            candidates = set()
+            for band, key in enumerate(band_keys):
+                candidates.update(self._buckets.get((band, key), ()))
+            if exclude in self._positions:
+                candidates.discard(self._positions[exclude])
+            if not candidates:
+                return []
+            positions = np.fromiter(candidates, dtype=np.int64)
+            similarities = (self._signatures[positions] == signature).mean(axis=1)
+            order = np.argsort(-similarities)
+            return [(self.refs[positions[i]], float(similarities[i]))
+                    for i in order if similarities[i] >= self.threshold]
+
+    def _ensure_groups(self):
+        """对同桶且相似度达到阈值的页面做并查集合并，结果缓存到下次 add 之前（调用方持有 _lock）"""
+        if self._groups is not None:
+            return
+        parent = list(range(len(self.refs)))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for members in self._buckets.values():
+            if len(members) < 2:
+                continue
+            first = members[0]
+            others = np.array(members[1:], dtype=np.int64)
+            similar = (self._signatures[others] == self._signatures[first]).mean(axis=1) >= self.threshold
+            for other in others[similar].tolist():
+                root_a, root_b = find(first), find(other)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+        self._groups = {}
+        self._members = defaultdict(list)
+        for position in range(len(self.refs)):
+            root = find(position)
+            self._groups[position] = root
+            self._members[root].append(position)
+
+    def groups(self) -> List[List[PageRef]]:
+        """返回包含两页以上的重复组，组内第一页为最早加入的页面"""
+        with self._lock:
+            self._ensure_groups()
+            return [[self.refs[p] for p in members] for members in self._members.values() if len(members) > 1]
+
+    def canonical(self, ref: PageRef) -> Optional[PageRef]:
+        """页面所在重复组的代表页（未索引时返回 None），检索结果可据此折叠重复页"""
+        with self._lock:
+            position = self._positions.get(ref)
+            if position is None:
+                return None
+            self._ensure_groups()
+            return self.refs[self._groups[position]]
+
+    def duplicates_of(self, ref: PageRef) -> List[PageRef]:
+        """与页面同组的其他页面"""
+        with self._lock:
+            position = self._positions.get(ref)
+            if position is None:
+                return []
+            self._ensure_groups()
+            return [self.refs[p] for p in self._members[self._groups[position]] if p != position]
+
+
+def backfill_signatures(page_manager: PageContentManager, doc_keys: Iterable[str] = None,
+                        batch_size: int = 500) -> int:
+    """为尚无签名的已处理页面补算签名，返回补算的页数"""
+    total = 0
+    while True:
+        rows = page_manager.get_pages_without_minhash(doc_keys, batch_size)
+        if not rows:
+            return total
+        signatures = minhash_signatures([row['text'] or '' for row in rows])
+        updates: Dict[str, List[Tuple[int, bytes]]] = defaultdict(list)
+        for row, signature in zip(rows, signatures):
+            updates[row['doc_key']].append((row['page_index'], signature_to_bytes(signature)))
+        for doc_key, pages in updates.items():
+            if not page_manager.save_minhashes(doc_key, pages):
+                return total
+        total += len(rows)
+        if len(rows) < batch_size:
+            return total
+
+
+def build_user_index(page_manager: PageContentManager, user_id: int,
+                     threshold: float = 0.8, index: LSHIndex = None) -> LSHIndex:
+    """为用户所有未删除卷宗中的页面建立 LSH 索引
+
+    传入 index 时加入该索引：调用方可以先把空索引交给 PDFProcessor，
+    建立期间新处理的页面也会被纳入，不会在查询与赋值之间漏掉。
+    """
+    backfill_signatures(page_manager, page_manager.get_user_doc_keys(user_id))
+    index = index if index is not None else LSHIndex(threshold)
+    rows = [row for row in page_manager.get_user_minhashes(user_id) if row['minhash']]
+    if rows:
+        index.add([(row['doc_key'], row['page_index']) for row in rows],
+                  np.vstack([signature_from_bytes(row['minhash']) for row in rows]))
+    index.groups()  # 预先分组，界面查询时无需计算
+    return index
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按目录拆分导出卷宗
+
+根据 case_directories 中的页码计算每个目录项的页范围，在进程池中用 PyMuPDF
+复制页面，为每个目录项生成独立的PDF。输出文件以目录项ID命名，目录调整顺序后
+名称不变。导出目录中的清单文件记录每个输出对应的源文件和页范围，再次导出时跳过
+未变化的输出、删除已不在目录中的旧输出；可选地把结果打包为ZIP。
+"""
+
+import json
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+import fitz  # PyMuPDF
+
+from database_config import DirectoryManager
+from pdf_handle import DocumentHandle, DocumentHandleCache
+
+MANIFEST_NAME = 'export_manifest.json'
+RANGES_PER_TASK = 20
+
+
+def compute_page_ranges(entries: List[Dict[str, Any]], page_count: int) -> List[Dict[str, Any]]:
+    """根据目录项页码（从1开始）计算各目录项的页范围（从0开始，含首尾）
+
+    每个目录项从其页码开始，到下一个起始页更靠后的目录项之前结束，最后一项到文档末尾。
+    """
+    entries = sorted((e for e in entries if e.get('page_number')),
+                     key=lambda e: (e['page_number'], e.get('sort_order') or 0, e['id']))
+    ranges = []
+    for i, entry in enumerate(entries):
+        start = min(entry['page_number'], page_count) - 1
+        end = page_count - 1
+        for following in entries[i + 1:]:
+            if following['page_number'] - 1 > start:
+                end = min(following['page_number'] - 2, page_count - 1)
+                break
+        ranges.append({'entry': entry, 'from_page': start, 'to_page': end})
+    return ranges
+
+
+def safe_file_name(name: str) -> str:
+    """去掉文件名中的非法字符"""
+    name = re.sub(r'[\\/:*?"<>|\r\n\t]+', '_', name).strip(' .')
+    return name[:100] or '未命名'
+
+
+def _export_ranges(source_path: str, jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """在子进程中执行：源文件只打开一次，依次导出多个页范围"""
+    results = []
+    src = fitz.open(source_path)
+    try:
+        for job in jobs:
+            out = fitz.open()
+            try:
+                out.insert_pdf(src, from_page=job['from_page'], to_page=job['to_page'])
+                tmp_path = job['output_path'] + '.part'
+                out.save(tmp_path, garbage=3, deflate=True)
+            finally:
+                out.close()
+            os.replace(tmp_path, job['output_path'])
+            results.append({'name': job['name'], 'size': os.path.getsize(job['output_path'])})
+    finally:
+        src.close()
+    return results
+
+
+class DossierExporter:
+    """卷宗拆分导出器"""
+
+    def __init__(self, directory_manager: DirectoryManager = None, max_workers: int = None,
+                 handle_cache: DocumentHandleCache = None):
+        self.directory_manager = directory_manager or DirectoryManager()
+        self.max_workers = max_workers
+        self.handle_cache = handle_cache  # 与阅读区共用已打开的文档，未提供时临时打开
+
+    def plan(self, case_id: int, output_dir: str) -> List[Dict[str, Any]]:
+        """生成导出任务：只导出叶子目录项，按源文件分组计算页范围"""
+        rows = self.directory_manager.get_directory_by_case(case_id)
+        parent_ids = {row.get('parent_id') for row in rows}
+        leaves = [row for row in rows if row['id'] not in parent_ids and row.get('file_path')]
+
+        by_file: Dict[str, List[Dict[str, Any]]] = {}
+        for row in leaves:
+            by_file.setdefault(row['file_path'], []).append(row)
+
+        jobs = []
+        for source_path, entries in by_file.items():
+            opener = self.handle_cache.open if self.handle_cache else DocumentHandle
+            with opener(source_path) as handle, handle.document() as doc:
+                page_count = doc.page_count
+            for page_range in compute_page_ranges(entries, page_count):
+                entry = page_range['entry']
+                name = f"{entry['id']}_{safe_file_name(entry['file_name'] or '')}.pdf"
+                jobs.append({
+                    'name': name,
+                    'source_path': source_path,
+                    'source_key': self.source_key(source_path, entries[0].get('content_hash')),
+                    'from_page': page_range['from_page'],
+                    'to_page': page_range['to_page'],
+                    'output_path': os.path.join(output_dir, name),
+                })
+        return jobs
+
+    @staticmethod
+    def source_key(source_path: str, content_hash: str = None) -> str:
+        """源文件版本标识：有内容哈希时用哈希，否则用文件大小和修改时间，不必读取整份文件"""
+        if content_hash:
+            return content_hash
+        stat = os.stat(source_path)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def export_case(self, case_id: int, output_dir: str, bundle_zip: bool = False,
+                    progress: Callable[[int, int, str], None] = None,
+                    cancel_event: threading.Event = None) -> Dict[str, Any]:
+        """导出卷宗，返回导出统计；progress(已完成, 总数, 文件名) 在调用线程中回调"""
+        os.makedirs(output_dir, exist_ok=True)
+        jobs = self.plan(case_id, output_dir)
+        manifest = self._load_manifest(output_dir)
+
+        pending = [job for job in jobs if not self._is_current(job, manifest.get(job['name']))]
+        skipped = len(jobs) - len(pending)
+        done = skipped
+        if progress:
+            progress(done, len(jobs), '')
+
+        by_source: Dict[str, List[Dict[str, Any]]] = {}
+        for job in pending:
+            by_source.setdefault(job['source_path'], []).append(job)
+
+        failed = []
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            for source_path, source_jobs in by_source.items():
+                for i in range(0, len(source_jobs), RANGES_PER_TASK):
+                    batch = source_jobs[i:i + RANGES_PER_TASK]
+                    futures[executor.submit(_export_ranges, source_path, batch)] = batch
+
+            for future in as_completed(futures):
+                batch = futures[future]
+                if cancel_event and cancel_event.is_set():
+                    for other in futures:
+                        other.cancel()
+                    break
+                try:
+                    results = future.result()
+                except Exception as e:
+                    print(f"导出失败: {e}")
+                    failed.extend(job['name'] for job in batch)
+                    continue
+                sizes = {result['name']: result['size'] for result in results}
+                for job in batch:
+                    manifest[job['name']] = {
+                        'source_key': job['source_key'],
+                        'from_page': job['from_page'],
+                        'to_page': job['to_page'],
+                        'size': sizes[job['name']],
+                    }
+                    done += 1
+                    if progress:
+                        progress(done, len(jobs), job['name'])
+
+        # 删除目录中已不存在的目录项的旧输出
+        names = {job['name'] for job in jobs}
+        for name in set(manifest) - names:
+            try:
+                os.remove(os.path.join(output_dir, name))
+            except FileNotFoundError:
+                pass
+        manifest = {name: info for name, info in manifest.items() if name in names}
+        self._save_manifest(output_dir, manifest)
+
+        cancelled = bool(cancel_event and cancel_event.is_set())
+        zip_path = None
+        if bundle_zip and not cancelled:
+            zip_path = self.bundle(output_dir, [job['name'] for job in jobs if job['name'] not in failed])
+
+        return {
+            'total': len(jobs),
+            'exported': done - skipped,
+            'skipped': skipped,
+            'failed': failed,
+            'cancelled': cancelled,
+            'zip_path': zip_path,
+        }
+
+    def bundle(self, output_dir: str, names: List[str], zip_name: str = None) -> str:
+        """把导出的文件打包为ZIP，逐个文件流式压缩写入"""
+        zip_path = os.path.join(output_dir, zip_name or f"{os.path.basename(os.path.abspath(output_dir))}.zip")
+        tmp_path = zip_path + '.part'
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+            for name in names:
+                zf.write(os.path.join(output_dir, name), arcname=name)
+        os.replace(tmp_path, zip_path)
+        return zip_path
+
+    def _is_current(self, job: Dict[str, Any], record: Optional[Dict[str, Any]]) -> bool:
+        """输出文件是否与清单记录一致、无需重新导出"""
+        if not record or not os.path.exists(job['output_path']):
+            return False
+        return (record.get('source_key') == job['source_key']
+                and record.get('from_page') == job['from_page']
+                and record.get('to_page') == job['to_page']
+                and record.get('size') == os.path.getsize(job['output_path']))
+
+    def _load_manifest(self, output_dir: str) -> Dict[str, Any]:
+        path = os.path.join(output_dir, MANIFEST_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, output_dir: str, manifest: Dict[str, Any]):
+        path = os.path.join(output_dir, MANIFEST_NAME)
+        tmp_path = path + '.part'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF文档句柄
+
+一份卷宗文件只 mmap 一次，哈希计算以及 PyPDF2 / pdfplumber（通过 open_stream()）
+都在同一块映射内存上读取，避免对几百MB的扫描件反复整读和在堆上复制。
+PyMuPDF 文档按路径打开、由 MuPDF 按需读取，每个句柄只解析一次；fitz.Document
+不是线程安全的，只能在句柄锁内使用。
+DocumentHandleCache 保留少量最近使用的文档句柄，文件被改写或替换后自动重新打开。
+"""
+
+import contextlib
+import hashlib
+import io
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional
+
+import fitz  # PyMuPDF
+
+
+class _MappedReader(io.RawIOBase):
+    """在映射内存上读取的只读文件对象，每个读取者有独立的读写位置"""
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self._view[self._pos:self._pos + len(buffer)]
+        size = len(chunk)
+        buffer[:size] = chunk
+        self._pos += size
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+class DocumentHandle:
+    """一份PDF文件的共享句柄"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self.size = stat.st_size
+        self.signature = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._doc: Optional[fitz.Document] = None
+        self._sha256: Optional[str] = None
+        # 后台处理、预取和阅读区渲染可能在不同线程中使用同一文档，所有访问都须持有此锁
+        self.lock = threading.RLock()
+
+    def sha256(self) -> str:
+        """在映射内存上计算 SHA-256，结果缓存"""
+        if self._sha256 is None:
+            digest = hashlib.sha256()
+            if self._mmap is not None:
+                with memoryview(self._mmap) as view:
+                    digest.update(view)
+            self._sha256 = digest.hexdigest()
+        return self._sha256
+
+    def is_current(self) -> bool:
+        """文件是否仍是打开时的那一份（大小、修改时间和 inode 均未变）
+
+        文件被截断后访问旧映射会触发 SIGBUS，被替换后旧句柄读到的是旧内容。
+        """
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns, stat.st_ino) == self.signature
+
+    @contextlib.contextmanager
+    def document(self) -> Iterator[fitz.Document]:
+        """在句柄锁内使用共享的 PyMuPDF 文档对象：with handle.document() as doc
+
+        按路径打开，由 MuPDF 按需读取，不会整份读入堆内存（PyMuPDF 1.23 的
+        fitz.open(stream=...) 只接受 bytes，交给它映射内存需要先复制整份文件）。
+        逐页的长时间处理可以在 with 块外保留 doc，但每次访问都要重新持有 lock。
+        """
+        with self.lock:
+            if self._doc is None:
+                self._doc = fitz.open(self.file_path)
+            yield self._doc
+
+    def open_stream(self) -> io.BufferedReader:
+        """返回映射内存上的文件对象，可直接传给 PyPDF2.PdfReader 或 pdfplumber.open"""
+        if self._mmap is None:
+            return io.BufferedReader(io.BytesIO(b''))
+        return io.BufferedReader(_MappedReader(memoryview(self._mmap)))
+
+    def close(self):
+        """关闭文档并解除映射"""
+        with self.lock:
+            if self._doc is not None:
+                self._doc.close()
+                self._doc = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # 仍有 open_stream() 返回的读取者未关闭，映射随其回收
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DocumentHandleCache:
+    """按路径缓存打开的文档句柄（LRU）
+
+    正在使用的句柄不会被淘汰关闭；文件的大小、修改时间或 inode 变化后，open()
+    返回新句柄，旧句柄在最后一个使用者释放后关闭。
+    """
+
+    def __init__(self, max_handles: int = 4):
+        self.max_handles = max_handles
+        self._handles: "OrderedDict[str, DocumentHandle]" = OrderedDict()
+        self._pins: Dict[DocumentHandle, int] = {}
+        self._lock = threading.Lock()
+
+    def open(self, file_path: str) -> "_PinnedHandle":
+        """获取句柄，用 with 语句包裹以在使用期间防止被淘汰"""
+        key = os.path.abspath(file_path)
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None and not handle.is_current():
+                del self._handles[key]
+                self._retire(handle)
+                handle = None
+            if handle is None:
+                handle = DocumentHandle(key)
+                self._handles[key] = handle
+            self._handles.move_to_end(key)
+            self._pins[handle] = self._pins.get(handle, 0) + 1
+            self._evict()
+        return _PinnedHandle(self, handle)
+
+    def _release(self, handle: DocumentHandle):
+        with self._lock:
+            self._pins[handle] -= 1
+            if not self._pins[handle]:
+                del self._pins[handle]
+                if self._handles.get(handle.file_path) is not handle:
+                    handle.close()  # 已被新句柄取代
+            self._evict()
+
+    def _retire(self, handle: DocumentHandle):
+        """关闭已从缓存移除的句柄，仍在使用时留到释放时关闭"""
+        if handle not in self._pins:
+            handle.close()
+
+    def _evict(self):
+        """淘汰最久未用且未被使用的句柄"""
+        for key in list(self._handles):
+            if len(self._handles) <= self.max_handles:
+                break
+            if self._handles[key] not in self._pins:
+                self._handles.pop(key).close()
+
+    def clear(self):
+        """关闭全部未被使用的句柄"""
+        with self._lock:
+            for key in list(self._handles):
+                if self._handles[key] not in self._pins:
+                    self._handles.pop(key).close()
+
+
+class _PinnedHandle:
+    """DocumentHandleCache.open 的返回值，退出 with 语句时解除占用"""
+
+    def __init__(self, cache: DocumentHandleCache, handle: DocumentHandle):
+        self._cache = cache
+        self.handle = handle
+
+    def __enter__(self) -> DocumentHandle:
+        return self.handle
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._cache._release(self.handle)
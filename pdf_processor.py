@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF卷宗处理
+
+负责逐页提取文本、识别目录候选行、生成缩略图，并为每页记录内容指纹。
+法院或对方律师发来修订版卷宗时，通过比对指纹只重新处理新增或变化的页面，
+并把已有目录项的页码映射到新版本。
+"""
+
+import contextlib
+import difflib
+import hashlib
+import json
+import os
+import re
+import shutil
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from content_store import ContentStore
+from database_config import DirectoryManager, PageContentManager
+from near_duplicates import LSHIndex, minhash_signatures, signature_to_bytes
+from pdf_handle import DocumentHandleCache
+from toc_locator import TOCLocator
+
+# 目录行格式：序号 + 中文文件名 + 页码
+DIRECTORY_LINE_PATTERNS = [
+    re.compile(r'^\s*(\d+)\s+([一-龥].*?)[\s.·…]+(\d+)\s*$'),            # 1 文件名称 10
+    re.compile(r'^\s*(\d+)[.．、]\s*([一-龥].*?)[\s.·…]+(\d+)\s*$'),      # 1. 文件名称 10
+    re.compile(r'^\s*[(（](\d+)[)）]\s*([一-龥].*?)[\s.·…]+(\d+)\s*$'),   # (1) 文件名称 10
+    re.compile(r'^\s*(\d+)[)）]\s*([一-龥].*?)[\s.·…]+(\d+)\s*$'),        # 1） 文件名称 10
+]
+
+THUMBNAIL_ZOOM = 0.2
+
+
+def parse_directory_lines(text: str) -> List[Dict[str, Any]]:
+    """从一页文本中识别目录行"""
+    entries = []
+    for line in text.splitlines():
+        for pattern in DIRECTORY_LINE_PATTERNS:
+            match = pattern.match(line)
+            if match:
+                entries.append({
+                    'sequence': int(match.group(1)),
+                    'file_name': match.group(2).strip(),
+                    'page_number': int(match.group(3)),
+                })
+                break
+    return entries
+
+
+def page_fingerprint(doc: fitz.Document, page: fitz.Page) -> str:
+    """计算页面内容指纹
+
+    由页面尺寸、内容流和所引用图片的原始数据组成；扫描件的内容流通常完全相同，
+    因此必须把图片数据计入指纹。图片只读取压缩后的原始字节，不做解码。
+    """
+    digest = hashlib.sha1()
+    digest.update(repr(tuple(page.rect)).encode())
+    digest.update(page.read_contents())
+    for image in page.get_images(full=True):
+        digest.update(doc.xref_stream_raw(image[0]) or b'')
+    return digest.hexdigest()
+
+
+def diff_page_fingerprints(old: List[str], new: List[str]
+                           ) -> Tuple[Dict[int, int], List[int], Dict[int, int]]:
+    """比对新旧版本的页面指纹
+
+    返回 (page_map, changed_pages, unchanged)：
+    page_map 把每个旧页序映射到新版本中的页序（被删除的页映射到其后的第一页），
+    changed_pages 为新版本中需要重新处理的页序（新增或被替换的页），
+    unchanged 为内容未变的 旧页序 -> 新页序。
+    """
+    page_map = {}
+    unchanged = {}
+    changed_pages = []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for k in range(i2 - i1):
+                page_map[i1 + k] = j1 + k
+                unchanged[i1 + k] = j1 + k
+            continue
+
+        if tag in ('replace', 'insert'):
+            changed_pages.extend(range(j1, j2))
+
+        for k in range(i2 - i1):
+            # 被替换的页对应到替换块中的同位置页，被删除的页对应到其后的第一页
+            target = min(j1 + k, j2 - 1) if j2 > j1 else j1
+            page_map[i1 + k] = min(target, max(len(new) - 1, 0))
+
+    return page_map, changed_pages, unchanged
+
+
+class PDFProcessor:
+    """PDF卷宗处理器"""
+
+    def __init__(self, page_manager: PageContentManager = None, thumbnail_dir: str = 'thumbnails',
+                 toc_locator: TOCLocator = None, content_store: ContentStore = None,
+                 handle_cache: DocumentHandleCache = None, duplicate_index: LSHIndex = None):
+        self.page_manager = page_manager or PageContentManager()
+        self.thumbnail_dir = thumbnail_dir
+        self.toc_locator = toc_locator or TOCLocator()
+        self.content_store = content_store
+        self.handle_cache = handle_cache or DocumentHandleCache()
+        self.duplicate_index = duplicate_index  # 用户的近似重复页面索引，用于跨文档复用处理结果
+
+    def thumbnail_path(self, doc_key: str, page_index: int) -> str:
+        """缩略图存储路径，内容存储中的文档放在其派生数据目录下，供所有卷宗共享"""
+        if self.content_store and self.content_store.contains(doc_key):
+            return os.path.join(self.content_store.artifact_dir(doc_key), 'thumbnails',
+                                f"{page_index:05d}.png")
+        key_dir = hashlib.sha1(doc_key.encode()).hexdigest()
+        return os.path.join(self.thumbnail_dir, key_dir, f"{page_index:05d}.png")
+
+    def process_stored(self, content_hash: str,
+                       progress: Callable[[int, int], None] = None) -> Dict[str, Any]:
+        """处理内容存储中的文档；同一内容已处理过时直接复用结果"""
+        fingerprints = self.page_manager.get_fingerprints(content_hash)
+        if fingerprints:
+            return {'page_count': len(fingerprints), 'processed_pages': 0}
+        return self.process_document(content_hash, self.content_store.object_path(content_hash), progress)
+
+    def process_document(self, doc_key: str, file_path: str,
+                         progress: Callable[[int, int], None] = None) -> Dict[str, Any]:
+        """完整处理一份文档的全部页面"""
+        with self.handle_cache.open(file_path) as handle:
+            with handle.document() as doc:
+                page_count = doc.page_count
+            pages = self._process_pages(doc, doc_key, range(page_count), progress, lock=handle.lock)
+            self.page_manager.save_pages(doc_key, pages)
+            return {'page_count': page_count, 'processed_pages': len(pages)}
+
+    def extract_directory(self, file_path: str) -> List[Dict[str, Any]]:
+        """提取文档目录，只解析定位到的目录页"""
+        with self.handle_cache.open(file_path) as handle, handle.document() as doc:
+            entries = []
+            for page_index in self.toc_locator.locate(doc):
+                entries.extend(parse_directory_lines(doc[page_index].get_text()))
+            return entries
+
+    def process_revision(self, case_id: int, old_file_path: str, new_file_path: str,
+                         directory_manager: DirectoryManager = None,
+                         progress: Callable[[int, int], None] = None,
+                         old_key: str = None, new_key: str = None) -> Dict[str, Any]:
+        """处理文件的新版本，只重新提取新增或变化的页面
+
+        逐页数据按内容哈希登记：new_key 默认取新文件的 SHA-256（与内容存储的对象哈希一致），
+        old_key 传入目录项记录的内容哈希，未记录时退回旧文件路径。配置了内容存储时新文件先放入
+        存储并登记，目录项随后引用它。无论哪条路径，目录项最后都指向新文件。
+        """
+        directory_manager = directory_manager or DirectoryManager()
+        if new_key is None:
+            if self.content_store:
+                new_key, _ = self.content_store.put_file(new_file_path)
+            else:
+                with self.handle_cache.open(new_file_path) as handle:
+                    new_key = handle.sha256()
+        old_key = old_key or old_file_path
+        new_content_hash = new_key
+
+        old_fingerprints = self.page_manager.get_fingerprints(old_key)
+        if not old_fingerprints:
+            # 旧版本从未处理过：完整处理新版本（同一内容已处理过时复用），页码按原样保留
+            page_count = len(self.page_manager.get_fingerprints(new_key))
+            processed_pages = 0
+            if not page_count:
+                result = self.process_document(new_key, new_file_path, progress)
+                page_count = processed_pages = result['page_count']
+            page_map = {index: index for index in range(page_count)}
+            directory_manager.remap_page_numbers(case_id, old_file_path, new_file_path, page_map,
+                                                 new_content_hash)
+            return {
+                'page_count': page_count,
+                'processed_pages': processed_pages,
+                'reused_pages': page_count - processed_pages,
+                'page_map': page_map,
+            }
+
+        processed_fingerprints = self.page_manager.get_fingerprints(new_key)
+        if processed_fingerprints:
+            # 同一内容已处理过（被其他卷宗处理，或内容未变 old_key == new_key），只需重排目录页码
+            page_map, _, unchanged = diff_page_fingerprints(old_fingerprints, processed_fingerprints)
+            directory_manager.remap_page_numbers(case_id, old_file_path, new_file_path, page_map,
+                                                 new_content_hash)
+            return {
+                'page_count': len(processed_fingerprints),
+                'processed_pages': 0,
+                'reused_pages': len(processed_fingerprints),
+                'page_map': page_map,
+            }
+
+        with self.handle_cache.open(new_file_path) as handle:
+            with handle.document() as doc:
+                page_count = doc.page_count
+                new_fingerprints = [page_fingerprint(doc, page) for page in doc]
+            page_map, changed_pages, unchanged = diff_page_fingerprints(old_fingerprints, new_fingerprints)
+
+            # 未变化的页面直接复用旧版本的文本、目录候选和缩略图
+            self.page_manager.copy_pages(old_key, new_key, unchanged)
+            self._copy_thumbnails(old_key, new_key, unchanged)
+
+            pages = self._process_pages(doc, new_key, changed_pages, progress,
+                                        fingerprints=new_fingerprints, lock=handle.lock)
+            self.page_manager.save_pages(new_key, pages)
+
+            directory_manager.remap_page_numbers(case_id, old_file_path, new_file_path, page_map,
+                                                 new_content_hash)
+
+            return {
+                'page_count': page_count,
+                'processed_pages': len(pages),
+                'reused_pages': len(unchanged),
+                'page_map': page_map,
+            }
+
+    def _process_pages(self, doc: fitz.Document, doc_key: str, page_indexes,
+                       progress: Callable[[int, int], None] = None,
+                       fingerprints: Optional[List[str]] = None, lock=None) -> List[Tuple]:
+        """提取指定页面的文本、目录候选行、MinHash 签名和缩略图
+
+        与已处理页面（本批或 duplicate_index 中）文本完全相同的页面复用其目录候选行，
+        内容指纹也相同时复用缩略图，不再重新渲染。lock 为文档句柄的锁，逐页持有，
+        使阅读区在处理大文件期间仍能渲染同一文档。
+        """
+        lock = lock or contextlib.nullcontext()
+        page_indexes = list(page_indexes)
+        texts = []
+        for page_index in page_indexes:
+            with lock:
+                texts.append(doc[page_index].get_text())
+        signatures = minhash_signatures(texts)
+        # 目录页定位直接使用已提取的文本打分，只有定位到的目录页才做完整的目录行解析
+        text_by_index = dict(zip(page_indexes, texts))
+        with lock:
+            toc_pages = set(self.toc_locator.locate(doc, page_text=text_by_index.get))
+        seen: Dict[str, Tuple[str, int, str, Optional[str]]] = {}  # 文本 -> (doc_key, 页序, 指纹, toc_json)
+        pages = []
+        for done, (page_index, text, signature) in enumerate(zip(page_indexes, texts, signatures), 1):
+            with lock:
+                page = doc[page_index]
+                fingerprint = fingerprints[page_index] if fingerprints else page_fingerprint(doc, page)
+            duplicate = seen.get(text) or self._find_identical_page(text, signature, (doc_key, page_index))
+            if duplicate:
+                toc_json = duplicate[3]
+            else:
+                toc_entries = parse_directory_lines(text) if page_index in toc_pages else []
+                toc_json = json.dumps(toc_entries, ensure_ascii=False) if toc_entries else None
+
+            if not (duplicate and duplicate[2] == fingerprint and
+                    self._link_thumbnail(self.thumbnail_path(duplicate[0], duplicate[1]),
+                                         self.thumbnail_path(doc_key, page_index))):
+                with lock:
+                    self._render_thumbnail(page, doc_key, page_index)
+
+            seen.setdefault(text, (doc_key, page_index, fingerprint, toc_json))
+            pages.append((page_index, fingerprint, text, toc_json, signature_to_bytes(signature)))
+            if progress:
+                progress(done, len(page_indexes))
+
+        if self.duplicate_index is not None:
+            self.duplicate_index.add([(doc_key, page_index) for page_index in page_indexes], signatures)
+        return pages
+
+    def _find_identical_page(self, text: str, signature, ref: Tuple[str, int]
+                             ) -> Optional[Tuple[str, int, str, Optional[str]]]:
+        """在重复索引中查找文本完全相同的已处理页面（签名完全相同的候选一次查询取回）"""
+        if self.duplicate_index is None:
+            return None
+        candidates = [dup_ref for dup_ref, similarity in self.duplicate_index.query(signature, exclude=ref)
+                      if similarity >= 1.0]
+        if not candidates:
+            return None
+        rows = {(row['doc_key'], row['page_index']): row
+                for row in self.page_manager.get_pages_by_ref(candidates)}
+        for dup_key, dup_index in candidates:
+            row = rows.get((dup_key, dup_index))
+            if row and row['text'] == text:
+                return dup_key, dup_index, row['fingerprint'], row['toc_json']
+        return None
+
+    def _render_thumbnail(self, page: fitz.Page, doc_key: str, page_index: int):
+        """生成页面缩略图"""
+        path = self.thumbnail_path(doc_key, page_index)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(THUMBNAIL_ZOOM, THUMBNAIL_ZOOM))
+        pixmap.save(path)
+
+    def _copy_thumbnails(self, old_key: str, new_key: str, page_map: Dict[int, int]):
+        """复用未变化页面的缩略图"""
+        if old_key == new_key:
+            return  # 同一份内容，缩略图已在原位
+        for old_index, new_index in page_map.items():
+            self._link_thumbnail(self.thumbnail_path(old_key, old_index),
+                                 self.thumbnail_path(new_key, new_index))
+
+    def _link_thumbnail(self, source: str, target: str) -> bool:
+        """把已有缩略图硬链接（或复制）到新位置，源文件不存在时返回 False"""
+        if not os.path.exists(source):
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+        return True
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+卷宗预取
+
+律师登录后通常先重新打开最近处理的几个卷宗。CasePrefetcher 在后台预先加载
+卷宗的顶层目录和前几份文件所在页的文本，并提示操作系统预读这些PDF文件，打开卷宗时
+目录面板和阅读区直接命中缓存。鼠标停留或点击的卷宗还会预先渲染第一份文件的页面，
+阅读区选中它时无需再解析和渲染文档。
+
+- 登录后预取最近更新的 N 个卷宗；鼠标停留或点击卷宗行时优先预取该卷宗
+- 单个低优先级后台线程执行，每步之间让出时间片，不与界面争抢
+- 缓存按估算字节数设上限（LRU 淘汰）并有过期时间
+- 离开卷宗列表时 cancel_pending() 取消尚未完成的预取
+- 只缓存预取得到的结果，展开节点、翻页的查询不缓存；目录修改后由 invalidate() 丢弃该卷宗的
+  全部缓存（目录、页面文本和渲染结果），渲染结果还按文件大小和修改时间区分，文件被改写后不再命中
+- 线程优先级和文件预读在 Linux 上用 setpriority / posix_fadvise，Windows 上改用
+  SetThreadPriority 后台模式和顺序读入文件开头一段
+"""
+
+import itertools
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from pdf_handle import DocumentHandle
+
+PRIORITY_INTERACTIVE = 0  # 鼠标停留、点击
+PRIORITY_BACKGROUND = 1   # 登录后预热
+
+WARM_READ_BYTES = 8 * 1024 * 1024    # 没有 posix_fadvise 时预读的文件开头字节数
+WARM_READ_CHUNK = 1024 * 1024
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000  # Windows：同时降低CPU、I/O和内存优先级
+
+
+def _estimate_size(value: Any) -> int:
+    """粗略估算缓存值占用的字节数"""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_estimate_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _lower_thread_priority():
+    """降低当前线程的调度优先级（Linux 上 setpriority 作用于单个线程，Windows 上进入后台模式）"""
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN)
+        except (AttributeError, OSError):
+            pass
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (AttributeError, OSError):
+        pass
+
+
+def _advise_willneed(file_path: str):
+    """提示操作系统把文件读入页缓存，不占用进程内存
+
+    没有 posix_fadvise 的系统（Windows）上顺序读入文件开头一段并丢弃，由系统缓存保留。
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        try:
+            with open(file_path, 'rb') as f:
+                remaining = WARM_READ_BYTES
+                while remaining > 0:
+                    chunk = f.read(min(WARM_READ_CHUNK, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+        except OSError:
+            pass
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _file_signature(file_path: str) -> Optional[Tuple[int, int]]:
+    """文件大小和修改时间，文件不存在时返回 None"""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def render_page_image(handle_cache, file_path: str, page_number: int,
+                      zoom: float) -> Optional[Tuple[int, int, bytes]]:
+    """在文档句柄锁内渲染一页（页码从 1 开始），返回 (宽, 高, RGB 像素)，页码超出范围时返回 None"""
+    opener = handle_cache.open if handle_cache else DocumentHandle
+    with opener(file_path) as handle, handle.document() as doc:
+        if not 1 <= page_number <= doc.page_count:
+            return None
+        pixmap = doc[page_number - 1].get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        return pixmap.width, pixmap.height, pixmap.samples
+
+
+class PrefetchCache:
+    """按估算字节数限制容量的 LRU 缓存，条目在 ttl 秒后过期"""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.used_bytes = 0
+        self._entries: "OrderedDict[Tuple, Tuple[float, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[2]
+
+    def put(self, key: Tuple, value: Any):
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.used_bytes += size
+            while self.used_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def discard_if(self, predicate):
+        """删除键满足条件的条目"""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._remove(key)
+
+    def _remove(self, key: Tuple):
+        self.used_bytes -= self._entries.pop(key)[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CasePrefetcher:
+    """卷宗预取器
+
+    get_child_directories 与 DirectoryManager 同名同参，可直接作为 DirectoryTreePanel
+    的目录来源；get_page_image / get_page_text 供阅读区渲染页面和取页面文本。
+    命中预取结果时立即返回，否则直接查询或渲染（结果不缓存）。
+    """
+
+    def __init__(self, directory_manager, content_store=None,
+                 memory_budget: int = 64 * 1024 * 1024, cache_ttl: float = 300.0,
+                 documents_per_case: int = 5, pace: float = 0.005, handle_cache=None,
+                 page_manager=None, reader_zoom: float = 1.5):
+        self.directory_manager = directory_manager
+        self.content_store = content_store
+        self.handle_cache = handle_cache
+        self.page_manager = page_manager
+        self.reader_zoom = reader_zoom
+        self.documents_per_case = documents_per_case
+        self.pace = pace  # 每步之后让出的时间
+        self.cache = PrefetchCache(memory_budget, cache_ttl)
+        self._tasks: "queue.PriorityQueue[Tuple[int, int, int, int]]" = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._generation = 0
+        self._queued = set()
+        self._versions: Dict[int, int] = {}  # 卷宗ID -> 目录修改次数，避免把修改前查询的结果放入缓存
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='case-prefetch', daemon=True)
+        self._thread.start()
+
+    def get_child_directories(self, case_id: int, parent_id: int = None) -> List[Dict[str, Any]]:
+        """获取子目录，优先使用预取结果"""
+        hit, rows = self.cache.get(('children', case_id, parent_id))
+        if hit:
+            return rows
+        return self.directory_manager.get_child_directories(case_id, parent_id)
+
+    def get_page_image(self, case_id: int, file_path: str, page_number: int
+                       ) -> Optional[Tuple[int, int, bytes]]:
+        """按阅读区的倍率渲染页面，优先使用预取时的渲染结果"""
+        hit, image = self.cache.get(('page', case_id, file_path, _file_signature(file_path), page_number))
+        if hit:
+            return image
+        return render_page_image(self.handle_cache, file_path, page_number, self.reader_zoom)
+
+    def get_page_text(self, case_id: int, doc_key: str, page_index: int) -> Optional[str]:
+        """获取已提取的页面文本，优先使用预取结果"""
+        hit, text = self.cache.get(('text', case_id, doc_key, page_index))
+        if hit:
+            return text
+        if self.page_manager is None:
+            return None
+        page = self.page_manager.get_page(doc_key, page_index)
+        return page['text'] if page else None
+
+    def prefetch(self, case_ids: Iterable[int], priority: int = PRIORITY_INTERACTIVE):
+        """把卷宗加入预取队列（已在队列中的卷宗不重复加入）"""
+        with self._lock:
+            generation = self._generation
+            for case_id in case_ids:
+                if (case_id, priority) in self._queued:
+                    continue
+                self._queued.add((case_id, priority))
+                self._tasks.put((priority, next(self._counter), generation, case_id))
+
+    def cancel_pending(self):
+        """取消尚未完成的预取（已缓存的结果保留）"""
+        with self._lock:
+            self._generation += 1
+            self._queued.clear()
+
+    def invalidate(self, case_id: int):
+        """卷宗目录修改后丢弃其缓存"""
+        with self._lock:
+            self._versions[case_id] = self._versions.get(case_id, 0) + 1
+        self.cache.discard_if(lambda key: key[1] == case_id)
+
+    def on_directory_change(self, case_id: int, rows, removed_ids):
+        """ObservedDirectoryManager 的监听者：目录写操作后丢弃该卷宗的缓存"""
+        self.invalidate(case_id)
+
+    def stop(self):
+        """停止后台线程"""
+        self._stop.set()
+        self.cancel_pending()
+        self._tasks.put((-1, -1, -1, -1))  # 唤醒等待中的线程
+
+    def _is_current(self, generation: int) -> bool:
+        return generation == self._generation and not self._stop.is_set()
+
+    def _run(self):
+        _lower_thread_priority()
+        while not self._stop.is_set():
+            priority, _, generation, case_id = self._tasks.get()
+            if not self._is_current(generation):
+                continue
+            with self._lock:
+                self._queued.discard((case_id, priority))
+            try:
+                self._warm_case(case_id, generation, open_first=priority == PRIORITY_INTERACTIVE)
+            except Exception as e:
+                print(f"预取卷宗 {case_id} 错误: {e}")
+
+    def _put_if_unchanged(self, case_id: int, version: int, key: Tuple, value: Any):
+        """查询或渲染期间卷宗目录未被修改时才放入缓存"""
+        with self._lock:
+            if self._versions.get(case_id, 0) == version:
+                self.cache.put(key, value)
+
+    def _warm_case(self, case_id: int, generation: int, open_first: bool = False):
+        """预取一个卷宗：顶层目录、前几份文件所在页的文本，并预读这些文件；
+        open_first 时按阅读区的倍率渲染第一份文件所在的页"""
+        version = self._versions.get(case_id, 0)
+        rows = self.directory_manager.get_child_directories(case_id)
+        if not self._is_current(generation):
+            return
+        # 查询出错时管理器返回空列表，不缓存
+        if rows:
+            self._put_if_unchanged(case_id, version, ('children', case_id, None), rows)
+        documents = [row for row in rows if row.get('content_hash') or row.get('file_path')]
+        documents = documents[:self.documents_per_case]
+
+        # 目录项所在页（与阅读区、重复页面计数相同的 doc_key 和页序）的文本一次查询取回
+        if self.page_manager is not None and documents:
+            refs = [(row.get('content_hash') or row['file_path'], max((row.get('page_number') or 1) - 1, 0))
+                    for row in documents]
+            for page in self.page_manager.get_pages_by_ref(refs):
+                if page.get('text'):
+                    self._put_if_unchanged(case_id, version,
+                                           ('text', case_id, page['doc_key'], page['page_index']), page['text'])
+
+        for index, row in enumerate(documents):
+            time.sleep(self.pace)
+            if not self._is_current(generation):
+                return
+            file_path = row.get('file_path')
+            if row.get('content_hash') and self.content_store and self.content_store.contains(row['content_hash']):
+                file_path = self.content_store.object_path(row['content_hash'])
+            if not file_path:
+                continue
+            _advise_willneed(file_path)
+            reader_path = row.get('file_path')  # 阅读区按目录项记录的路径渲染
+            if open_first and index == 0 and reader_path and os.path.exists(reader_path):
+                page_number = row.get('page_number') or 1
+                signature = _file_signature(reader_path)
+                image = render_page_image(self.handle_cache, reader_path, page_number, self.reader_zoom)
+                if image:
+                    self._put_if_unchanged(case_id, version,
+                                           ('page', case_id, reader_path, signature, page_number), image)
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+律师办案智能助手 - 服务模式
+
+以单独进程托管 UserManager / CaseManager / DirectoryManager，所有客户端共享
+一个数据库连接池、一份查询缓存、内容存储和一组PDF提取进程，通过本地 HTTP/JSON 接口访问：
+
+    POST /rpc/<manager>/<method>    请求体 {"args": [...], "kwargs": {...}}
+    响应 {"result": ...} 或 {"error": "..."}
+    POST /rpc/extract/<task>        在提取进程池中处理内容存储中的文档
+    POST /upload                    请求体为文件内容，放入内容存储，返回 [内容哈希, 存储路径]
+
+请求格式错误返回 400，数据库连接池耗尽返回 503，客户端可稍后重试。
+
+启动：
+    python service.py --host 127.0.0.1 --port 8765
+
+监听本机以外的地址时必须通过环境变量 LEGAL_ASSISTANT_SERVICE_TOKEN 设置服务令牌。
+
+客户端设置环境变量 LEGAL_ASSISTANT_SERVICE_URL=http://127.0.0.1:8765 后，
+PDFChatApp 通过 service_client.py 使用该服务。
+"""
+
+import argparse
+import asyncio
+import datetime
+import functools
+import ipaddress
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from mysql.connector.errors import PoolError
+
+from archiver import CaseArchiver
+from content_store import ContentStore
+from database_config import (DatabaseConfig, DatabaseManager, UserManager, CaseManager, DirectoryManager,
+                             ContentManager, PageContentManager)
+
+# 允许远程调用的方法；读方法的结果会被缓存，写方法会使同一管理器的缓存失效
+EXPOSED_METHODS = {
+    'user': {
+        'read': {'authenticate_user', 'validate_session'},
+        'write': {'update_last_login', 'create_session'},
+    },
+    'case': {
+        'read': {'get_cases_by_user', 'get_case_by_id', 'get_case_facets', 'find_cases'},
+        'write': {'create_case', 'update_case', 'delete_case', 'restore_case'},
+    },
+    'directory': {
+        'read': {'get_directory_by_case', 'get_directory_index', 'get_directory_item',
+                 'get_child_directories'},
+        'write': {'add_directory_item', 'update_directory_item', 'delete_directory_item',
+                  'clear_case_directory', 'remap_page_numbers', 'batch_add_directory_items'},
+    },
+}
+
+# 不缓存的读方法（认证结果不能复用）
+UNCACHED_METHODS = {'authenticate_user', 'validate_session'}
+
+MAX_BODY_SIZE = 16 * 1024 * 1024
+UPLOAD_PATH = '/upload'
+MAX_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 提取进程内按存储目录复用的处理器（每个进程各自的数据库连接和文档句柄缓存）
+_worker_processors: Dict[str, Any] = {}
+
+
+def _worker_processor(store_root: str):
+    """取得当前提取进程的PDF处理器"""
+    processor = _worker_processors.get(store_root)
+    if processor is None:
+        from pdf_processor import PDFProcessor
+        page_manager = PageContentManager()
+        processor = PDFProcessor(page_manager, content_store=ContentStore(store_root, page_manager=page_manager))
+        _worker_processors[store_root] = processor
+    return processor
+
+
+class _DeferredRemap:
+    """记录 process_revision 的目录页码映射，由客户端经自己的目录管理器执行（使其目录缓存收到通知）"""
+
+    def __init__(self):
+        self.content_hash = None
+
+    def remap_page_numbers(self, case_id, old_file_path, new_file_path, page_map, new_content_hash=None):
+        self.content_hash = new_content_hash
+        return True
+
+
+def _process_stored(store_root: str, content_hash: str) -> Dict[str, Any]:
+    """在提取进程中处理内容存储中的文档"""
+    return _worker_processor(store_root).process_stored(content_hash)
+
+
+def _process_revision(store_root: str, case_id: int, old_file_path: str, new_file_path: str,
+                      old_key: str = None, new_key: str = None) -> Dict[str, Any]:
+    """在提取进程中处理文件的新版本，返回页码映射，不修改目录"""
+    remap = _DeferredRemap()
+    result = _worker_processor(store_root).process_revision(case_id, old_file_path, new_file_path, remap,
+                                                            old_key=old_key, new_key=new_key)
+    # JSON 对象的键只能是字符串，页码映射以 [旧页序, 新页序] 列表返回
+    result['page_map'] = sorted(result['page_map'].items())
+    result['content_hash'] = remap.content_hash
+    return result
+
+
+def _extract_directory(store_root: str, file_path: str) -> List[Dict[str, Any]]:
+    """在提取进程中执行目录提取"""
+    return _worker_processor(store_root).extract_directory(file_path)
+
+
+def _user_minhashes(store_root: str, user_id: int) -> List[list]:
+    """补算用户页面的签名，返回 [doc_key, 页序, 签名十六进制] 列表，供客户端建立重复页面索引"""
+    from near_duplicates import backfill_signatures
+    page_manager = _worker_processor(store_root).page_manager
+    backfill_signatures(page_manager, page_manager.get_user_doc_keys(user_id))
+    return [[row['doc_key'], row['page_index'], row['minhash'].hex()]
+            for row in page_manager.get_user_minhashes(user_id) if row['minhash']]
+
+
+EXTRACTION_TASKS = {
+    'process_stored': _process_stored,
+    'process_revision': _process_revision,
+    'extract_directory': _extract_directory,
+    'user_minhashes': _user_minhashes,
+}
+
+
+def _is_loopback(host: str) -> bool:
+    """监听地址是否只接受本机连接"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class BadRequestError(ValueError):
+    """HTTP 请求格式错误"""
+
+    def __init__(self, status: str, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class QueryCache:
+    """按管理器分区的读结果缓存"""
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[str, Dict[Tuple, Tuple[float, Any]]] = {}
+
+    def get(self, manager: str, key: Tuple) -> Tuple[bool, Any]:
+        entry = self._entries.get(manager, {}).get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return False, None
+        return True, entry[1]
+
+    def put(self, manager: str, key: Tuple, value: Any):
+        partition = self._entries.setdefault(manager, {})
+        if len(partition) >= self.max_entries:
+            partition.clear()
+        partition[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, manager: str):
+        self._entries.pop(manager, None)
+
+
+def _json_default(value):
+    """datetime 等类型序列化为字符串"""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
+
+
+class AssistantService:
+    """托管管理器的异步服务"""
+
+    def __init__(self, pool_size: int = 10, cache_ttl: float = 30.0, token: str = None,
+                 archive_days: int = 0, store_root: str = None, extraction_workers: int = None):
+        self.db_config = DatabaseConfig(pool_size=pool_size)
+        db_manager = DatabaseManager(self.db_config)
+        self.managers = {
+            'user': UserManager(db_manager),
+            'case': CaseManager(db_manager),
+            'directory': DirectoryManager(db_manager),
+        }
+        self.cache = QueryCache(ttl=cache_ttl)
+        self.token = token
+        # 数据库调用是阻塞的，放在与连接池等大的线程池中执行（每个调用同一时刻只占用一个连接）
+        self.db_executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='db')
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        # 服务进程常驻，顺带在后台归档已删除的卷宗；归档使用单独的连接，不占用请求线程池对应的连接池
+        self.archiver = CaseArchiver(DatabaseManager(DatabaseConfig()),
+                                     retention_days=archive_days) if archive_days > 0 else None
+        if self.archiver:
+            self.archiver.start()
+        # 配置了内容存储时接收客户端上传的文件，在提取进程池中处理，并定期回收无引用的对象；
+        # 存储和提取进程同样使用单独的连接
+        self.store_root = store_root
+        self.content_store = ContentStore(
+            store_root, ContentManager(DatabaseManager(DatabaseConfig()))
+        ) if store_root else None
+        self.extraction_executor = ProcessPoolExecutor(max_workers=extraction_workers) if store_root else None
+        if self.content_store:
+            self.content_store.start()
+
+    async def call(self, manager: str, method: str, args: list, kwargs: dict,
+                   client_id: str = None) -> Any:
+        """调用管理器方法，读结果经过缓存，相同的并发读请求只执行一次
+
+        client_id 作为数据库会话标识，使客户端写入后短时间内的查询走主库；这段时间内该客户端的
+        查询也绕过缓存和合并，避免拿到别的客户端从副本读出的旧结果。
+        """
+        if manager == 'extract':
+            return await self._extract(method, args, kwargs)
+
+        methods = EXPOSED_METHODS.get(manager)
+        if not methods or method not in methods['read'] | methods['write']:
+            raise LookupError(f"不支持的方法: {manager}.{method}")
+
+        target = getattr(self.managers[manager], method)
+
+        def bound(*call_args, **call_kwargs):
+            self.db_config.set_session(client_id)
+            return target(*call_args, **call_kwargs)
+
+        loop = asyncio.get_running_loop()
+
+        if method in methods['write']:
+            result = await loop.run_in_executor(self.db_executor, lambda: bound(*args, **kwargs))
+            self.cache.invalidate(manager)
+            if manager == 'directory':
+                self.cache.invalidate('case')
+            return result
+
+        if method in UNCACHED_METHODS or self.db_config.session_recently_wrote(client_id):
+            return await loop.run_in_executor(self.db_executor, lambda: bound(*args, **kwargs))
+
+        key = (method, json.dumps(args, default=_json_default), json.dumps(kwargs, sort_keys=True))
+        hit, value = self.cache.get(manager, key)
+        if hit:
+            return value
+        return await self._single_flight((manager,) + key, manager, key,
+                                         lambda: loop.run_in_executor(self.db_executor,
+                                                                      lambda: bound(*args, **kwargs)))
+
+    async def _extract(self, task: str, args: list, kwargs: dict) -> Any:
+        """在提取进程池中执行PDF处理，相同的并发请求只处理一次（结果不缓存）"""
+        function = EXTRACTION_TASKS.get(task)
+        if function is None:
+            raise LookupError(f"不支持的提取任务: {task}")
+        if self.extraction_executor is None:
+            raise LookupError("服务未配置内容存储（--store-root），不提供PDF处理")
+        loop = asyncio.get_running_loop()
+        key = ('extract', task, json.dumps(args), json.dumps(kwargs, sort_keys=True))
+        job = functools.partial(function, self.store_root, *args, **kwargs)
+        return await self._single_flight(key, 'extract', None,
+                                         lambda: loop.run_in_executor(self.extraction_executor, job))
+
+    async def _single_flight(self, flight_key: Tuple, manager: str, cache_key: Optional[Tuple], start) -> Any:
+        """相同的并发请求只执行一次；cache_key 为 None 时结果不缓存"""
+        future = self._inflight.get(flight_key)
+        if future is None:
+            future = asyncio.ensure_future(start())
+            self._inflight[flight_key] = future
+            try:
+                result = await future
+                if cache_key is not None:
+                    self.cache.put(manager, cache_key, result)
+                return result
+            finally:
+                self._inflight.pop(flight_key, None)
+        return await asyncio.shield(future)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个客户端连接（支持 keep-alive）"""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    path, headers, body = request
+                    if body is None:
+                        status, payload = await self._receive_upload(reader, headers)
+                    else:
+                        status, payload = await self._dispatch(path, headers, body)
+                except BadRequestError as e:
+                    # 请求体长度不可信或未读取，无法继续读取同一连接上的后续请求
+                    await self._write_response(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    break
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _write_response(self, writer: asyncio.StreamWriter, status: str, payload: Dict[str, Any],
+                              keep_alive: bool):
+        """写出一个 JSON 响应"""
+        data = json.dumps(payload, ensure_ascii=False, default=_json_default).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('ascii') + data
+        )
+        await writer.drain()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, Dict[str, str], bytes]]:
+        """读取一个HTTP请求，连接关闭时返回 None，Content-Length 无效时抛出 BadRequestError
+
+        上传请求不在这里读取请求体（body 为 None），由 _receive_upload 边读边写入文件。
+        """
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        parts = request_line.decode('latin-1').split()
+        if len(parts) < 2:
+            return None
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        raw_length = headers.get('content-length') or '0'
+        try:
+            length = int(raw_length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise BadRequestError('400 Bad Request', f"无效的 Content-Length: {raw_length}")
+        limit = MAX_UPLOAD_SIZE if parts[1] == UPLOAD_PATH else MAX_BODY_SIZE
+        if length > limit:
+            raise BadRequestError('413 Payload Too Large', f"请求体超过 {limit} 字节")
+        if parts[1] == UPLOAD_PATH:
+            return parts[1], headers, None
+        body = await reader.readexactly(length) if length else b''
+        return parts[1], headers, body
+
+    async def _receive_upload(self, reader: asyncio.StreamReader, headers: Dict[str, str]
+                              ) -> Tuple[str, Dict[str, Any]]:
+        """把上传的文件写入存储的临时目录后导入内容存储
+
+        令牌无效或未配置存储时不读取请求体，抛出 BadRequestError 使连接随响应关闭。
+        """
+        if self.token and headers.get('x-service-token') != self.token:
+            raise BadRequestError('403 Forbidden', '无效的服务令牌')
+        if self.content_store is None:
+            raise BadRequestError('404 Not Found', "服务未配置内容存储（--store-root）")
+
+        remaining = int(headers.get('content-length') or 0)
+        tmp_path = os.path.join(self.content_store.tmp_dir, f"upload-{uuid.uuid4().hex}")
+        try:
+            with open(tmp_path, 'wb') as f:
+                while remaining:
+                    chunk = await reader.readexactly(min(UPLOAD_CHUNK_SIZE, remaining))
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            loop = asyncio.get_running_loop()
+            content_hash, stored_path = await loop.run_in_executor(self.db_executor,
+                                                                   self.content_store.put_file, tmp_path)
+            return '200 OK', {'result': [content_hash, stored_path]}
+        except PoolError as e:
+            print(f"数据库连接池耗尽: {e}")
+            return '503 Service Unavailable', {'error': "数据库连接繁忙，请稍后重试"}
+        except OSError as e:
+            print(f"接收上传文件错误: {e}")
+            return '500 Internal Server Error', {'error': str(e)}
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def _dispatch(self, path: str, headers: Dict[str, str], body: bytes) -> Tuple[str, Dict[str, Any]]:
+        """把 /rpc/<manager>/<method> 请求分派到管理器"""
+        if self.token and headers.get('x-service-token') != self.token:
+            return '403 Forbidden', {'error': '无效的服务令牌'}
+
+        segments = path.strip('/').split('/')
+        if len(segments) != 3 or segments[0] != 'rpc':
+            return '404 Not Found', {'error': f"未知路径: {path}"}
+
+        try:
+            request = json.loads(body.decode('utf-8')) if body else {}
+        except ValueError as e:
+            return '400 Bad Request', {'error': f"无效的请求体: {e}"}
+        if not isinstance(request, dict):
+            return '400 Bad Request', {'error': "请求体必须是 JSON 对象"}
+
+        try:
+            result = await self.call(segments[1], segments[2],
+                                     request.get('args', []), request.get('kwargs', {}),
+                                     client_id=headers.get('x-client-id'))
+            return '200 OK', {'result': result}
+        except LookupError as e:
+            return '404 Not Found', {'error': str(e)}
+        except PoolError as e:
+            print(f"数据库连接池耗尽: {e}")
+            return '503 Service Unavailable', {'error': "数据库连接繁忙，请稍后重试"}
+        except Exception as e:
+            print(f"服务调用错误: {e}")
+            return '500 Internal Server Error', {'error': str(e)}
+
+    async def serve(self, host: str, port: int):
+        """启动服务并一直运行；监听本机以外的地址时必须设置服务令牌"""
+        if not self.token and not _is_loopback(host):
+            raise ValueError(f"监听 {host} 时必须设置服务令牌（环境变量 LEGAL_ASSISTANT_SERVICE_TOKEN）")
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"服务已启动: http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    def shutdown(self):
+        """关闭线程池、提取进程池和归档任务"""
+        if self.archiver:
+            self.archiver.stop()
+        if self.content_store:
+            self.content_store.stop()
+        if self.extraction_executor:
+            self.extraction_executor.shutdown(wait=False)
+        self.db_executor.shutdown(wait=False)
+
+
+def main():
+    """服务入口"""
+    parser = argparse.ArgumentParser(description="律师办案智能助手服务模式")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--pool-size', type=int, default=10, help="数据库连接池大小")
+    parser.add_argument('--cache-ttl', type=float, default=30.0, help="查询缓存有效期（秒）")
+    parser.add_argument('--archive-days', type=int, default=0, help="归档删除超过多少天的卷宗，0 表示不归档")
+    parser.add_argument('--store-root', default='content_store',
+                        help="内容存储目录：接收客户端上传的文件，每小时回收无引用的对象")
+    parser.add_argument('--extraction-workers', type=int, default=None, help="PDF提取进程数")
+    args = parser.parse_args()
+
+    service = AssistantService(pool_size=args.pool_size,
+                               cache_ttl=args.cache_ttl,
+                               archive_days=args.archive_days,
+                               store_root=args.store_root,
+                               extraction_workers=args.extraction_workers,
+                               token=os.environ.get('LEGAL_ASSISTANT_SERVICE_TOKEN'))
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n服务已停止")
+    except ValueError as e:
+        print(f"服务启动失败: {e}")
+    finally:
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
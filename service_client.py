@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务模式客户端
+
+RemoteManager 与 UserManager / CaseManager / DirectoryManager 方法签名相同，
+方法调用通过 HTTP/JSON 转发给 service.py 托管的共享管理器。RemoteContentStore、
+RemotePDFProcessor 和 RemotePageManager 分别代替本地的内容存储、PDF处理器和逐页内容，
+文件上传到服务端的内容存储，由服务端的提取进程池处理。
+"""
+
+import os
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+SERVICE_URL_ENV = 'LEGAL_ASSISTANT_SERVICE_URL'
+SERVICE_TOKEN_ENV = 'LEGAL_ASSISTANT_SERVICE_TOKEN'
+
+
+class ServiceClient:
+    """服务连接（复用 HTTP keep-alive 连接）"""
+
+    def __init__(self, base_url: str, token: str = None, timeout: float = 30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['X-Client-Id'] = uuid.uuid4().hex
+        if token:
+            self.session.headers['X-Service-Token'] = token
+
+    def call(self, manager: str, method: str, *args, **kwargs) -> Any:
+        """调用远程方法，失败时打印错误并返回 None"""
+        return self._post(f"/rpc/{manager}/{method}", json={'args': list(args), 'kwargs': kwargs})
+
+    def upload(self, file_path: str) -> Optional[List[str]]:
+        """把文件上传到服务端的内容存储（流式发送），返回 [内容哈希, 存储路径]，失败时返回 None"""
+        try:
+            with open(file_path, 'rb') as f:
+                return self._post('/upload', data=f)
+        except OSError as e:
+            print(f"读取上传文件错误: {e}")
+            return None
+
+    def _post(self, path: str, **kwargs) -> Any:
+        try:
+            response = self.session.post(f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+            payload = response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"服务连接错误: {e}")
+            return None
+
+        if 'error' in payload:
+            print(f"服务调用错误: {payload['error']}")
+            return None
+        return payload.get('result')
+
+
+class RemoteManager:
+    """远程管理器代理"""
+
+    # 与本地管理器失败时的返回值保持一致
+    LIST_METHODS = {'get_cases_by_user', 'find_cases', 'get_directory_by_case', 'get_directory_index',
+                    'get_child_directories'}
+    BOOL_PREFIXES = ('update_', 'delete_', 'restore_', 'clear_', 'remap_', 'batch_', 'create_session')
+
+    def __init__(self, client: ServiceClient, name: str):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, method: str):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def remote_call(*args, **kwargs):
+            result = self._client.call(self._name, method, *args, **kwargs)
+            if result is None:
+                if method in self.LIST_METHODS:
+                    return []
+                if method.startswith(self.BOOL_PREFIXES):
+                    return False
+            return result
+
+        remote_call.__name__ = method
+        return remote_call
+
+
+class RemoteContentStore:
+    """服务端内容存储的代理"""
+
+    def __init__(self, client: ServiceClient):
+        self._client = client
+
+    def put_file(self, source_path: str,
+                 progress: Callable[[int, int], None] = None) -> Tuple[str, str]:
+        """上传文件，返回 (内容哈希, 服务端存储路径)"""
+        result = self._client.upload(source_path)
+        if result is None:
+            raise IOError(f"上传文件失败: {source_path}")
+        return result[0], result[1]
+
+
+class RemotePDFProcessor:
+    """服务端提取进程池的代理，方法签名与 PDFProcessor 相同（不报告逐页进度）"""
+
+    def __init__(self, client: ServiceClient):
+        self._client = client
+        self.duplicate_index = None  # 服务端处理的页面在下次建立索引时纳入
+
+    def _extract(self, task: str, *args, **kwargs) -> Any:
+        result = self._client.call('extract', task, *args, **kwargs)
+        if result is None:
+            raise RuntimeError(f"服务端处理失败: {task}")
+        return result
+
+    def process_stored(self, content_hash: str,
+                       progress: Callable[[int, int], None] = None) -> Dict[str, Any]:
+        return self._extract('process_stored', content_hash)
+
+    def extract_directory(self, file_path: str) -> List[Dict[str, Any]]:
+        return self._extract('extract_directory', file_path)
+
+    def process_revision(self, case_id: int, old_file_path: str, new_file_path: str,
+                         directory_manager=None, progress: Callable[[int, int], None] = None,
+                         old_key: str = None, new_key: str = None) -> Dict[str, Any]:
+        """服务端比对并处理新版本，页码映射经由传入的目录管理器执行，使本机的目录缓存收到通知"""
+        result = self._extract('process_revision', case_id, old_file_path, new_file_path,
+                               old_key=old_key, new_key=new_key)
+        result['page_map'] = {old: new for old, new in result['page_map']}
+        directory_manager.remap_page_numbers(case_id, old_file_path, new_file_path, result['page_map'],
+                                             result.pop('content_hash'))
+        return result
+
+
+class RemotePageManager:
+    """建立重复页面索引所需的逐页签名，由服务端补算后返回"""
+
+    def __init__(self, client: ServiceClient):
+        self._client = client
+
+    def get_user_doc_keys(self, user_id: int) -> List[str]:
+        return []  # 服务端在返回签名前已补算
+
+    def get_pages_without_minhash(self, doc_keys: List[str] = None, limit: int = 500) -> List[Dict[str, Any]]:
+        return []
+
+    def get_user_minhashes(self, user_id: int) -> List[Dict[str, Any]]:
+        rows = self._client.call('extract', 'user_minhashes', user_id) or []
+        return [{'doc_key': doc_key, 'page_index': page_index, 'minhash': bytes.fromhex(minhash)}
+                for doc_key, page_index, minhash in rows]
+
+
+def create_remote_managers(base_url: str = None) -> Optional[Dict[str, Any]]:
+    """根据服务地址（默认取环境变量）创建远程管理器，未配置服务时返回 None"""
+    base_url = base_url or os.environ.get(SERVICE_URL_ENV)
+    if not base_url:
+        return None
+
+    client = ServiceClient(base_url, token=os.environ.get(SERVICE_TOKEN_ENV))
+    return {
+        'user': RemoteManager(client, 'user'),
+        'case': RemoteManager(client, 'case'),
+        'directory': RemoteManager(client, 'directory'),
+        'pages': RemotePageManager(client),
+        'store': RemoteContentStore(client),
+        'processor': RemotePDFProcessor(client),
+    }
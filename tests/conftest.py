@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""测试公共配置：把项目根目录加入模块搜索路径，并提供 SQLite 替身数据库"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_config import DatabaseManager  # noqa: E402
+from load_test import SQLITE_SCHEMA, SQLiteDatabaseConfig  # noqa: E402
+
+# load_test 的表之外，逐页内容、内容存储和归档用到的表
+EXTRA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_contents (
+    doc_key TEXT NOT NULL, page_index INTEGER NOT NULL, fingerprint TEXT, text TEXT,
+    toc_json TEXT, minhash BLOB, created_at TIMESTAMP, PRIMARY KEY (doc_key, page_index)
+);
+CREATE TABLE IF NOT EXISTS content_objects (
+    content_hash TEXT PRIMARY KEY, size INTEGER, ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP, released_at TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS cases_archive AS SELECT * FROM cases WHERE 0;
+CREATE TABLE IF NOT EXISTS case_directories_archive AS SELECT * FROM case_directories WHERE 0;
+CREATE TABLE IF NOT EXISTS user_sessions_archive AS SELECT * FROM user_sessions WHERE 0;
+"""
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    """建好表的 SQLite 替身数据库"""
+    path = str(tmp_path / 'test.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(SQLITE_SCHEMA + EXTRA_SCHEMA)
+    conn.close()
+    return DatabaseManager(SQLiteDatabaseConfig(path))
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""后台归档任务测试"""
+
+import datetime
+import threading
+
+import mysql.connector
+from mysql.connector.errors import PoolError
+
+from archiver import CaseArchiver
+from database_config import CaseManager, DirectoryManager, UserManager
+from service import AssistantService
+
+OLD = datetime.datetime.now() - datetime.timedelta(days=400)
+
+
+class SQLiteArchiveCursor:
+    """跳过 SQLite 不支持的会话变量设置和 SKIP LOCKED"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        if query.startswith('SET SESSION'):
+            return
+        self._cursor.execute(query.replace(' SKIP LOCKED', ''), params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class SQLiteArchiveManager:
+    """在 SQLite 替身上执行归档事务；fail_first 个事务在执行第一条语句时出错"""
+
+    def __init__(self, db_manager, fail_first=0):
+        self.db_manager = db_manager
+        self.fail_first = fail_first
+        self.transactions = 0
+
+    def run_in_transaction(self, work):
+        self.transactions += 1
+        if self.transactions <= self.fail_first:
+            def failing(cursor):
+                raise mysql.connector.Error("Lock wait timeout exceeded")
+            return self.db_manager.run_in_transaction(failing)
+        return self.db_manager.run_in_transaction(lambda cursor: work(SQLiteArchiveCursor(cursor)))
+
+
+def create_deleted_cases(db_manager, count, user_id=1):
+    """创建 count 个删除已久的卷宗，每个带一个目录项"""
+    cases = CaseManager(db_manager)
+    directory = DirectoryManager(db_manager)
+    case_ids = []
+    for i in range(count):
+        case_id = cases.create_case(f"卷宗{i}", f"OLD-{user_id}-{i}", '委托人', '民事', '', user_id)
+        directory.add_directory_item(case_id, '', '卷一', 'folder')
+        cases.delete_case(case_id)
+        case_ids.append(case_id)
+    db_manager.execute_update(
+        f"UPDATE cases SET updated_at = %s WHERE id IN ({', '.join(['%s'] * count)})", [OLD] + case_ids
+    )
+    return case_ids
+
+
+def ids(db_manager, query):
+    return [row['id'] for row in db_manager.execute_query(query)]
+
+
+class FlakyDatabaseManager:
+    """第一次调用抛出连接池耗尽，之后没有可归档的行"""
+
+    def __init__(self):
+        self.calls = 0
+        self.recovered = threading.Event()
+
+    def run_in_transaction(self, work):
+        self.calls += 1
+        if self.calls == 1:
+            raise PoolError("Failed getting connection; pool exhausted")
+        self.recovered.set()
+        return 0
+
+
+def test_background_loop_survives_pool_errors():
+    db_manager = FlakyDatabaseManager()
+    archiver = CaseArchiver(db_manager, session_retention_days=None)
+    archiver.start(interval=0.01)
+    try:
+        assert db_manager.recovered.wait(timeout=5)
+        assert archiver._thread.is_alive()
+    finally:
+        archiver.stop()
+
+
+def test_service_archiver_has_its_own_connections():
+    service = AssistantService(pool_size=2, archive_days=30)
+    service.archiver.stop()
+    try:
+        assert service.archiver.db_manager.db_config is not service.db_config
+        assert service.archiver.db_manager.db_config.pool_size == 0
+    finally:
+        service.shutdown()
+
+
+def test_cases_archived_in_batches_exactly_once(db_manager):
+    archived = create_deleted_cases(db_manager, 5)
+    cases = CaseManager(db_manager)
+    kept = [cases.create_case('在办', 'NEW-1', '委托人', '民事', '', 1),
+            cases.create_case('刚删除', 'NEW-2', '委托人', '民事', '', 1)]
+    cases.delete_case(kept[1])
+
+    archiver = CaseArchiver(SQLiteArchiveManager(db_manager), session_retention_days=None,
+                            batch_size=2, pause=0)
+    batches = []
+    archive_batch = archiver.archive_cases_batch
+    archiver.archive_cases_batch = lambda limit: batches.append(archive_batch(limit)) or batches[-1]
+
+    assert archiver.run_once()['cases'] == 5
+    assert batches == [2, 2, 1]
+    assert archiver.run_once()['cases'] == 0
+
+    assert ids(db_manager, "SELECT id FROM cases_archive ORDER BY id") == archived
+    assert ids(db_manager, "SELECT id FROM cases ORDER BY id") == kept
+    directories = db_manager.execute_query("SELECT case_id FROM case_directories_archive ORDER BY case_id")
+    assert [row['case_id'] for row in directories] == archived
+
+
+def test_drain_backs_off(db_manager):
+    archiver = CaseArchiver(db_manager, batch_size=4, pause=0, max_batch_seconds=-1)
+
+    sizes = []
+
+    def slow_batch(limit):
+        sizes.append(limit)
+        return limit if len(sizes) < 4 else 0
+
+    # 每批都超过 max_batch_seconds，批量逐次减半
+    assert archiver._drain(slow_batch) == 7
+    assert sizes == [4, 2, 1, 1]
+
+    results = iter([4, None, 4])
+    calls = []
+
+    def failing_batch(limit):
+        calls.append(limit)
+        return next(results)
+
+    # 出错后本轮不再重试，等下一轮
+    assert archiver._drain(failing_batch) == 4
+    assert len(calls) == 2
+
+
+def test_service_archives_expired_sessions(db_manager):
+    service = AssistantService(pool_size=2, archive_days=30)
+    service.archiver.stop()
+    service.archiver._thread.join(timeout=5)
+    service.archiver._stop.clear()  # 后台线程已退出，在测试线程中执行一轮
+    try:
+        service.archiver.db_manager = SQLiteArchiveManager(db_manager)
+        users = UserManager(db_manager)
+        user_id = db_manager.execute_insert(
+            "INSERT INTO users (username, password, is_active) VALUES (%s, %s, 1)", ('lawyer', 'x'))
+        assert users.create_session(user_id, 'expired')
+        assert users.create_session(user_id, 'current')
+        db_manager.execute_update("UPDATE user_sessions SET created_at = %s WHERE session_token = %s",
+                                  (OLD, 'expired'))
+
+        assert service.archiver.run_once()['sessions'] == 1
+        assert users.validate_session('expired') is None
+        assert users.validate_session('current')['id'] == user_id
+        archived = db_manager.execute_query("SELECT session_token FROM user_sessions_archive")
+        assert archived == [{'session_token': 'expired'}]
+    finally:
+        service.shutdown()
+
+
+def test_background_loop_survives_failed_batch(db_manager):
+    create_deleted_cases(db_manager, 1)
+    archive_manager = SQLiteArchiveManager(db_manager, fail_first=1)
+    archiver = CaseArchiver(archive_manager, session_retention_days=None, pause=0)
+    archiver.start(interval=0.01)
+    try:
+        for _ in range(500):
+            if ids(db_manager, "SELECT id FROM cases_archive"):
+                break
+            threading.Event().wait(0.01)
+        assert archive_manager.transactions >= 2
+        assert len(ids(db_manager, "SELECT id FROM cases_archive")) == 1
+        assert archiver._thread.is_alive()
+    finally:
+        archiver.stop()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""卷宗统计表与分面筛选测试"""
+
+from database_config import CaseManager
+
+
+def test_stats_follow_case_writes(db_manager):
+    cases = CaseManager(db_manager)
+    civil = cases.create_case('甲', 'A-1', '张三', '民事', '', 1)
+    criminal = cases.create_case('乙', 'A-2', '李四', '刑事', '', 1)
+    untyped = cases.create_case('丙', 'A-3', '王五', None, '', 1)
+    cases.create_case('丁', 'B-1', '赵六', '民事', '', 2)
+
+    assert cases.get_case_facets(1) == {
+        'total': 3, 'case_type': {'民事': 1, '刑事': 1, '': 1}, 'status': {'active': 3}
+    }
+
+    assert cases.update_case(civil, status='closed')
+    assert cases.update_case(criminal, case_type='民事')
+    assert cases.update_case(untyped, case_name='丙2')
+    assert cases.delete_case(untyped)
+    assert not cases.delete_case(untyped)
+
+    expected = {'total': 2, 'case_type': {'民事': 2}, 'status': {'active': 1, 'closed': 1}}
+    assert cases.get_case_facets(1) == expected
+
+    assert cases.restore_case(untyped)
+    assert cases.get_case_facets(1)['case_type'] == {'民事': 2, '': 1}
+
+    facets = cases.get_case_facets(1)
+    db_manager.execute_update("DELETE FROM case_stats")
+    assert cases.rebuild_case_stats()
+    assert cases.get_case_facets(1) == facets
+    assert cases.get_case_facets(2)['total'] == 1
+
+
+def test_find_cases_filters_by_facet(db_manager):
+    cases = CaseManager(db_manager)
+    civil = cases.create_case('甲', 'A-1', '张三', '民事', '', 1)
+    closed = cases.create_case('乙', 'A-2', '李四', '民事', '', 1)
+    untyped = cases.create_case('丙', 'A-3', '王五', None, '', 1)
+    cases.create_case('丁', 'B-1', '赵六', '民事', '', 2)
+    cases.update_case(closed, status='closed')
+
+    def ids(**filters):
+        return {row['id'] for row in cases.find_cases(1, **filters)}
+
+    assert ids() == {civil, closed, untyped}
+    assert ids(case_type='民事') == {civil, closed}
+    assert ids(case_type='民事', status='active') == {civil}
+    assert ids(case_type='') == {untyped}
+    assert len(cases.find_cases(1, limit=2)) == 2
+
+    cases.delete_case(civil)
+    assert ids(case_type='民事') == {closed}
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""卷宗对话记录测试"""
+
+from chat_history import CaseChatLog, ChatHistoryStore, _Segment
+
+
+def ids(messages):
+    return [message['id'] for message in messages]
+
+
+def test_pages_skip_deleted_without_over_reading(tmp_path, monkeypatch):
+    chat_log = CaseChatLog(str(tmp_path / '1'), segment_bytes=1024)
+    for i in range(200):
+        chat_log.append('user', f"消息 {i}", timestamp=1000.0 + i)
+    assert len(chat_log.segments) > 3
+    for message_id in list(range(1, 101)) + [196, 197]:
+        assert chat_log.delete(message_id)
+    assert not chat_log.delete(196)
+
+    read = []
+    original = _Segment.read_entries
+
+    def counting_read(segment, start, stop):
+        read.append(stop - start)
+        return original(segment, start, stop)
+
+    monkeypatch.setattr(_Segment, 'read_entries', counting_read)
+    assert ids(chat_log.load_before(None, 5)) == [194, 195, 198, 199, 200]
+    assert sum(read) <= 5 + 2 + 1  # 只多读被删除的两条（及跨分段时的边界）
+
+    assert ids(chat_log.load_before(194, 3)) == [191, 192, 193]
+    assert ids(chat_log.load_before(104, 10)) == [101, 102, 103]
+    assert chat_log.load_before(101, 10) == []
+
+    # 逐页向前翻，覆盖全部未删除的消息且不重复
+    seen, before = [], None
+    while True:
+        page = chat_log.load_before(before, 7)
+        if not page:
+            break
+        seen = ids(page) + seen
+        before = page[0]['id']
+    assert seen == [i for i in range(101, 201) if i not in (196, 197)]
+
+
+def test_store_persists_and_compacts(tmp_path):
+    store = ChatHistoryStore(str(tmp_path), segment_bytes=512)
+    for i in range(40):
+        store.append(7, 'user' if i % 2 else 'assistant', f"第 {i} 条")
+    assert store.delete_message(7, 3)
+    assert store.compact_all() > 0
+    assert 3 not in store.log(7).deleted
+
+    reopened = ChatHistoryStore(str(tmp_path), segment_bytes=512)
+    latest = reopened.load_latest(7, 50)
+    assert ids(latest) == [i for i in range(1, 41) if i != 3]
+    assert latest[0]['content'] == '第 0 条'
+    assert ids(reopened.load_before(7, 5, 10)) == [1, 2, 4]
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""内容寻址存储与引用计数测试"""
+
+import datetime
+import os
+import time
+
+from archiver import CaseArchiver
+
+from database_config import CaseManager, ContentManager, DirectoryManager, PageContentManager
+from content_store import ContentStore
+
+
+def make_file(path, data=b'%PDF-1.4 test'):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def make_store(db_manager, tmp_path):
+    return ContentStore(str(tmp_path / 'store'), ContentManager(db_manager))
+
+
+def age_object(db_manager, content_hash, days=1):
+    """把对象的 released_at 调早，使其超过 GC 宽限期"""
+    db_manager.execute_update("UPDATE content_objects SET released_at = %s WHERE content_hash = %s",
+                              (datetime.datetime.now() - datetime.timedelta(days=days), content_hash))
+
+
+def test_put_file_deduplicates(db_manager, tmp_path):
+    store = make_store(db_manager, tmp_path)
+    first = store.put_file(make_file(tmp_path / 'a.pdf'))
+    second = store.put_file(make_file(tmp_path / 'b.pdf'))
+    assert first == second
+    assert os.path.exists(first[1])
+    assert store.content_manager.get_object(first[0])['ref_count'] == 0
+
+
+def test_gc_keeps_referenced_and_removes_derived_data(db_manager, tmp_path):
+    store = make_store(db_manager, tmp_path)
+    content_hash, path = store.put_file(make_file(tmp_path / 'a.pdf'))
+    directory_manager = DirectoryManager(db_manager)
+    item_id = directory_manager.add_directory_item(1, path, 'a', 'pdf', content_hash=content_hash)
+    PageContentManager(db_manager).save_pages(content_hash, [(0, 'fp', 'text', None, None)])
+    os.makedirs(store.artifact_dir(content_hash))
+    age_object(db_manager, content_hash)
+
+    assert store.gc()['removed_objects'] == 0
+    assert os.path.exists(path)
+
+    directory_manager.delete_directory_item(item_id)
+    age_object(db_manager, content_hash)
+    result = store.gc()
+    assert result['removed_objects'] == 1
+    assert not os.path.exists(path)
+    assert not os.path.exists(store.artifact_dir(content_hash))
+    assert store.page_manager.get_fingerprints(content_hash) == []
+    assert store.content_manager.get_object(content_hash) is None
+
+
+def test_gc_backs_off_when_object_is_registered_again(db_manager, tmp_path):
+    store = make_store(db_manager, tmp_path)
+    source = make_file(tmp_path / 'a.pdf')
+    content_hash, path = store.put_file(source)
+    age_object(db_manager, content_hash)
+
+    delete_object = store.content_manager.delete_object
+
+    def racing_delete(*args, **kwargs):
+        store.put_file(source)  # 同一内容在 GC 移走文件后被重新上传
+        return delete_object(*args, **kwargs)
+
+    store.content_manager.delete_object = racing_delete
+    assert store.gc()['removed_objects'] == 0
+    assert os.path.exists(path)
+    assert store.content_manager.get_object(content_hash) is not None
+
+
+def _create_case_with_file(db_manager, tmp_path):
+    store = make_store(db_manager, tmp_path)
+    content_hash, path = store.put_file(make_file(tmp_path / 'a.pdf'))
+    case_manager = CaseManager(db_manager)
+    case_id = case_manager.create_case('案件', 'A-1', '委托人', '民事', '', 1)
+    DirectoryManager(db_manager).add_directory_item(case_id, path, 'a', 'pdf', content_hash=content_hash)
+    return store, case_manager, case_id, content_hash
+
+
+def test_soft_delete_keeps_references(db_manager, tmp_path):
+    store, case_manager, case_id, content_hash = _create_case_with_file(db_manager, tmp_path)
+    assert case_manager.delete_case(case_id)
+    assert store.content_manager.get_object(content_hash)['ref_count'] == 1
+    age_object(db_manager, content_hash)
+    assert store.gc()['removed_objects'] == 0
+    assert case_manager.restore_case(case_id)
+    assert store.content_manager.get_object(content_hash)['ref_count'] == 1
+
+
+def archive_case(db_manager, case_id):
+    """按 CaseArchiver 的步骤归档一个卷宗（SQLite 不支持其 SKIP LOCKED 查询）"""
+    def work(cursor):
+        CaseArchiver(db_manager)._release_content(cursor, [case_id])
+        for table, column in (('case_directories', 'case_id'), ('cases', 'id')):
+            cursor.execute(f"INSERT INTO {table}_archive SELECT * FROM {table} WHERE {column} = %s", (case_id,))
+            cursor.execute(f"DELETE FROM {table} WHERE {column} = %s", (case_id,))
+        return True
+
+    assert db_manager.run_in_transaction(work)
+
+
+def test_archive_releases_and_restore_reacquires(db_manager, tmp_path):
+    store, case_manager, case_id, content_hash = _create_case_with_file(db_manager, tmp_path)
+    case_manager.delete_case(case_id)
+    archive_case(db_manager, case_id)
+    assert store.content_manager.get_object(content_hash)['ref_count'] == 0
+
+    assert case_manager.restore_case(case_id)
+    assert store.content_manager.get_object(content_hash)['ref_count'] == 1
+    assert case_manager.get_case_by_id(case_id)
+
+
+def test_restore_refuses_when_content_was_collected(db_manager, tmp_path):
+    store, case_manager, case_id, content_hash = _create_case_with_file(db_manager, tmp_path)
+    case_manager.delete_case(case_id)
+    archive_case(db_manager, case_id)
+    age_object(db_manager, content_hash)
+    assert store.gc()['removed_objects'] == 1
+
+    assert not case_manager.restore_case(case_id)
+    assert db_manager.execute_query("SELECT id FROM cases_archive WHERE id = %s", (case_id,))
+
+
+def test_background_gc_removes_unreferenced_objects(db_manager, tmp_path):
+    store = make_store(db_manager, tmp_path)
+    content_hash, path = store.put_file(make_file(tmp_path / 'a.pdf'))
+    age_object(db_manager, content_hash)
+    store.start(interval=0.01)
+    try:
+        for _ in range(200):
+            if store.content_manager.get_object(content_hash) is None:
+                break
+            time.sleep(0.01)
+    finally:
+        store.stop()
+    assert not os.path.exists(path)
+    assert store.content_manager.get_object(content_hash) is None
+
+
+def test_archiver_round_collects_unreferenced_objects(db_manager, tmp_path):
+    store = make_store(db_manager, tmp_path)
+    content_hash, path = store.put_file(make_file(tmp_path / 'a.pdf'))
+    age_object(db_manager, content_hash)
+    result = CaseArchiver(db_manager, content_store=store).run_once()
+    assert result['objects'] == 1
+    assert not os.path.exists(path)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""目录快速跳转索引测试"""
+
+import queue
+
+from database_config import DirectoryManager
+from directory_search import DirectorySearchIndex, QuickJumpBox
+
+ROWS = [
+    {'id': 1, 'file_name': '第三次询问笔录', 'page_number': 5},
+    {'id': 2, 'file_name': '询问笔录', 'page_number': 9},
+    {'id': 3, 'file_name': '起诉状', 'page_number': 1},
+    {'id': 4, 'file_name': '讯问笔录', 'page_number': None},
+]
+
+
+def ids(index, query):
+    return [result['id'] for result in index.search(query)]
+
+
+def test_documented_queries():
+    index = DirectorySearchIndex()
+    index.add(ROWS)
+    assert ids(index, '询问笔录') == [2, 1, 4]
+    assert ids(index, '询闻笔录') == [2, 1]       # 错一个字仍能凭单字匹配
+    assert ids(index, 'dscxwbl')[0] == 1          # 拼音首字母
+    assert ids(index, 'zzz') == []
+    assert index.search('起诉')[0] == {'id': 3, 'file_name': '起诉状', 'page_number': 1, 'score': 0.944}
+
+
+def test_upsert_and_remove():
+    index = DirectorySearchIndex()
+    index.add(ROWS)
+    index.upsert({'id': 3, 'file_name': '起诉状', 'page_number': 7})
+    assert index.search('起诉状')[0]['page_number'] == 7
+    index.upsert({'id': 3, 'file_name': '答辩状', 'page_number': 7})
+    assert ids(index, '起诉状') == []
+    assert ids(index, '答辩') == [3]
+    index.remove(2)
+    assert 2 not in index and len(index) == 3
+    assert ids(index, '询问笔录') == [1, 4]
+
+
+class FakeLabel:
+    def configure(self, **kwargs):
+        self.text = kwargs.get('text')
+
+
+class FakeVar:
+    def get(self):
+        return ''
+
+
+def make_box(case_id=1):
+    """不创建窗口，只保留 _poll_changes 用到的属性"""
+    box = QuickJumpBox.__new__(QuickJumpBox)
+    box.case_id = case_id
+    box.index = DirectorySearchIndex()
+    box.index.add(ROWS)
+    box._changes = queue.Queue()
+    box._loading = False
+    box._pending = []
+    box.status_label = FakeLabel()
+    box.query_var = FakeVar()
+    box.reloads = 0
+    box.winfo_exists = lambda: True
+    box.after = lambda delay, callback: None
+
+    def reload():
+        box.reloads += 1
+    box.reload = reload
+    return box
+
+
+def test_quick_jump_applies_directory_changes():
+    box = make_box()
+    box.on_directory_change(1, [{'id': 5, 'file_name': '第四次询问笔录', 'page_number': 12}], [])
+    box.on_directory_change(1, [], [1, 2])
+    box.on_directory_change(2, None, [])  # 其他卷宗的修改被忽略
+    box._poll_changes()
+    assert box.reloads == 0
+    assert ids(box.index, '询问笔录') == [5, 4]
+    assert '共 3 条' in box.status_label.text
+
+    box.on_directory_change(1, None, [])
+    box._poll_changes()
+    assert box.reloads == 1
+
+    # 加载期间的单项修改先暂存，快照建立完成后补上，不再重新加载
+    box._loading = True
+    box.index.clear()
+    box.on_directory_change(1, [{'id': 6, 'file_name': '鉴定意见', 'page_number': 1}], [])
+    box.on_directory_change(1, [{'id': 3, 'file_name': '起诉状', 'page_number': 2}], [])
+    box._poll_changes()
+    assert box.reloads == 1 and 6 not in box.index
+    box._rows, box._loaded, box._generation = ROWS, 0, 1
+    box._poll_rows(1)
+    assert box.reloads == 1 and not box._loading and len(box.index) == 5
+    assert box.index.search('鉴定意见')[0]['id'] == 6
+    assert box.index.search('起诉状')[0]['page_number'] == 2
+
+
+def test_index_rows_select_only_needed_columns(db_manager):
+    directory = DirectoryManager(db_manager)
+    item_id = directory.add_directory_item(1, '/a.pdf', '起诉状', 'pdf', 3)
+    directory.add_directory_item(2, '/b.pdf', '答辩状', 'pdf', 1)
+    assert directory.get_directory_index(1) == [{'id': item_id, 'file_name': '起诉状', 'page_number': 3}]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""DirectoryTree 紧凑目录节点表的测试"""
+
+from database_config import DirectoryManager
+from directory_tree import DirectoryTree
+from load_test import _SQLiteCursor
+
+
+def _rows(ids, child_count=0):
+    return [{'id': i, 'file_name': f"目录{i}", 'page_number': i, 'child_count': child_count} for i in ids]
+
+
+def test_add_and_get_node():
+    tree = DirectoryTree()
+    assert tree.add_nodes(_rows([1, 2], child_count=1)) == [1, 2]
+    tree.add_nodes([{'id': 10, 'file_name': '子目录', 'depth': 1}], parent_id=1)
+
+    assert len(tree) == 3
+    assert tree.is_loaded(1) and not tree.is_loaded(2)
+    node = tree.get_node(10)
+    assert node['parent_id'] == 1 and node['depth'] == 1 and node['page_number'] is None
+
+
+def test_unload_children_removes_only_subtree():
+    tree = DirectoryTree()
+    tree.add_nodes(_rows([1, 2], child_count=1))
+    tree.add_nodes(_rows([10, 11], child_count=1), parent_id=1)
+    tree.add_nodes(_rows([100, 101]), parent_id=10)
+    tree.add_nodes(_rows([20]), parent_id=2)
+
+    assert sorted(tree.unload_children(1)) == [10, 11, 100, 101]
+    assert len(tree) == 3
+    assert 20 in tree and not tree.is_loaded(1) and tree.is_loaded(2)
+    assert tree.unload_children(1) == []
+
+
+def test_freed_slots_are_reused_and_relinked():
+    tree = DirectoryTree()
+    tree.add_nodes(_rows([1], child_count=1))
+    tree.add_nodes(_rows([10, 11]), parent_id=1)
+    slots = len(tree.ids)
+    tree.unload_children(1)
+
+    tree.add_nodes(_rows([12, 13]), parent_id=1)
+    assert len(tree.ids) == slots
+    assert sorted(tree.unload_children(1)) == [12, 13]
+
+
+def test_child_queries_use_parent_index(db_manager):
+    directory_manager = DirectoryManager(db_manager)
+    volume = directory_manager.add_directory_item(1, '', '卷一', 'folder')
+    directory_manager.add_directory_item(1, '/a.pdf', 'a.pdf', 'pdf', 1, parent_id=volume)
+    directory_manager.add_directory_item(2, '', '卷一', 'folder')
+
+    plans = []
+    original = _SQLiteCursor.execute
+
+    def explain(cursor, query, params=()):
+        if 'parent_id' in query and query.lstrip().upper().startswith('SELECT'):
+            cursor._cursor.execute('EXPLAIN QUERY PLAN ' + cursor._translate(query), tuple(params))
+            plans.append(' '.join(str(row[-1]) for row in cursor._cursor.fetchall()))
+        return original(cursor, query, params)
+
+    _SQLiteCursor.execute = explain
+    try:
+        rows = directory_manager.get_child_directories(1)
+        assert [(row['id'], row['child_count']) for row in rows] == [(volume, 1)]
+        assert directory_manager.delete_directory_item(volume)
+    finally:
+        _SQLiteCursor.execute = original
+
+    assert len(plans) == 3
+    for plan in plans:
+        assert 'idx_case_directories_parent' in plan and 'SCAN' not in plan
+    assert not directory_manager.get_child_directories(1)
+    assert len(directory_manager.get_child_directories(2)) == 1
+    assert not directory_manager.delete_directory_item(volume)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""压测工具测试"""
+
+import random
+import sys
+
+import pytest
+
+import load_test
+from database_config import DatabaseManager
+from load_test import LoadTester, TimedConfig, cleanup, seed
+
+READ_OPERATIONS = ['get_cases_by_user', 'get_case_facets', 'get_child_directories', 'get_directory_by_case']
+
+
+def make_tester(db_manager):
+    data = seed(db_manager, users=2, cases_per_user=2, dirs_per_case=2)
+    timed_config = TimedConfig(db_manager.db_config)
+    return LoadTester(DatabaseManager(timed_config), timed_config, data)
+
+
+def test_read_operations_succeed(db_manager):
+    tester = make_tester(db_manager)
+    for name in READ_OPERATIONS:
+        assert tester.run_operation(name, random.Random(0)), name
+
+
+def test_read_operations_report_query_errors(db_manager):
+    tester = make_tester(db_manager)
+    db_manager.execute_update("DROP TABLE case_directories")
+    db_manager.execute_update("DROP TABLE case_stats")
+    db_manager.execute_update("DROP TABLE cases")
+    for name in READ_OPERATIONS:
+        assert not tester.run_operation(name, random.Random(0)), name
+
+
+def test_read_operations_report_missing_connection(db_manager, monkeypatch):
+    tester = make_tester(db_manager)
+    monkeypatch.setattr(db_manager.db_config, 'get_read_connection', lambda: (None, None))
+    assert not tester.run_operation('get_cases_by_user', random.Random(0))
+    assert tester.run_operation('update_case', random.Random(0))  # 写操作走主库，不受影响
+
+
+@pytest.mark.parametrize('argv', [
+    ['--backend', 'mysql', '--compare-pool', '--levels', '1,64'],
+    ['--backend', 'mysql', '--pool-size', '8', '--levels', '1,16'],
+])
+def test_mysql_pool_limits_are_rejected(monkeypatch, argv):
+    monkeypatch.setattr(sys, 'argv', ['load_test.py'] + argv)
+    with pytest.raises(SystemExit) as exc_info:
+        load_test.main()
+    assert exc_info.value.code == 2
+
+
+def test_cleanup_removes_seeded_rows(db_manager):
+    other = seed(db_manager, users=1, cases_per_user=1, dirs_per_case=1)
+    tester = make_tester(db_manager)
+    assert tester.run_operation('add_directory_item', random.Random(0))
+    assert cleanup(db_manager, tester.data)
+
+    def count(table):
+        return db_manager.execute_query(f"SELECT COUNT(*) AS n FROM {table}")[0]['n']
+
+    assert [count(table) for table in ('users', 'user_sessions', 'cases', 'case_directories')] == [1, 1, 1, 1]
+    assert db_manager.execute_query("SELECT user_id FROM case_stats WHERE case_count > 0") == \
+        [{'user_id': other['users'][0]['id']}]
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""近似重复页面签名的保存与复用测试"""
+
+import os
+import threading
+
+from database_config import CaseManager, DirectoryManager, PageContentManager
+from near_duplicates import LSHIndex, TOO_SHORT, backfill_signatures, build_user_index, minhash_signatures
+from pdf_processor import PDFProcessor
+
+from test_pdf_processor import make_pdf
+
+LONG_TEXT = 'This agreement is made between the parties named below on the first day'
+
+
+class CountingPageManager(PageContentManager):
+    def __init__(self, db_manager):
+        super().__init__(db_manager)
+        self.lookups = []
+
+    def get_page(self, doc_key, page_index):
+        self.lookups.append([(doc_key, page_index)])
+        return super().get_page(doc_key, page_index)
+
+    def get_pages_by_ref(self, refs):
+        self.lookups.append(list(refs))
+        return super().get_pages_by_ref(refs)
+
+
+def test_short_pages_are_not_backfilled_again(db_manager, tmp_path):
+    page_manager = PageContentManager(db_manager)
+    processor = PDFProcessor(page_manager, thumbnail_dir=str(tmp_path / 'thumbs'))
+    processor.process_document('doc', make_pdf(tmp_path / 'a.pdf', ['7', LONG_TEXT]))
+
+    pages = page_manager.get_pages('doc', 0, 2)
+    assert pages[0]['minhash'] == TOO_SHORT
+    assert len(pages[1]['minhash']) == 256
+    assert page_manager.get_pages_without_minhash() == []
+
+    # 升级前保存的页面没有签名，补算一次后不再被选中
+    page_manager.save_pages('old', [(0, 'f0', '7', None, None), (1, 'f1', LONG_TEXT, None, None)])
+    assert backfill_signatures(page_manager) == 2
+    assert backfill_signatures(page_manager) == 0
+    assert page_manager.get_page('old', 0)['minhash'] == TOO_SHORT
+
+
+def test_identical_page_candidates_fetched_in_one_query(db_manager, tmp_path):
+    page_manager = CountingPageManager(db_manager)
+    index = LSHIndex()
+    processor = PDFProcessor(page_manager, thumbnail_dir=str(tmp_path / 'thumbs'), duplicate_index=index)
+    for name in ('a', 'b'):
+        processor.process_document(name, make_pdf(tmp_path / f'{name}.pdf', [LONG_TEXT]))
+    assert page_manager.lookups == [[('a', 0)]]
+
+    del page_manager.lookups[:]
+    processor.process_document('c', make_pdf(tmp_path / 'c.pdf', [LONG_TEXT]))
+    assert len(page_manager.lookups) == 1
+    assert sorted(page_manager.lookups[0]) == [('a', 0), ('b', 0)]
+    assert os.path.samefile(processor.thumbnail_path('a', 0), processor.thumbnail_path('c', 0))
+
+
+def test_index_handed_to_processor_keeps_new_pages(db_manager, tmp_path):
+    page_manager = PageContentManager(db_manager)
+    case_id = CaseManager(db_manager).create_case('案件', 'A-1', '委托人', '民事', '', 1)
+    directory = DirectoryManager(db_manager)
+    index = LSHIndex()
+    processor = PDFProcessor(page_manager, thumbnail_dir=str(tmp_path / 'thumbs'), duplicate_index=index)
+    a, b = (make_pdf(tmp_path / f'{name}.pdf', [LONG_TEXT]) for name in ('a', 'b'))
+    for path in (a, b):
+        directory.add_directory_item(case_id, path, os.path.basename(path), 'pdf', 1)
+
+    processor.process_document(a, a)
+    assert build_user_index(page_manager, 1, index=index) is index
+    processor.process_document(b, b)  # 建立索引之后处理的页面直接加入同一索引
+    assert index.duplicates_of((a, 0)) == [(b, 0)]
+
+
+def test_concurrent_add_and_group_queries():
+    index = LSHIndex()
+    signatures = minhash_signatures([' '.join(str(i // 2 * 1000 + k) for k in range(20)) for i in range(400)])
+    errors = []
+
+    def reader():
+        try:
+            for _ in range(200):
+                index.groups()
+                index.duplicates_of(('doc', 0))
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for start in range(0, 400, 4):
+        index.add([('doc', i) for i in range(start, start + 4)], signatures[start:start + 4])
+    thread.join()
+    assert not errors
+    assert len(index) == 400 and len(index.groups()) == 200
+    assert index.duplicates_of(('doc', 398)) == [('doc', 399)]
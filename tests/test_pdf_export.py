@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""拆分导出规划测试"""
+
+import os
+import threading
+
+import fitz
+
+from database_config import DirectoryManager
+from pdf_export import DossierExporter, compute_page_ranges
+
+
+def make_pdf(path, pages):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"page {i}")
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def test_compute_page_ranges():
+    entries = [
+        {'id': 1, 'page_number': 1, 'sort_order': 0},
+        {'id': 2, 'page_number': 4, 'sort_order': 0},
+        {'id': 3, 'page_number': 4, 'sort_order': 1},
+        {'id': 4, 'page_number': None},
+    ]
+    ranges = [(r['entry']['id'], r['from_page'], r['to_page']) for r in compute_page_ranges(entries, 10)]
+    assert ranges == [(1, 0, 2), (2, 3, 9), (3, 3, 9)]
+
+
+def _setup(db_manager, tmp_path):
+    directory_manager = DirectoryManager(db_manager)
+    source = make_pdf(tmp_path / 'dossier.pdf', 6)
+    ids = [directory_manager.add_directory_item(1, source, name, 'pdf', page_number=page)
+           for name, page in (('起诉书', 1), ('证据', 3), ('判决书', 5))]
+    return directory_manager, source, ids
+
+
+def test_plan_names_by_entry_id_and_uses_cheap_key(db_manager, tmp_path):
+    directory_manager, source, ids = _setup(db_manager, tmp_path)
+    exporter = DossierExporter(directory_manager)
+    jobs = exporter.plan(1, str(tmp_path / 'out'))
+    assert [job['name'] for job in jobs] == [f"{ids[0]}_起诉书.pdf", f"{ids[1]}_证据.pdf", f"{ids[2]}_判决书.pdf"]
+    stat = os.stat(source)
+    assert jobs[0]['source_key'] == f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    # 删除前面的目录项后，其余输出的名称不变
+    directory_manager.delete_directory_item(ids[0])
+    assert [job['name'] for job in exporter.plan(1, str(tmp_path / 'out'))] == \
+        [f"{ids[1]}_证据.pdf", f"{ids[2]}_判决书.pdf"]
+
+
+def test_export_skips_unchanged_and_removes_stale(db_manager, tmp_path):
+    directory_manager, source, ids = _setup(db_manager, tmp_path)
+    exporter = DossierExporter(directory_manager, max_workers=1)
+    output_dir = str(tmp_path / 'out')
+
+    first = exporter.export_case(1, output_dir)
+    assert (first['exported'], first['skipped'], first['cancelled']) == (3, 0, False)
+    with fitz.open(os.path.join(output_dir, f"{ids[1]}_证据.pdf")) as doc:
+        assert doc.page_count == 2
+
+    directory_manager.delete_directory_item(ids[2])
+    second = exporter.export_case(1, output_dir)
+    assert (second['exported'], second['skipped']) == (1, 1)  # 证据的页范围延伸到文末
+    assert not os.path.exists(os.path.join(output_dir, f"{ids[2]}_判决书.pdf"))
+
+
+def test_export_cancelled_before_start(db_manager, tmp_path):
+    directory_manager, _, _ = _setup(db_manager, tmp_path)
+    cancel_event = threading.Event()
+    cancel_event.set()
+    result = DossierExporter(directory_manager, max_workers=1).export_case(
+        1, str(tmp_path / 'out'), bundle_zip=True, cancel_event=cancel_event)
+    assert result['cancelled'] and result['zip_path'] is None
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""文档句柄与句柄缓存测试"""
+
+import hashlib
+import os
+import threading
+
+import fitz
+import PyPDF2
+
+from pdf_handle import DocumentHandle, DocumentHandleCache
+
+
+def page_count(handle):
+    with handle.document() as doc:
+        return doc.page_count
+
+
+def make_pdf(path, pages):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"page {i}")
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def test_handle_hash_and_streams(tmp_path):
+    path = make_pdf(tmp_path / 'a.pdf', 3)
+    with DocumentHandle(path) as handle:
+        with open(path, 'rb') as f:
+            assert handle.sha256() == hashlib.sha256(f.read()).hexdigest()
+        assert page_count(handle) == 3
+        with handle.open_stream() as stream:
+            assert len(PyPDF2.PdfReader(stream).pages) == 3
+
+
+def test_cache_reuses_handle_and_evicts_unpinned(tmp_path):
+    cache = DocumentHandleCache(max_handles=1)
+    first = make_pdf(tmp_path / 'a.pdf', 1)
+    second = make_pdf(tmp_path / 'b.pdf', 1)
+    with cache.open(first) as handle:
+        with cache.open(first) as again:
+            assert again is handle
+        with cache.open(second):
+            pass
+        assert page_count(handle) == 1  # 使用中的句柄不会被淘汰
+    with cache.open(second) as handle:
+        assert handle.file_path == os.path.abspath(second)
+
+
+def test_cache_reopens_rewritten_file(tmp_path):
+    cache = DocumentHandleCache()
+    path = make_pdf(tmp_path / 'a.pdf', 1)
+    with cache.open(path) as old:
+        assert page_count(old) == 1
+        make_pdf(tmp_path / 'new.pdf', 4)
+        os.replace(tmp_path / 'new.pdf', path)
+        with cache.open(path) as new:
+            assert new is not old
+            assert page_count(new) == 4
+        assert page_count(old) == 1  # 旧句柄在释放前仍可使用
+    assert old._mmap is None  # 释放后旧句柄被关闭
+
+
+def test_document_is_used_under_the_handle_lock(tmp_path):
+    path = make_pdf(tmp_path / 'a.pdf', 1)
+    acquired = []
+
+    def other_thread():
+        acquired.append(handle.lock.acquire(timeout=0.05))
+        if acquired[-1]:
+            handle.lock.release()
+
+    with DocumentHandle(path) as handle:
+        with handle.document() as doc:
+            assert doc.page_count == 1
+            thread = threading.Thread(target=other_thread)
+            thread.start()
+            thread.join()
+        other_thread()
+    assert acquired == [False, True]
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""修订版增量处理测试"""
+
+import hashlib
+import os
+import shutil
+
+import fitz
+
+from content_store import ContentStore
+from database_config import ContentManager, DirectoryManager, PageContentManager
+from pdf_processor import PDFProcessor, diff_page_fingerprints
+
+
+def make_pdf(path, texts):
+    doc = fitz.open()
+    for text in texts:
+        page = doc.new_page()
+        page.insert_text((72, 72), text)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_diff_page_fingerprints_insert():
+    page_map, changed, unchanged = diff_page_fingerprints(['a', 'b', 'c'], ['a', 'x', 'b', 'c'])
+    assert page_map == {0: 0, 1: 2, 2: 3}
+    assert changed == [1]
+    assert unchanged == {0: 0, 1: 2, 2: 3}
+
+
+def test_diff_page_fingerprints_delete_and_replace():
+    page_map, changed, unchanged = diff_page_fingerprints(['a', 'b', 'c'], ['a', 'c'])
+    assert page_map == {0: 0, 1: 1, 2: 1}
+    assert changed == []
+    assert unchanged == {0: 0, 2: 1}
+
+    page_map, changed, unchanged = diff_page_fingerprints(['a', 'b'], ['a', 'y'])
+    assert page_map == {0: 0, 1: 1}
+    assert changed == [1]
+
+
+def _setup(db_manager, tmp_path):
+    processor = PDFProcessor(PageContentManager(db_manager), thumbnail_dir=str(tmp_path / 'thumbs'))
+    directory_manager = DirectoryManager(db_manager)
+    old_path = make_pdf(tmp_path / 'v1.pdf', ['page one', 'page two', 'page three'])
+    old_hash = sha256(old_path)
+    processor.process_document(old_hash, old_path)
+    item_id = directory_manager.add_directory_item(1, old_path, 'third', 'pdf', page_number=3,
+                                                   content_hash=old_hash)
+    return processor, directory_manager, old_path, old_hash, item_id
+
+
+def test_revision_keyed_by_content_hash(db_manager, tmp_path):
+    processor, directory_manager, old_path, old_hash, item_id = _setup(db_manager, tmp_path)
+    new_path = make_pdf(tmp_path / 'v2.pdf', ['page one', 'inserted', 'page two', 'page three'])
+
+    result = processor.process_revision(1, old_path, new_path, directory_manager, old_key=old_hash)
+
+    assert result['processed_pages'] == 1
+    assert result['reused_pages'] == 3
+    new_hash = sha256(new_path)
+    assert len(processor.page_manager.get_fingerprints(new_hash)) == 4
+    assert processor.page_manager.get_fingerprints(new_path) == []
+    item = directory_manager.get_directory_item(item_id)
+    assert (item['file_path'], item['content_hash'], item['page_number']) == (new_path, new_hash, 4)
+
+
+def test_revision_with_unchanged_content(db_manager, tmp_path):
+    processor, directory_manager, old_path, old_hash, item_id = _setup(db_manager, tmp_path)
+    new_path = str(tmp_path / 'moved.pdf')
+    shutil.copyfile(old_path, new_path)
+
+    result = processor.process_revision(1, old_path, new_path, directory_manager, old_key=old_hash)
+
+    assert result['processed_pages'] == 0
+    assert result['page_map'] == {0: 0, 1: 1, 2: 2}
+    item = directory_manager.get_directory_item(item_id)
+    assert (item['file_path'], item['content_hash'], item['page_number']) == (new_path, old_hash, 3)
+
+
+def test_copy_thumbnails_same_key(db_manager, tmp_path):
+    processor, _, _, old_hash, _ = _setup(db_manager, tmp_path)
+    processor._copy_thumbnails(old_hash, old_hash, {0: 0, 1: 1})
+    assert os.path.exists(processor.thumbnail_path(old_hash, 0))
+
+
+def test_revision_of_unprocessed_version_repoints_rows(db_manager, tmp_path):
+    content_manager = ContentManager(db_manager)
+    page_manager = PageContentManager(db_manager)
+    store = ContentStore(str(tmp_path / 'store'), content_manager, page_manager)
+    processor = PDFProcessor(page_manager, thumbnail_dir=str(tmp_path / 'thumbs'), content_store=store)
+    directory_manager = DirectoryManager(db_manager)
+    old_path = make_pdf(tmp_path / 'old.pdf', ['page one', 'page two'])
+    old_hash, _ = store.put_file(old_path)
+    item_id = directory_manager.add_directory_item(1, old_path, 'second', 'pdf', page_number=2,
+                                                   content_hash=old_hash)
+    new_path = make_pdf(tmp_path / 'new.pdf', ['page one', 'page two', 'page three', 'page four'])
+
+    result = processor.process_revision(1, old_path, new_path, directory_manager, old_key=old_hash)
+
+    new_hash = sha256(new_path)
+    assert result['page_count'] == 4 and result['processed_pages'] == 4
+    assert len(page_manager.get_fingerprints(new_hash)) == 4
+    item = directory_manager.get_directory_item(item_id)
+    assert (item['file_path'], item['content_hash'], item['page_number']) == (new_path, new_hash, 2)
+    assert store.contains(new_hash)
+    assert content_manager.get_object(new_hash)['ref_count'] == 1
+    assert content_manager.get_object(old_hash)['ref_count'] == 0
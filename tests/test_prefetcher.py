@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""卷宗预取缓存与目录修改通知测试"""
+
+import os
+
+import pytest
+
+import prefetcher as prefetcher_module
+from database_config import DirectoryManager, PageContentManager
+from directory_events import ObservedDirectoryManager
+from pdf_handle import DocumentHandleCache
+from prefetcher import CasePrefetcher
+
+from test_pdf_processor import make_pdf
+
+
+class CountingDirectoryManager(ObservedDirectoryManager):
+    """记录 get_child_directories 实际查询次数"""
+
+    def __init__(self, directory_manager):
+        super().__init__(directory_manager)
+        self.child_queries = 0
+
+    def get_child_directories(self, case_id, parent_id=None):
+        self.child_queries += 1
+        return self.directory_manager.get_child_directories(case_id, parent_id)
+
+
+@pytest.fixture
+def directory(db_manager):
+    return CountingDirectoryManager(DirectoryManager(db_manager))
+
+
+@pytest.fixture
+def prefetcher(directory):
+    prefetcher = CasePrefetcher(directory, pace=0)
+    directory.add_listener(prefetcher.on_directory_change)
+    yield prefetcher
+    prefetcher.stop()
+
+
+def warm(prefetcher, case_id):
+    prefetcher._warm_case(case_id, prefetcher._generation)
+
+
+def test_only_warmed_top_level_is_cached(directory, prefetcher):
+    folder = directory.add_directory_item(1, '', '卷一', 'folder')
+    directory.add_directory_item(1, '/a.pdf', 'a.pdf', 'pdf', 1, parent_id=folder)
+
+    assert len(prefetcher.get_child_directories(1, folder)) == 1
+    assert len(prefetcher.get_child_directories(1)) == 1
+    assert len(prefetcher.cache) == 0
+
+    warm(prefetcher, 1)
+    queries = directory.child_queries
+    assert [row['id'] for row in prefetcher.get_child_directories(1)] == [folder]
+    assert directory.child_queries == queries
+    prefetcher.get_child_directories(1, folder)
+    assert directory.child_queries == queries + 1
+
+
+def test_directory_writes_invalidate_warmed_case(directory, prefetcher):
+    folder = directory.add_directory_item(1, '', '卷一', 'folder')
+    directory.add_directory_item(2, '', '卷一', 'folder')
+    warm(prefetcher, 1)
+    warm(prefetcher, 2)
+
+    added = directory.add_directory_item(1, '', '卷二', 'folder')
+    assert {row['id'] for row in prefetcher.get_child_directories(1)} == {folder, added}
+    assert prefetcher.cache.get(('children', 2, None))[0]
+
+    warm(prefetcher, 1)
+    assert directory.delete_directory_item(added)
+    assert [row['id'] for row in prefetcher.get_child_directories(1)] == [folder]
+
+    warm(prefetcher, 1)
+    assert directory.update_directory_item(folder, file_name='卷宗一')
+    assert prefetcher.get_child_directories(1)[0]['file_name'] == '卷宗一'
+
+    directory.add_directory_item(1, '/a.pdf', 'a.pdf', 'pdf', 2)
+    warm(prefetcher, 1)
+    assert directory.remap_page_numbers(1, '/a.pdf', '/b.pdf', {1: 0})
+    assert not prefetcher.cache.get(('children', 1, None))[0]
+
+
+def test_write_during_warm_query_is_not_cached(directory, prefetcher):
+    directory.add_directory_item(1, '', '卷一', 'folder')
+    query = directory.directory_manager.get_child_directories
+
+    def racing_query(case_id, parent_id=None):
+        rows = query(case_id, parent_id)
+        directory.add_directory_item(1, '', '卷二', 'folder')
+        return rows
+
+    directory.directory_manager.get_child_directories = racing_query
+    warm(prefetcher, 1)
+    del directory.directory_manager.get_child_directories
+    assert len(prefetcher.get_child_directories(1)) == 2
+
+
+def test_listeners_receive_rows_and_removed_subtree(directory):
+    events = []
+    directory.add_listener(lambda case_id, rows, removed: events.append((case_id, rows, removed)))
+
+    folder = directory.add_directory_item(1, '', '卷一', 'folder')
+    child = directory.add_directory_item(1, '', '笔录', 'folder', parent_id=folder)
+    leaf = directory.add_directory_item(1, '/a.pdf', 'a.pdf', 'pdf', 3, parent_id=child)
+    other = directory.add_directory_item(1, '', '卷二', 'folder')
+    assert [rows[0]['id'] for _, rows, _ in events] == [folder, child, leaf, other]
+    assert events[2][1][0]['page_number'] == 3
+
+    del events[:]
+    assert directory.delete_directory_item(folder)
+    assert events == [(1, [], [folder, child, leaf])]
+
+    del events[:]
+    assert directory.batch_add_directory_items([(2, '/b.pdf', 'b.pdf', 'pdf', 1, None)])
+    assert directory.clear_case_directory(1)
+    assert events == [(2, None, []), (1, None, [])]
+
+
+def test_reader_reads_warmed_page_text_and_render(directory, db_manager, tmp_path, monkeypatch):
+    path = make_pdf(tmp_path / 'a.pdf', ['first', 'second'])
+    item = directory.add_directory_item(1, path, 'a.pdf', 'pdf', 2)
+    page_manager = PageContentManager(db_manager)
+    page_manager.save_pages(path, [(0, 'f0', 'first', None, None), (1, 'f1', 'second', None, None)])
+    reader = CasePrefetcher(directory, page_manager=page_manager, handle_cache=DocumentHandleCache(), pace=0)
+    directory.add_listener(reader.on_directory_change)
+    try:
+        reader._warm_case(1, reader._generation, open_first=True)
+
+        # 命中预取结果时既不渲染也不查询
+        def unexpected(*args):
+            raise AssertionError("should be served from the prefetch cache")
+
+        monkeypatch.setattr(prefetcher_module, 'render_page_image', unexpected)
+        monkeypatch.setattr(page_manager, 'get_page', unexpected)
+        width, height, samples = reader.get_page_image(1, path, 2)
+        assert len(samples) == width * height * 3
+        assert reader.get_page_text(1, path, 1) == 'second'
+        monkeypatch.undo()
+
+        # 未预取的页照常渲染和查询
+        assert reader.get_page_image(1, path, 1)
+        assert reader.get_page_text(1, path, 0) == 'first'
+
+        # 目录修改后该卷宗的页面缓存一并丢弃
+        assert directory.update_directory_item(item, page_number=1)
+        assert not [key for key in reader.cache._entries if key[1] == 1]
+    finally:
+        reader.stop()
+
+
+def test_rewritten_file_misses_warmed_render(directory, tmp_path):
+    path = make_pdf(tmp_path / 'a.pdf', ['old'])
+    directory.add_directory_item(1, path, 'a.pdf', 'pdf', 1)
+    reader = CasePrefetcher(directory, handle_cache=DocumentHandleCache(), pace=0)
+    try:
+        reader._warm_case(1, reader._generation, open_first=True)
+        warmed = reader.get_page_image(1, path, 1)
+        make_pdf(tmp_path / 'new.pdf', ['new text that renders differently'])
+        os.replace(tmp_path / 'new.pdf', path)
+        assert reader.get_page_image(1, path, 1) != warmed
+    finally:
+        reader.stop()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""只读副本路由测试：用假驱动记录每个连接连到了哪台主机"""
+
+import pytest
+from mysql.connector import errors
+
+from database_config import DatabaseConfig, DatabaseManager, DirectoryManager
+from load_test import _SQLiteConnection
+
+
+class FakeConnector:
+    """按 host 返回指向同一个 SQLite 文件的连接，可让指定主机抛出连接错误"""
+
+    def __init__(self, path):
+        self.path = path
+        self.hosts = []
+        self.failures = {}
+
+    def __call__(self, **config):
+        host = config['host']
+        if host in self.failures:
+            raise self.failures[host]
+        self.hosts.append(host)
+        return _SQLiteConnection(self.path)
+
+
+@pytest.fixture
+def routed(db_manager):
+    connector = FakeConnector(db_manager.db_config.path)
+    config = DatabaseConfig(replicas=[{'host': 'r1'}, {'host': 'r2'}], connector=connector,
+                            read_after_write_window=60)
+    return DatabaseManager(config), connector
+
+
+def test_reads_use_replicas_until_session_commits(routed):
+    manager, connector = routed
+    config = manager.db_config
+    config.set_session('alice')
+
+    manager.execute_query("SELECT 1")
+    manager.execute_query("SELECT 1")
+    assert connector.hosts == ['r1', 'r2']
+
+    # 只取连接而没有提交写入，不影响后续查询的路由
+    config.close_connection(config.get_connection())
+    assert not config.recently_wrote()
+
+    manager.execute_update("UPDATE cases SET status = status")
+    assert config.session_recently_wrote('alice')
+    assert not config.session_recently_wrote('bob')
+
+    del connector.hosts[:]
+    manager.execute_query("SELECT 1")
+    config.set_session('bob')
+    manager.execute_query("SELECT 1")
+    assert connector.hosts == ['localhost', 'r1']
+
+
+def test_only_connect_errors_mark_replica_down(routed):
+    manager, connector = routed
+    router = manager.db_config.replica_router
+
+    connector.failures['r1'] = errors.PoolError("pool exhausted")
+    manager.execute_query("SELECT 1")
+    assert router.healthy_count() == 2
+    assert connector.hosts == ['r2']
+
+    connector.failures['r1'] = errors.InterfaceError("Can't connect to MySQL server")
+    manager.execute_query("SELECT 1")
+    manager.execute_query("SELECT 1")
+    assert router.healthy_count() == 1
+    assert 'r1' not in connector.hosts
+
+
+def test_read_then_write_flows_read_from_primary(routed):
+    manager, connector = routed
+    # 关闭读写一致窗口，确认这些查询本身就走主库
+    manager.db_config.read_after_write_window = 0
+    directory_manager = DirectoryManager(manager)
+    parent_id = directory_manager.add_directory_item(1, '', '卷一', 'folder')
+    child_id = directory_manager.add_directory_item(1, '', '笔录', 'folder', parent_id=parent_id)
+    directory_manager.add_directory_item(1, '/a.pdf', 'a.pdf', 'pdf', page_number=2, parent_id=child_id)
+
+    assert directory_manager.remap_page_numbers(1, '/a.pdf', '/b.pdf', {1: 0})
+    assert directory_manager.delete_directory_item(parent_id)
+    assert set(connector.hosts) == {'localhost'}
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""服务模式请求处理测试"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from mysql.connector.errors import PoolError
+
+import service as service_module
+from content_store import ContentStore
+from database_config import ContentManager, DatabaseConfig
+from service import AssistantService, QueryCache
+from service_client import RemotePDFProcessor
+
+
+class FakeCaseManager:
+    def __init__(self):
+        self.calls = 0
+
+    def get_case_by_id(self, case_id):
+        self.calls += 1
+        return {'id': case_id}
+
+    def get_cases_by_user(self, user_id):
+        raise PoolError("Failed getting connection; pool exhausted")
+
+
+def make_service():
+    service = AssistantService(pool_size=2)
+    service.managers['case'] = FakeCaseManager()
+    return service
+
+
+async def send(service, raw: bytes) -> bytes:
+    """启动服务，发送原始请求，返回服务端写回的全部数据（服务端关闭连接为止）"""
+    server = await asyncio.start_server(service.handle_connection, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(raw)
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(), timeout=5)
+        writer.close()
+        return data
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def request(path: str, body: bytes = b'', length: str = None) -> bytes:
+    length = str(len(body)) if length is None else length
+    return (f"POST {path} HTTP/1.1\r\nContent-Length: {length}\r\nConnection: close\r\n\r\n"
+            .encode('ascii') + body)
+
+
+def test_invalid_content_length_returns_400():
+    service = make_service()
+    try:
+        for length in ('abc', '-5'):
+            response = asyncio.run(send(service, request('/rpc/case/get_case_by_id', length=length)))
+            assert response.startswith(b'HTTP/1.1 400 Bad Request')
+        response = asyncio.run(send(service, request('/rpc/case/get_case_by_id', b'not json')))
+        assert response.startswith(b'HTTP/1.1 400 Bad Request')
+    finally:
+        service.shutdown()
+
+
+def test_call_and_pool_exhaustion_status():
+    service = make_service()
+    try:
+        body = json.dumps({'args': [7]}).encode()
+        response = asyncio.run(send(service, request('/rpc/case/get_case_by_id', body)))
+        assert response.startswith(b'HTTP/1.1 200 OK')
+        assert json.loads(response.split(b'\r\n\r\n', 1)[1]) == {'result': {'id': 7}}
+
+        body = json.dumps({'args': [1]}).encode()
+        response = asyncio.run(send(service, request('/rpc/case/get_cases_by_user', body)))
+        assert response.startswith(b'HTTP/1.1 503 Service Unavailable')
+
+        response = asyncio.run(send(service, request('/rpc/extract/unknown_task', b'{}')))
+        assert response.startswith(b'HTTP/1.1 404 Not Found')
+    finally:
+        service.shutdown()
+
+
+def test_client_in_write_window_bypasses_cache():
+    service = make_service()
+    try:
+        service.db_config = DatabaseConfig(replicas=[{'host': 'replica'}], read_after_write_window=60)
+        manager = service.managers['case']
+        assert asyncio.run(service.call('case', 'get_case_by_id', [3], {}, client_id='alice')) == {'id': 3}
+        assert asyncio.run(service.call('case', 'get_case_by_id', [3], {}, client_id='bob')) == {'id': 3}
+        assert manager.calls == 1
+
+        service.db_config.set_session('bob')
+        service.db_config.mark_write()
+        asyncio.run(service.call('case', 'get_case_by_id', [3], {}, client_id='bob'))
+        assert manager.calls == 2
+        asyncio.run(service.call('case', 'get_case_by_id', [3], {}, client_id='alice'))
+        assert manager.calls == 2
+    finally:
+        service.shutdown()
+
+
+def test_query_cache_partitions_and_expiry():
+    cache = QueryCache(ttl=30.0)
+    cache.put('case', ('get_case_by_id', '[1]', '{}'), {'id': 1})
+    assert cache.get('case', ('get_case_by_id', '[1]', '{}')) == (True, {'id': 1})
+    cache.invalidate('case')
+    assert cache.get('case', ('get_case_by_id', '[1]', '{}')) == (False, None)
+
+    expired = QueryCache(ttl=-1.0)
+    expired.put('case', ('k',), 1)
+    assert expired.get('case', ('k',)) == (False, None)
+
+
+def test_non_loopback_bind_requires_token():
+    service = make_service()
+    try:
+        with pytest.raises(ValueError):
+            asyncio.run(service.serve('0.0.0.0', 0))
+    finally:
+        service.shutdown()
+
+
+def test_extraction_runs_once_for_concurrent_requests(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_process_stored(store_root, content_hash):
+        calls.append((store_root, content_hash))
+        time.sleep(0.05)
+        return {'page_count': 3, 'processed_pages': 3}
+
+    monkeypatch.setitem(service_module.EXTRACTION_TASKS, 'process_stored', fake_process_stored)
+    service = make_service()
+    service.store_root = str(tmp_path)
+    service.extraction_executor = ThreadPoolExecutor(max_workers=2)
+
+    async def both():
+        return await asyncio.gather(service.call('extract', 'process_stored', ['abc'], {}),
+                                    service.call('extract', 'process_stored', ['abc'], {}))
+
+    try:
+        assert asyncio.run(both()) == [{'page_count': 3, 'processed_pages': 3}] * 2
+        assert calls == [(str(tmp_path), 'abc')]
+    finally:
+        service.shutdown()
+
+
+def test_upload_is_stored_by_content_hash(db_manager, tmp_path):
+    service = make_service()
+    service.content_store = ContentStore(str(tmp_path / 'store'), ContentManager(db_manager))
+    data = b'%PDF-1.4 uploaded'
+    try:
+        response = asyncio.run(send(service, request('/upload', data)))
+        assert response.startswith(b'HTTP/1.1 200 OK')
+        content_hash, stored_path = json.loads(response.split(b'\r\n\r\n', 1)[1])['result']
+        with open(stored_path, 'rb') as f:
+            assert f.read() == data
+        assert service.content_store.content_manager.get_object(content_hash)['size'] == len(data)
+        assert os.listdir(service.content_store.tmp_dir) == []
+
+        service.token = 'secret'
+        response = asyncio.run(send(service, request('/upload', data)))
+        assert response.startswith(b'HTTP/1.1 403 Forbidden')
+    finally:
+        service.shutdown()
+
+
+class FakeClient:
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    def call(self, manager, method, *args, **kwargs):
+        self.calls.append((manager, method, args, kwargs))
+        return self.result
+
+
+class RecordingDirectory:
+    def __init__(self):
+        self.remaps = []
+
+    def remap_page_numbers(self, *args):
+        self.remaps.append(args)
+        return True
+
+
+def test_remote_revision_remaps_through_local_directory_manager():
+    client = FakeClient({'page_count': 2, 'processed_pages': 1, 'reused_pages': 1,
+                         'page_map': [[0, 0], [1, 1]], 'content_hash': 'new'})
+    directory = RecordingDirectory()
+    result = RemotePDFProcessor(client).process_revision(7, '/old.pdf', '/store/new.pdf', directory,
+                                                         old_key='old', new_key='new')
+    assert client.calls == [('extract', 'process_revision', (7, '/old.pdf', '/store/new.pdf'),
+                             {'old_key': 'old', 'new_key': 'new'})]
+    assert directory.remaps == [(7, '/old.pdf', '/store/new.pdf', {0: 0, 1: 1}, 'new')]
+    assert result['page_map'] == {0: 0, 1: 1} and 'content_hash' not in result
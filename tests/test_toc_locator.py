@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""目录页定位测试"""
+
+import fitz
+
+from database_config import PageContentManager
+from pdf_processor import PDFProcessor
+from toc_locator import TOCLocator, score_toc_page
+
+TOC_TEXT = "目录\n1 起诉书 ........ 1\n2 询问笔录 ........ 5\n3 鉴定意见 ........ 12\n4 判决书 ........ 20"
+CONTINUATION_TEXT = "5 证据清单 ........ 30\n6 质证意见 ........ 41\n7 代理词 ........ 55"
+PROSE_TEXT = "本案系民间借贷纠纷。\n原告诉称被告借款未还。\n被告辩称已经归还部分借款。"
+
+
+def make_doc(texts):
+    doc = fitz.open()
+    for text in texts:
+        page = doc.new_page()
+        page.insert_text((72, 72), text, fontname='china-s', fontsize=11)
+    return doc
+
+
+def test_score_toc_page():
+    assert score_toc_page(TOC_TEXT) >= 0.35
+    assert score_toc_page(CONTINUATION_TEXT) >= 0.2
+    assert score_toc_page(PROSE_TEXT) == 0.0
+
+
+def test_locate_follows_continuation_pages():
+    doc = make_doc([PROSE_TEXT, TOC_TEXT, CONTINUATION_TEXT, PROSE_TEXT])
+    locator = TOCLocator()
+    assert locator.locate(doc) == [1, 2]
+    assert locator.touched_pages == 4
+
+
+def test_locate_uses_supplied_text():
+    doc = make_doc([PROSE_TEXT, TOC_TEXT, CONTINUATION_TEXT, PROSE_TEXT])
+    texts = {0: PROSE_TEXT, 1: TOC_TEXT, 2: CONTINUATION_TEXT}
+    locator = TOCLocator()
+    assert locator.locate(doc, page_text=texts.get) == [1, 2]
+    assert locator.touched_pages == 1  # 只有未提供文本的第4页需要读取文本层
+
+
+def test_process_pages_parses_only_located_pages(db_manager, tmp_path):
+    doc = make_doc([PROSE_TEXT, TOC_TEXT, CONTINUATION_TEXT, PROSE_TEXT])
+    processor = PDFProcessor(PageContentManager(db_manager), thumbnail_dir=str(tmp_path))
+    pages = processor._process_pages(doc, 'doc', range(doc.page_count))
+    assert processor.toc_locator.touched_pages == 0
+    assert [page[3] is not None for page in pages] == [False, True, True, False]
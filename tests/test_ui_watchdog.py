@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""界面卡顿监测测试（用假的 root 代替 Tk 主循环）"""
+
+import json
+import time
+
+from ui_watchdog import WATCHDOG_ENV, UIWatchdog, install_if_enabled
+
+
+class FakeRoot:
+    """只实现 after() 的主循环替身，在测试的主线程中执行回调"""
+
+    def __init__(self):
+        self.pending = []
+
+    def after(self, ms, callback):
+        self.pending.append((time.monotonic() + ms / 1000, callback))
+
+    def run_for(self, seconds):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            now = time.monotonic()
+            due = [item for item in self.pending if item[0] <= now]
+            self.pending = [item for item in self.pending if item[0] > now]
+            for _, callback in due:
+                callback()
+            time.sleep(0.005)
+
+
+def slow_handler():
+    time.sleep(0.4)
+
+
+def test_stall_is_attributed_to_handler(tmp_path):
+    root = FakeRoot()
+    report_path = tmp_path / 'report.json'
+    watchdog = UIWatchdog(root, threshold=0.1, interval=0.02, report_path=str(report_path))
+    watchdog.start()
+    root.run_for(0.1)
+    slow_handler()
+    root.run_for(0.2)
+    watchdog.stop()
+
+    report = json.loads(report_path.read_text(encoding='utf-8'))
+    stalls = [item for item in report['stalls'] if 'slow_handler' in item['handler']]
+    assert len(stalls) == 1
+    assert stalls[0]['count'] == 1
+    assert stalls[0]['max_ms'] >= 200
+
+
+def test_install_is_opt_in(monkeypatch):
+    monkeypatch.delenv(WATCHDOG_ENV, raising=False)
+    assert install_if_enabled(FakeRoot(), argv=['main.py']) is None
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录页定位
+
+目录几乎总是出现在每一卷的前几页。这里只读取页面的原始文本层，
+按行尾页码、引导点和序号前缀的密度给页面打分，找出目录页及其续页，
+只有这些页面才交给完整的目录行解析。
+"""
+
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import fitz  # PyMuPDF
+
+TRAILING_NUMBER = re.compile(r'\d+\s*$')
+LEADER_DOTS = re.compile(r'(\.{3,}|…{2,}|·{3,}|-{3,}|_{3,})')
+SEQUENCE_PREFIX = re.compile(r'^\s*([(（]?\d+[)）.．、]?\s|[(（]\d+[)）]|第[一二三四五六七八九十百\d]+[卷册章节部分])')
+TOC_KEYWORD = re.compile(r'目\s*录|卷\s*内\s*目\s*录')
+
+
+def score_toc_page(text: str) -> float:
+    """按目录特征行的密度给页面打分（0 ~ 1.5）"""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) < 3:
+        return 0.0
+
+    trailing = leaders = prefixes = 0
+    for line in lines:
+        if TRAILING_NUMBER.search(line):
+            trailing += 1
+        if LEADER_DOTS.search(line):
+            leaders += 1
+        if SEQUENCE_PREFIX.match(line):
+            prefixes += 1
+
+    # 行尾页码是最强的特征，引导点和序号前缀作为补充
+    if trailing < 3:
+        return 0.0
+    score = (trailing + 0.5 * leaders + 0.5 * prefixes) / (2 * len(lines))
+    if TOC_KEYWORD.search(text[:200]):
+        score += 0.5
+    return score
+
+
+class TOCLocator:
+    """目录页定位器"""
+
+    def __init__(self, head_pages: int = 15, start_threshold: float = 0.35,
+                 continuation_threshold: float = 0.2, max_continuation: int = 50):
+        self.head_pages = head_pages
+        self.start_threshold = start_threshold
+        self.continuation_threshold = continuation_threshold
+        self.max_continuation = max_continuation
+        self.touched_pages = 0
+
+    def volume_starts(self, doc: fitz.Document) -> List[int]:
+        """各卷起始页：文档首页以及PDF书签中的一级条目"""
+        starts = {0}
+        for level, _title, page_number in doc.get_toc(simple=True):
+            if level == 1 and 1 <= page_number <= doc.page_count:
+                starts.add(page_number - 1)
+        return sorted(starts)
+
+    def locate(self, doc: fitz.Document, volume_starts: Iterable[int] = None,
+               page_text: Callable[[int], Optional[str]] = None) -> List[int]:
+        """返回目录页（含续页）的页序列表
+
+        page_text(页序) 返回调用方已提取的页面文本，返回 None 时才读取该页的文本层。
+        """
+        self.touched_pages = 0
+        scores: Dict[int, float] = {}
+
+        def score(page_index: int) -> float:
+            if page_index not in scores:
+                text = page_text(page_index) if page_text else None
+                if text is None:
+                    text = doc[page_index].get_text('text', flags=0)
+                    self.touched_pages += 1
+                scores[page_index] = score_toc_page(text)
+            return scores[page_index]
+
+        toc_pages: Set[int] = set()
+        for start in (volume_starts if volume_starts is not None else self.volume_starts(doc)):
+            end = min(start + self.head_pages, doc.page_count)
+            for page_index in range(start, end):
+                if page_index in toc_pages or score(page_index) < self.start_threshold:
+                    continue
+                toc_pages.add(page_index)
+                # 跟随续页，直到页面不再像目录
+                next_index = page_index + 1
+                while (next_index < doc.page_count
+                       and next_index - page_index <= self.max_continuation
+                       and score(next_index) >= self.continuation_threshold):
+                    toc_pages.add(next_index)
+                    next_index += 1
+
+        return sorted(toc_pages)
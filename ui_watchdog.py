@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+界面卡顿监测
+
+后台线程通过 root.after 心跳检测 Tk 主循环是否被阻塞；阻塞超过阈值时用
+sys._current_frames() 抓取主线程调用栈，把卡顿归到对应的事件处理函数，
+按处理函数统计卡顿次数和时长，程序退出时写出报告。
+
+默认关闭，通过命令行参数 --watchdog 或环境变量 LEGAL_ASSISTANT_WATCHDOG=1 开启。
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Any, Dict, Optional
+
+WATCHDOG_ENV = 'LEGAL_ASSISTANT_WATCHDOG'
+TKINTER_DIR = os.path.dirname(os.path.abspath(__import__('tkinter').__file__))
+
+
+def _is_tkinter_frame(frame) -> bool:
+    return os.path.abspath(frame.f_code.co_filename).startswith(TKINTER_DIR)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{os.path.basename(code.co_filename)}:{name}"
+
+
+class UIWatchdog:
+    """Tk 主循环卡顿监测器"""
+
+    def __init__(self, root, threshold: float = 0.2, interval: float = 0.05,
+                 report_path: str = 'ui_stall_report.json'):
+        self.root = root
+        self.threshold = threshold
+        self.interval = interval
+        self.report_path = report_path
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        self._main_thread_id = threading.main_thread().ident
+        self._last_beat = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._reported = False
+
+    def start(self):
+        """开始监测"""
+        self._last_beat = time.monotonic()
+        self.root.after(int(self.interval * 1000), self._beat)
+        self._thread = threading.Thread(target=self._watch, name='ui-watchdog', daemon=True)
+        self._thread.start()
+        atexit.register(self.write_report)
+        print(f"界面卡顿监测已开启（阈值 {self.threshold * 1000:.0f} ms）")
+
+    def stop(self):
+        """停止监测并写出报告"""
+        self._stop.set()
+        self.write_report()
+
+    def _beat(self):
+        """主线程心跳"""
+        self._last_beat = time.monotonic()
+        if not self._stop.is_set():
+            try:
+                self.root.after(int(self.interval * 1000), self._beat)
+            except Exception:
+                pass  # 窗口已销毁
+
+    def _watch(self):
+        """监测线程：心跳超时即视为卡顿，期间持续采样主线程调用栈"""
+        stall_start = None
+        handler = None
+        samples: Counter = Counter()
+
+        while not self._stop.wait(self.interval):
+            last_beat = self._last_beat
+            lag = time.monotonic() - last_beat - self.interval
+
+            if lag >= self.threshold:
+                frame = sys._current_frames().get(self._main_thread_id)
+                if frame is None:
+                    continue
+                if stall_start is None:
+                    stall_start = last_beat
+                    handler, stack = self._attribute(frame)
+                    self._record_stack(handler, stack)
+                samples[_frame_name(frame)] += 1
+            elif stall_start is not None:
+                # 心跳恢复，卡顿结束
+                self._record_stall(handler, last_beat - stall_start, samples)
+                stall_start, handler, samples = None, None, Counter()
+
+    def _attribute(self, frame):
+        """找出卡顿所在的事件处理函数：调用栈中 tkinter 回调包装之后的第一个应用帧"""
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        frames.reverse()  # 由外向内
+
+        handler = None
+        seen_tkinter = False
+        for f in frames:
+            if _is_tkinter_frame(f):
+                seen_tkinter = True
+            elif seen_tkinter:
+                handler = _frame_name(f)
+                break
+        if handler is None:
+            handler = _frame_name(frames[-1]) if frames else '<unknown>'
+
+        stack = ''.join(traceback.format_list(traceback.extract_stack(frames[-1]))) if frames else ''
+        return handler, stack
+
+    def _entry(self, handler: str) -> Dict[str, Any]:
+        return self.stats.setdefault(handler, {
+            'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'hotspots': Counter(), 'sample_stack': ''
+        })
+
+    def _record_stack(self, handler: str, stack: str):
+        with self._lock:
+            entry = self._entry(handler)
+            if not entry['sample_stack']:
+                entry['sample_stack'] = stack
+
+    def _record_stall(self, handler: str, duration: float, samples: Counter):
+        with self._lock:
+            entry = self._entry(handler)
+            duration_ms = duration * 1000
+            entry['count'] += 1
+            entry['total_ms'] += duration_ms
+            entry['max_ms'] = max(entry['max_ms'], duration_ms)
+            entry['hotspots'].update(samples)
+
+    def write_report(self):
+        """写出按总卡顿时长排序的报告"""
+        if self._reported:
+            return
+        self._reported = True
+        self._stop.set()
+
+        report = []
+        with self._lock:
+            for handler, entry in sorted(self.stats.items(), key=lambda item: -item[1]['total_ms']):
+                if not entry['count']:
+                    continue
+                report.append({
+                    'handler': handler,
+                    'count': entry['count'],
+                    'total_ms': round(entry['total_ms'], 1),
+                    'avg_ms': round(entry['total_ms'] / entry['count'], 1),
+                    'max_ms': round(entry['max_ms'], 1),
+                    'hotspots': entry['hotspots'].most_common(5),
+                    'sample_stack': entry['sample_stack'],
+                })
+
+        try:
+            with open(self.report_path, 'w', encoding='utf-8') as f:
+                json.dump({'threshold_ms': self.threshold * 1000, 'stalls': report},
+                          f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"写入卡顿报告失败: {e}")
+            return
+
+        print(f"界面卡顿报告已写入 {self.report_path}")
+        for item in report[:10]:
+            print(f"  {item['handler']}: {item['count']} 次, 共 {item['total_ms']} ms, "
+                  f"最长 {item['max_ms']} ms")
+
+
+def install_if_enabled(root, argv=None) -> Optional[UIWatchdog]:
+    """命令行包含 --watchdog 或设置了环境变量时开启监测"""
+    argv = sys.argv if argv is None else argv
+    if '--watchdog' not in argv and os.environ.get(WATCHDOG_ENV, '') in ('', '0'):
+        return None
+    watchdog = UIWatchdog(root)
+    watchdog.start()
+    return watchdog